@@ -0,0 +1,7 @@
+"""Benchmarks, each runnable with ``python3 -m benchmarks.<name>``."""
+
+
+def percentile(samples, fraction):
+    """Return the sample at ``fraction`` of the way through ``samples``."""
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
@@ -0,0 +1,81 @@
+"""Measure sign in throughput against the bcrypt work factor.
+
+Run with:
+python3 -m benchmarks.login_throughput --rounds 8 10 12 --threads 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE}"
+
+from tutorial_app import create_app, db, password_hasher  # noqa: E402
+from tutorial_app.models import User  # noqa: E402
+
+app = create_app()
+
+
+def signin_many(count):
+    client = app.test_client()
+    statuses = []
+    for _ in range(count):
+        response = client.post(
+            "/signin", data={"username": "benchuser", "password": "password"}
+        )
+        statuses.append(response.status_code)
+    return statuses
+
+
+def run(rounds, threads, logins):
+    app.config["BCRYPT_LOG_ROUNDS"] = rounds
+    password_hasher.init_app(app)
+    with app.app_context():
+        db.create_all()
+        User.query.delete()
+        db.session.add(
+            User(
+                username="benchuser",
+                password=password_hasher.generate("password"),
+            )
+        )
+        db.session.commit()
+
+    per_thread = max(logins // threads, 1)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = pool.map(signin_many, [per_thread] * threads)
+        statuses = [status for result in results for status in result]
+    elapsed = time.perf_counter() - started
+    return (
+        len(statuses) / elapsed,
+        statuses.count(302),
+        statuses.count(429),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[8, 10, 12])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=40)
+    args = parser.parse_args()
+
+    app.config["TESTING"] = True
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        pool_size = password_hasher.pool_size
+    print(f"pool size {pool_size}, {args.threads} threads")
+    print(f"{'rounds':>6} {'logins/s':>10} {'ok':>6} {'429':>6}")
+    for rounds in args.rounds:
+        throughput, ok, busy = run(rounds, args.threads, args.logins)
+        print(f"{rounds:>6} {throughput:>10.1f} {ok:>6} {busy:>6}")
+    with app.app_context():
+        password_hasher.shutdown()
+    os.remove(DATABASE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""Measure route latency, throughput and queries per request.
+
+Seeds a throwaway database, then drives each route scenario through the
+Flask test client (in process, counting SQL statements) or through a
+local gunicorn (real sockets and workers). Results can be saved as the
+baseline and later runs compared against it; a run whose queries per
+request went up, or whose latency or throughput moved past the
+tolerance, exits non-zero. Baselines are keyed by mode and volumes and
+hold timings from one machine, so save them where the comparisons run.
+
+Run with:
+python3 -m benchmarks.routes --tutorials 100000 --compare
+python3 -m benchmarks.routes --gunicorn --workers 2 --save-baseline
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE}"
+
+import requests  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+from benchmarks import percentile  # noqa: E402
+from tutorial_app import (  # noqa: E402
+    create_app,
+    db,
+    page_cache,
+    password_hasher,
+    popularity,
+    rendering,
+    search,
+    title_index,
+)
+from tutorial_app.models import (  # noqa: E402
+    Difficulty,
+    Resource,
+    Tutorial,
+    TutorialCategory,
+    User,
+    saved_tutorial_table,
+)
+
+app = create_app()
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+BODY = (
+    "## Overview\n\nFit a *linear* model with $y = wx + b$.\n\n"
+    "```\nmodel.fit(X, y)\n```\n"
+)
+PASSWORD = "password"
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+# SQL statements executed so far in this process
+queries = 0
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, params, context, executemany):
+    global queries
+    queries += 1
+
+
+def seed(tutorials, resources, users, saves, chunk=10000):
+    """Fill the database with the given number of rows of each kind."""
+    categories = list(TutorialCategory)
+    difficulties = list(Difficulty)
+    body_html = rendering.render_markdown(BODY)
+    body_hash = rendering.content_hash(BODY)
+    for start in range(0, tutorials, chunk):
+        ids = range(start + 1, min(start + chunk, tutorials) + 1)
+        db.session.execute(
+            Tutorial.__table__.insert(),
+            [
+                {
+                    "id": i,
+                    "category": categories[i % len(categories)],
+                    "title": f"Tutorial {i}",
+                    "difficulty": difficulties[i % len(difficulties)],
+                    "body": BODY,
+                    "body_html": body_html,
+                    "body_hash": body_hash,
+                    "version": 1,
+                }
+                for i in ids
+            ],
+        )
+        search.index_many(
+            "tutorial", [(i, f"Tutorial {i}", BODY) for i in ids]
+        )
+        db.session.commit()
+    for start in range(0, resources, chunk):
+        ids = range(start + 1, min(start + chunk, resources) + 1)
+        db.session.execute(
+            Resource.__table__.insert(),
+            [
+                {
+                    "id": i,
+                    "category": categories[i % len(categories)],
+                    "title": f"Resource {i}",
+                    "description": "A resource",
+                    "link": f"https://example.com/{i}",
+                    "version": 1,
+                }
+                for i in ids
+            ],
+        )
+        search.index_many(
+            "resource", [(i, f"Resource {i}", "A resource") for i in ids]
+        )
+        db.session.commit()
+    # Everyone shares one hash; user 1 is the one the benchmark signs in as
+    password = password_hasher.generate(PASSWORD)
+    for start in range(0, users, chunk):
+        db.session.execute(
+            User.__table__.insert(),
+            [
+                {"id": i, "username": f"user{i}", "password": password}
+                for i in range(start + 1, min(start + chunk, users) + 1)
+            ],
+        )
+        db.session.commit()
+    pairs = set()
+    while len(pairs) < min(saves, tutorials * max(users - 1, 0)):
+        pairs.add((random.randint(1, tutorials), random.randint(2, users)))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), chunk):
+        db.session.execute(
+            saved_tutorial_table.insert(),
+            [
+                {"tutorial_id": tutorial_id, "user_id": user_id}
+                for tutorial_id, user_id in pairs[start : start + chunk]
+            ],
+        )
+        db.session.commit()
+    popularity.reconcile()
+    title_index.build()
+    db.session.remove()
+
+
+def scenarios(tutorials):
+    """Return ``{name: (signed_in, make_request)}`` for every scenario.
+
+    ``make_request(i)`` returns the ``(method, path, form)`` of the i-th
+    request of the scenario.
+    """
+    saved = iter(random.sample(range(1, tutorials + 1), tutorials))
+    return {
+        "homepage": (False, lambda i: ("GET", "/", None)),
+        "homepage_signed_in": (True, lambda i: ("GET", "/", None)),
+        "resources": (False, lambda i: ("GET", "/resources", None)),
+        "tutorial_details": (
+            False,
+            lambda i: (
+                "GET",
+                f"/tutorials/{random.randint(1, tutorials)}",
+                None,
+            ),
+        ),
+        "signin": (
+            False,
+            lambda i: (
+                "POST",
+                "/signin",
+                {"username": "user1", "password": PASSWORD},
+            ),
+        ),
+        "new_tutorial": (
+            True,
+            lambda i: (
+                "POST",
+                "/new_tutorial",
+                {
+                    "category": "ML",
+                    "title": f"Benchmark {i}",
+                    "difficulty": "BEGINNER",
+                    "body": BODY,
+                },
+            ),
+        ),
+        "save_tutorial": (
+            True,
+            lambda i: ("POST", f"/tutorials/{next(saved)}/save", {}),
+        ),
+    }
+
+
+def summarize(samples, elapsed, failures, query_count=None):
+    return {
+        "requests": len(samples),
+        "failures": failures,
+        "p50_ms": round(percentile(samples, 0.5), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "rps": round(len(samples) / elapsed, 1),
+        "queries": (
+            None if query_count is None else query_count / len(samples)
+        ),
+    }
+
+
+def run_test_client(signed_in, make_request, count, cold):
+    """Drive one scenario in process, one request at a time."""
+    client = app.test_client()
+    if signed_in:
+        client.post(
+            "/signin", data={"username": "user1", "password": PASSWORD}
+        )
+    samples = []
+    failures = 0
+    total_queries = 0
+    started = time.perf_counter()
+    for i in range(count):
+        method, path, form = make_request(i)
+        if cold:
+            with app.app_context():
+                page_cache.clear()
+        before = queries
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        # List pages stream, so they render (and query) as they're read
+        response.get_data()
+        response.close()
+        samples.append((time.perf_counter() - request_started) * 1000)
+        total_queries += queries - before
+        failures += response.status_code >= 400
+    elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed, failures, total_queries)
+
+
+def start_gunicorn(workers, threads):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(
+        os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads)
+    )
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "app:app",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            requests.get(url + "/signin", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn didn't start")
+
+
+def run_gunicorn(url, signed_in, make_request, count, concurrency):
+    """Drive one scenario against gunicorn from ``concurrency`` clients."""
+
+    def client(indexes):
+        session = requests.Session()
+        token = CSRF_TOKEN.search(session.get(url + "/signin").text).group(1)
+        if signed_in:
+            session.post(
+                url + "/signin",
+                data={
+                    "username": "user1",
+                    "password": PASSWORD,
+                    "csrf_token": token,
+                },
+            )
+        results = []
+        for i in indexes:
+            method, path, form = make_request(i)
+            if form is not None:
+                form = dict(form, csrf_token=token)
+            request_started = time.perf_counter()
+            response = session.request(
+                method, url + path, data=form, allow_redirects=False
+            )
+            results.append(
+                (
+                    (time.perf_counter() - request_started) * 1000,
+                    response.status_code >= 400,
+                )
+            )
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = [
+            result
+            for results in pool.map(
+                client,
+                [range(n, count, concurrency) for n in range(concurrency)],
+            )
+            for result in results
+        ]
+    elapsed = time.perf_counter() - started
+    return summarize(
+        [sample for sample, _ in results],
+        elapsed,
+        sum(failed for _, failed in results),
+    )
+
+
+def compare(results, baseline, tolerance, tail_tolerance):
+    """Return a line for every metric that regressed past the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if (
+            result["queries"] is not None
+            and before["queries"] is not None
+            and result["queries"] > before["queries"] + 1e-9
+        ):
+            regressions.append(
+                f"{name}: {result['queries']:.2f} queries per request, "
+                f"was {before['queries']:.2f}"
+            )
+        for metric, allowed in (
+            ("p50_ms", tolerance),
+            ("p99_ms", tail_tolerance),
+        ):
+            if result[metric] > before[metric] * (1 + allowed):
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.2f}, "
+                    f"was {before[metric]:.2f}"
+                )
+        if result["rps"] < before["rps"] / (1 + tolerance):
+            regressions.append(
+                f"{name}: {result['rps']:.1f} requests/s, "
+                f"was {before['rps']:.1f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutorials", type=int, default=10000)
+    parser.add_argument("--resources", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--saves", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed, so runs request the same pages.",
+    )
+    parser.add_argument(
+        "--only", nargs="+", help="Scenarios to run (default: all)."
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Clear the page cache before every request.",
+    )
+    parser.add_argument("--gunicorn", action="store_true")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed p50 and throughput slowdown, as a fraction.",
+    )
+    parser.add_argument(
+        "--tail-tolerance",
+        type=float,
+        default=1.0,
+        help="Allowed p99 slowdown; tails are noisier.",
+    )
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", 4))
+    password_hasher.init_app(app)
+    if not args.gunicorn:
+        app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.tutorials, args.resources, args.users, args.saves)
+        print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+    mode = "gunicorn" if args.gunicorn else "test_client"
+    server = None
+    if args.gunicorn:
+        # Seeded users were hashed at this cost, so the workers match it
+        os.environ["BCRYPT_LOG_ROUNDS"] = str(app.config["BCRYPT_LOG_ROUNDS"])
+        server, url = start_gunicorn(args.workers, args.threads)
+    results = {}
+    try:
+        for name, (signed_in, make_request) in scenarios(
+            args.tutorials
+        ).items():
+            if args.only and name not in args.only:
+                continue
+            if args.gunicorn:
+                results[name] = run_gunicorn(
+                    url,
+                    signed_in,
+                    make_request,
+                    args.requests,
+                    args.concurrency,
+                )
+            else:
+                results[name] = run_test_client(
+                    signed_in, make_request, args.requests, args.cold
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        with app.app_context():
+            password_hasher.shutdown()
+        os.remove(DATABASE)
+
+    print(
+        f"{'scenario':<20} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} "
+        f"{'queries':>8} {'failed':>7}"
+    )
+    for name, result in results.items():
+        queries_text = (
+            "-" if result["queries"] is None else f"{result['queries']:.2f}"
+        )
+        print(
+            f"{name:<20} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['rps']:>9.1f} {queries_text:>8} "
+            f"{result['failures']:>7}"
+        )
+
+    volumes = {
+        "tutorials": args.tutorials,
+        "resources": args.resources,
+        "users": args.users,
+        "saves": args.saves,
+        "cold": args.cold,
+    }
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    key = f"{mode}:" + ",".join(f"{k}={v}" for k, v in volumes.items())
+
+    failed = any(result["failures"] for result in results.values())
+    if args.compare:
+        if key not in stored:
+            sys.exit(f"No baseline for {key} in {args.baseline}")
+        regressions = compare(
+            results, stored[key], args.tolerance, args.tail_tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    if args.save_baseline:
+        stored[key] = results
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
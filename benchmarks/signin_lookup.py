@@ -0,0 +1,75 @@
+"""Measure the signin username lookup with and without its index.
+
+Run with:
+python3 -m benchmarks.signin_lookup --users 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE}"
+
+from benchmarks import percentile  # noqa: E402
+from tutorial_app import create_app, db  # noqa: E402
+from tutorial_app.models import User  # noqa: E402
+
+app = create_app()
+
+
+def seed(count, chunk=10000):
+    # Every user shares one precomputed hash; only the lookup is measured
+    password = "$2b$04$" + "x" * 53
+    for start in range(0, count, chunk):
+        db.session.execute(
+            User.__table__.insert(),
+            [
+                {"username": f"user{i}", "password": password}
+                for i in range(start, min(start + chunk, count))
+            ],
+        )
+    db.session.commit()
+
+
+def time_lookups(users, lookups):
+    samples = []
+    for _ in range(lookups):
+        username = f"user{random.randrange(users)}"
+        started = time.perf_counter()
+        User.query.filter_by(username=username).first()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    return percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--scan-lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.users)
+        print(
+            f"seeded {args.users} users in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+        p50, p99 = time_lookups(args.users, args.lookups)
+        print(f"indexed lookup: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+        db.session.execute("DROP INDEX ix_user_username")
+        db.session.commit()
+        p50, p99 = time_lookups(args.users, args.scan_lookups)
+        print(f"table scan:     p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+    os.remove(DATABASE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Production gunicorn settings.
+
+Every value can be overridden from the environment, e.g. on Heroku:
+heroku config:set WEB_CONCURRENCY=3 GUNICORN_THREADS=8
+
+Keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above GUNICORN_THREADS so every
+request thread in a worker can hold a connection, and keep
+WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the database's
+connection limit.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(
+    os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)
+)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = 100
+accesslog = "-"
+
+
+def on_starting(server):
+    """Fingerprint and pre-compress static files before serving them."""
+    from app import app
+    from tutorial_app import assets
+
+    assets.build(app)
+
+
+def post_fork(server, worker):
+    """Load or build the related and recommendation indexes up front.
+
+    Otherwise the first tutorial page or homepage a new worker serves
+    builds them while the reader waits, again after every recycle.
+    """
+    from app import app
+    from tutorial_app import recommender, related_index
+
+    with app.app_context():
+        related_index.refresh()
+        recommender.refresh()
+
+
+def worker_exit(server, worker):
+    """Write out reading progress still coalescing in the worker."""
+    from app import app
+    from tutorial_app import progress_buffer
+
+    with app.app_context():
+        progress_buffer.flush()
@@ -0,0 +1,60 @@
+"""Add change log
+
+Adds the change_log table behind /api/changes, with an entry for every
+existing tutorial and resource, so a client starting from nothing gets
+the whole catalog.
+
+Revision ID: 8860eacadbc8
+Revises: ec34e293b8be
+Create Date: 2026-10-18 09:18:59.385695
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8860eacadbc8"
+down_revision = "ec34e293b8be"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_log = op.create_table(
+        "change_log",
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("deleted", sa.Boolean(), nullable=False),
+        sa.Column("changed_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("seq"),
+        sqlite_autoincrement=True,
+    )
+    with op.batch_alter_table("change_log", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_change_log_item", ["kind", "item_id"], unique=True
+        )
+
+    for kind in ("tutorial", "resource"):
+        item = sa.table(kind, sa.column("id"), sa.column("updated_at"))
+        op.execute(
+            change_log.insert().from_select(
+                ["kind", "item_id", "deleted", "changed_at"],
+                sa.select(
+                    [
+                        sa.literal(kind),
+                        item.c.id,
+                        sa.false(),
+                        item.c.updated_at,
+                    ]
+                ).order_by(item.c.id),
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("change_log", schema=None) as batch_op:
+        batch_op.drop_index("ix_change_log_item")
+
+    op.drop_table("change_log")
@@ -0,0 +1,233 @@
+"""Bring the schema up to date
+
+Adds everything the models gained while the schema still came from
+``db.create_all()``: tutorial rendering, versioning and save counters,
+resource versioning and link checks, save times and a primary key on
+saved_tutorials, the unique username index and the full-text search
+tables. Existing rows are backfilled before columns become NOT NULL.
+
+Afterwards, fill the derived data with:
+flask rerender-tutorials
+flask reconcile-save-counts
+flask rebuild-search-index
+
+Revision ID: a1278f72f3e5
+Revises: c0da3566ff3e
+Create Date: 2026-10-18 08:57:04.281791
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a1278f72f3e5"
+down_revision = "c0da3566ff3e"
+branch_labels = None
+depends_on = None
+
+
+SEARCH_DDL = {
+    "sqlite": {
+        "create": [
+            "CREATE VIRTUAL TABLE tutorial_search "
+            "USING fts5(title, body, tokenize='porter unicode61')",
+            "CREATE VIRTUAL TABLE resource_search "
+            "USING fts5(title, description, tokenize='porter unicode61')",
+        ],
+        "drop": [
+            "DROP TABLE tutorial_search",
+            "DROP TABLE resource_search",
+        ],
+    },
+    "postgresql": {
+        "create": [
+            "CREATE TABLE tutorial_search (id INTEGER PRIMARY KEY, "
+            "title TEXT, document TSVECTOR NOT NULL)",
+            "CREATE INDEX ix_tutorial_search_document "
+            "ON tutorial_search USING GIN (document)",
+            "CREATE TABLE resource_search (id INTEGER PRIMARY KEY, "
+            "title TEXT, document TSVECTOR NOT NULL)",
+            "CREATE INDEX ix_resource_search_document "
+            "ON resource_search USING GIN (document)",
+        ],
+        "drop": [
+            "DROP TABLE tutorial_search",
+            "DROP TABLE resource_search",
+        ],
+    },
+}
+
+# Keeps the first of any duplicate saves, which the new key would reject
+DEDUPLICATE_SAVES = {
+    "sqlite": (
+        "DELETE FROM saved_tutorials WHERE rowid NOT IN ("
+        "SELECT min(rowid) FROM saved_tutorials "
+        "GROUP BY tutorial_id, user_id)"
+    ),
+    "postgresql": (
+        "DELETE FROM saved_tutorials a USING saved_tutorials b "
+        "WHERE a.ctid > b.ctid AND a.tutorial_id = b.tutorial_id "
+        "AND a.user_id = b.user_id"
+    ),
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    now = sa.func.current_timestamp()
+
+    with op.batch_alter_table("tutorial") as batch_op:
+        batch_op.add_column(sa.Column("body_html", sa.Text(), nullable=True))
+        batch_op.add_column(
+            sa.Column("body_hash", sa.String(length=64), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("updated_at", sa.DateTime(), nullable=True)
+        )
+        batch_op.add_column(sa.Column("version", sa.Integer(), nullable=True))
+        batch_op.add_column(
+            sa.Column(
+                "save_count",
+                sa.Integer(),
+                server_default="0",
+                nullable=False,
+            )
+        )
+        batch_op.add_column(
+            sa.Column(
+                "trending_score",
+                sa.Float(),
+                server_default="0",
+                nullable=False,
+            )
+        )
+    op.execute(
+        sa.table("tutorial", sa.column("updated_at"), sa.column("version"))
+        .update()
+        .values(updated_at=now, version=1)
+    )
+    with op.batch_alter_table("tutorial") as batch_op:
+        batch_op.alter_column(
+            "updated_at", existing_type=sa.DateTime(), nullable=False
+        )
+        batch_op.alter_column(
+            "version", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.create_index(
+            "ix_tutorial_save_count", ["save_count", "id"], unique=False
+        )
+        batch_op.create_index(
+            "ix_tutorial_trending_score",
+            ["trending_score", "id"],
+            unique=False,
+        )
+
+    with op.batch_alter_table("resource") as batch_op:
+        batch_op.add_column(
+            sa.Column("updated_at", sa.DateTime(), nullable=True)
+        )
+        batch_op.add_column(sa.Column("version", sa.Integer(), nullable=True))
+        batch_op.add_column(
+            sa.Column("link_status", sa.Integer(), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("link_latency_ms", sa.Integer(), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("link_checked_at", sa.DateTime(), nullable=True)
+        )
+    op.execute(
+        sa.table("resource", sa.column("updated_at"), sa.column("version"))
+        .update()
+        .values(updated_at=now, version=1)
+    )
+    with op.batch_alter_table("resource") as batch_op:
+        batch_op.alter_column(
+            "updated_at", existing_type=sa.DateTime(), nullable=False
+        )
+        batch_op.alter_column(
+            "version", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.create_index(
+            "ix_resource_link_checked_at", ["link_checked_at"], unique=False
+        )
+
+    op.execute(
+        "DELETE FROM saved_tutorials "
+        "WHERE tutorial_id IS NULL OR user_id IS NULL"
+    )
+    op.execute(DEDUPLICATE_SAVES[dialect])
+    with op.batch_alter_table("saved_tutorials") as batch_op:
+        batch_op.add_column(
+            sa.Column("saved_at", sa.DateTime(), nullable=True)
+        )
+    op.execute(
+        sa.table("saved_tutorials", sa.column("saved_at"))
+        .update()
+        .values(saved_at=now)
+    )
+    with op.batch_alter_table("saved_tutorials") as batch_op:
+        batch_op.alter_column(
+            "tutorial_id", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.alter_column(
+            "user_id", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.alter_column(
+            "saved_at", existing_type=sa.DateTime(), nullable=False
+        )
+        batch_op.create_primary_key(
+            "saved_tutorials_pkey", ["tutorial_id", "user_id"]
+        )
+        batch_op.create_index(
+            "ix_saved_tutorials_user_id",
+            ["user_id", "tutorial_id"],
+            unique=False,
+        )
+
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.create_index("ix_user_username", ["username"], unique=True)
+
+    for statement in SEARCH_DDL.get(dialect, {}).get("create", []):
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in SEARCH_DDL.get(dialect, {}).get("drop", []):
+        op.execute(statement)
+
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.drop_index("ix_user_username")
+
+    with op.batch_alter_table(
+        "saved_tutorials", recreate="always"
+    ) as batch_op:
+        batch_op.drop_index("ix_saved_tutorials_user_id")
+        batch_op.drop_constraint("saved_tutorials_pkey", type_="primary")
+        batch_op.drop_column("saved_at")
+        batch_op.alter_column(
+            "user_id", existing_type=sa.Integer(), nullable=True
+        )
+        batch_op.alter_column(
+            "tutorial_id", existing_type=sa.Integer(), nullable=True
+        )
+
+    with op.batch_alter_table("resource") as batch_op:
+        batch_op.drop_index("ix_resource_link_checked_at")
+        batch_op.drop_column("link_checked_at")
+        batch_op.drop_column("link_latency_ms")
+        batch_op.drop_column("link_status")
+        batch_op.drop_column("version")
+        batch_op.drop_column("updated_at")
+
+    with op.batch_alter_table("tutorial") as batch_op:
+        batch_op.drop_index("ix_tutorial_trending_score")
+        batch_op.drop_index("ix_tutorial_save_count")
+        batch_op.drop_column("trending_score")
+        batch_op.drop_column("save_count")
+        batch_op.drop_column("version")
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("body_hash")
+        batch_op.drop_column("body_html")
@@ -0,0 +1,80 @@
+"""Initial schema
+
+The tables as the app first created them with ``db.create_all()``. A
+database made that way already matches this revision; mark it with
+``flask db stamp c0da3566ff3e`` before running ``flask db upgrade``.
+
+Revision ID: c0da3566ff3e
+Revises:
+Create Date: 2026-10-18 08:56:46.894186
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c0da3566ff3e"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+CATEGORIES = ("ML", "STATS", "DL", "RL", "OTHER")
+DIFFICULTIES = ("BEGINNER", "INTERMEDIATE", "EXPERT")
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=20), nullable=False),
+        sa.Column("password", sa.String(length=160), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "tutorial",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "category",
+            sa.Enum(*CATEGORIES, name="tutorialcategory"),
+            nullable=True,
+        ),
+        sa.Column("title", sa.String(length=40), nullable=False),
+        sa.Column(
+            "difficulty",
+            sa.Enum(*DIFFICULTIES, name="difficulty"),
+            nullable=True,
+        ),
+        sa.Column("body", sa.String(length=10000), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "resource",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "category",
+            sa.Enum(*CATEGORIES, name="tutorialcategory"),
+            nullable=True,
+        ),
+        sa.Column("title", sa.String(length=40), nullable=False),
+        sa.Column("description", sa.String(length=120), nullable=True),
+        sa.Column("link", sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "saved_tutorials",
+        sa.Column("tutorial_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["tutorial_id"], ["tutorial.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+    )
+
+
+def downgrade():
+    op.drop_table("saved_tutorials")
+    op.drop_table("resource")
+    op.drop_table("tutorial")
+    op.drop_table("user")
+    sa.Enum(name="difficulty").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="tutorialcategory").drop(op.get_bind(), checkfirst=True)
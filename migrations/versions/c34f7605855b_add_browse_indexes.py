@@ -0,0 +1,42 @@
+"""Add indexes for browsing by category and difficulty
+
+Revision ID: c34f7605855b
+Revises: a1278f72f3e5
+Create Date: 2026-10-18 09:03:27.771734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c34f7605855b"
+down_revision = "a1278f72f3e5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("resource", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_resource_category", ["category", "id"], unique=False
+        )
+
+    with op.batch_alter_table("tutorial", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_tutorial_category_difficulty",
+            ["category", "difficulty", "id"],
+            unique=False,
+        )
+        batch_op.create_index(
+            "ix_tutorial_difficulty", ["difficulty", "id"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("tutorial", schema=None) as batch_op:
+        batch_op.drop_index("ix_tutorial_difficulty")
+        batch_op.drop_index("ix_tutorial_category_difficulty")
+
+    with op.batch_alter_table("resource", schema=None) as batch_op:
+        batch_op.drop_index("ix_resource_category")
@@ -0,0 +1,60 @@
+"""Keep trending scores as logs
+
+Trending scores become the log of the sum of save weights, which stays
+finite; the sums themselves overflow a float. Stored sums are converted
+in place. One that had already overflowed can't be, so run
+flask reconcile-save-counts
+afterwards if any tutorial's score was infinite.
+
+Revision ID: ce157736a331
+Revises: 8860eacadbc8
+Create Date: 2026-10-18 10:02:11.519204
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "ce157736a331"
+down_revision = "8860eacadbc8"
+branch_labels = None
+depends_on = None
+
+tutorial = sa.table(
+    "tutorial",
+    sa.column("id", sa.Integer),
+    sa.column("save_count", sa.Integer),
+    sa.column("trending_score", sa.Float),
+)
+
+
+def _convert(convert):
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select([tutorial.c.id, tutorial.c.trending_score]).where(
+            tutorial.c.save_count > 0
+        )
+    ).fetchall()
+    update = (
+        tutorial.update()
+        .where(tutorial.c.id == sa.bindparam("tutorial_id"))
+        .values(trending_score=sa.bindparam("score"))
+    )
+    params = [
+        {"tutorial_id": tutorial_id, "score": convert(score)}
+        for tutorial_id, score in rows
+    ]
+    if params:
+        connection.execute(update, params)
+
+
+def upgrade():
+    _convert(lambda score: math.log(score) if score > 0 else 0.0)
+
+
+def downgrade():
+    # Past about 709 the sum doesn't fit a float any more
+    _convert(lambda score: math.exp(min(score, 709.0)))
@@ -0,0 +1,32 @@
+"""Add page tokens
+
+Adds the page_token table holding the page cache's namespace tokens, so
+an invalidation in one worker or command reaches every worker.
+
+Revision ID: e22fdf898ea6
+Revises: ce157736a331
+Create Date: 2026-10-18 09:51:46.331121
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e22fdf898ea6"
+down_revision = "ce157736a331"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "page_token",
+        sa.Column("namespace", sa.String(length=128), nullable=False),
+        sa.Column("token", sa.String(length=64), nullable=False),
+        sa.PrimaryKeyConstraint("namespace"),
+    )
+
+
+def downgrade():
+    op.drop_table("page_token")
@@ -0,0 +1,58 @@
+"""Add reading progress
+
+Adds the tutorial_progress table and the number of sections progress is
+tracked in for each tutorial. Count the sections of existing tutorials
+afterwards with:
+flask rerender-tutorials
+
+Revision ID: ec34e293b8be
+Revises: c34f7605855b
+Create Date: 2026-10-18 09:06:30.981101
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "ec34e293b8be"
+down_revision = "c34f7605855b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tutorial_progress",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tutorial_id", sa.Integer(), nullable=False),
+        sa.Column("sections", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["tutorial_id"], ["tutorial.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("user_id", "tutorial_id"),
+    )
+    with op.batch_alter_table("tutorial_progress", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_tutorial_progress_tutorial_id", ["tutorial_id"], unique=False
+        )
+
+    with op.batch_alter_table("tutorial", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "section_count",
+                sa.Integer(),
+                server_default="1",
+                nullable=False,
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("tutorial", schema=None) as batch_op:
+        batch_op.drop_column("section_count")
+
+    with op.batch_alter_table("tutorial_progress", schema=None) as batch_op:
+        batch_op.drop_index("ix_tutorial_progress_tutorial_id")
+
+    op.drop_table("tutorial_progress")
@@ -1,34 +1,90 @@
 from flask import Flask
 from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from tutorial_app.config import Config
+from flask_migrate import Migrate
+from tutorial_app import assets, compression
+from tutorial_app.auth import sessions
+from tutorial_app.auth.hashing import PasswordHasher
+from tutorial_app.cache import PageCache
+from tutorial_app.config import Config, load_secret_key
+from tutorial_app.fuzzy import TitleIndex
+from tutorial_app.pooling import discard_connections_after_fork
+from tutorial_app.profiling import RequestProfiler
+from tutorial_app.recommendations import Recommender
+from tutorial_app.related import RelatedIndex
+from tutorial_app.replicas import ReplicaRouter, RoutingSQLAlchemy
 import os
 
-app = Flask(__name__)
-app.config.from_object(Config)
-app.secret_key = os.urandom(24)
+MIGRATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "migrations"
+)
 
-
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
+# Extensions are bound to an app by create_app
+db = RoutingSQLAlchemy()
+replica_router = ReplicaRouter()
+migrate = Migrate()
+login_manager = LoginManager()
 login_manager.login_view = "auth.signin"
-bcrypt = Bcrypt(app)
+bcrypt = Bcrypt()
+password_hasher = PasswordHasher()
+title_index = TitleIndex()
+related_index = RelatedIndex()
+recommender = Recommender()
+page_cache = PageCache()
+profiler = RequestProfiler()
+
+from tutorial_app import search
+from tutorial_app.progress import ProgressBuffer
+from tutorial_app.auth.users import UserCache
 
-from tutorial_app.models import User
+progress_buffer = ProgressBuffer()
+user_cache = UserCache()
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return user_cache.get(user_id)
+
+
+def create_app(config=Config):
+    """Build the app from ``config``, a config object or import path.
+
+    Nothing touches the database here: the schema comes from
+    ``flask db upgrade``, and the title and related-tutorial indexes and
+    the recommendations load on first use.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if not app.config.get("SECRET_KEY"):
+        app.config["SECRET_KEY"] = load_secret_key(app.instance_path)
 
+    replica_router.init_app(app)
+    db.init_app(app)
+    discard_connections_after_fork()
+    # Batch mode lets SQLite migrations alter tables by copying them
+    migrate.init_app(app, db, directory=MIGRATIONS, render_as_batch=True)
+    login_manager.init_app(app)
+    user_cache.init_app(app)
+    sessions.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+    bcrypt.init_app(app)
+    password_hasher.init_app(app)
+    page_cache.init_app(app)
+    related_index.init_app(app)
+    recommender.init_app(app)
+    profiler.init_app(app)
+    progress_buffer.init_app(app)
 
-from tutorial_app.auth.routes import auth as auth_routes
-from tutorial_app.main.routes import main as main_routes
+    from tutorial_app.auth.routes import auth as auth_routes
+    from tutorial_app.main.routes import main as main_routes
+    from tutorial_app.api.routes import api as api_routes
 
-app.register_blueprint(main_routes)
-app.register_blueprint(auth_routes)
+    app.register_blueprint(main_routes)
+    app.register_blueprint(auth_routes)
+    app.register_blueprint(api_routes)
 
+    from tutorial_app import commands
 
-with app.app_context():
-    db.create_all()
+    commands.init_app(app)
+    return app
@@ -0,0 +1,126 @@
+"""JSON API routes."""
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    g,
+    jsonify,
+    request,
+    stream_with_context,
+)
+from flask_login import login_required
+from tutorial_app import bulk, changes, title_index
+from tutorial_app.models import Tutorial
+from tutorial_app.replicas import read_only
+from tutorial_app.utils import keyset_page
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+@api.route("/tutorials")
+@read_only
+def tutorials():
+    """Return a keyset-paginated page of tutorial cards."""
+    per_page = current_app.config["TUTORIALS_PER_PAGE"]
+    limit = min(request.args.get("limit", per_page, type=int), per_page)
+    tutorials, next_cursor = keyset_page(
+        Tutorial.card_query(),
+        Tutorial.id,
+        after=request.args.get("after", type=int),
+        limit=max(limit, 1),
+    )
+    return jsonify(
+        tutorials=[
+            {
+                "id": tutorial.id,
+                "title": tutorial.title,
+                "category": tutorial.category.name,
+                "difficulty": tutorial.difficulty.name,
+            }
+            for tutorial in tutorials
+        ],
+        next=next_cursor,
+    )
+
+
+@api.route("/changes")
+@read_only
+def change_feed():
+    """Return the tutorial and resource changes after ``since``."""
+    per_page = current_app.config["CHANGES_PER_PAGE"]
+    limit = min(request.args.get("limit", per_page, type=int), per_page)
+    delay = current_app.config["CHANGES_SETTLE_SECONDS"]
+    if g.get("db_replica") is not None:
+        delay += current_app.config["REPLICA_LAG_SECONDS"]
+    entries, cursor, more = changes.feed(
+        request.args.get("since", 0, type=int), max(limit, 1), delay
+    )
+    return jsonify(changes=entries, since=cursor, more=more)
+
+
+@api.route("/titles/suggest")
+@read_only
+def suggest_titles():
+    """Return tutorial and resource titles close to the query string."""
+    matches = title_index.lookup(request.args.get("q", ""))
+    return jsonify(
+        matches=[
+            {"kind": kind, "id": item_id, "title": title, "score": score}
+            for score, kind, item_id, title in matches
+        ]
+    )
+
+
+# Only non-simple content types are accepted, so a cross-site form post
+# can't trigger an import with the signed-in user's cookie.
+IMPORT_FORMATS = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json": "json",
+    "text/csv": "csv",
+}
+
+
+@api.route("/<any(tutorials, resources):kind>/import", methods=["POST"])
+@login_required
+def import_content(kind):
+    """Bulk-load records streamed in the request body."""
+    fmt = IMPORT_FORMATS.get(request.mimetype)
+    if fmt is None:
+        abort(415)
+    try:
+        inserted, skipped, errors = bulk.import_records(
+            kind, bulk.read_records(request.stream, fmt)
+        )
+    except bulk.MalformedInput as error:
+        # Chunks before the bad input are committed, so say how many
+        response = jsonify(error=str(error), inserted=error.inserted)
+        response.status_code = 400
+        return response
+    return jsonify(
+        inserted=inserted,
+        skipped=skipped,
+        errors=[
+            {"record": number, "errors": record_errors}
+            for number, record_errors in errors.items()
+        ],
+    )
+
+
+@api.route("/<any(tutorials, resources):kind>/export")
+@read_only
+@login_required
+def export_content(kind):
+    """Stream every record of one kind as JSONL, JSON or CSV."""
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in bulk.FORMATS:
+        abort(400, description=f"Unknown format {fmt!r}.")
+    response = Response(
+        stream_with_context(bulk.export_rows(kind, fmt)),
+        mimetype=bulk.MIMETYPES[fmt],
+    )
+    response.headers[
+        "Content-Disposition"
+    ] = f"attachment; filename={bulk.export_filename(kind, fmt)}"
+    return response
@@ -0,0 +1,407 @@
+"""Tests for API routes."""
+import gzip
+import json
+import unittest
+from io import BytesIO
+
+from tutorial_app import (
+    create_app,
+    bcrypt,
+    bulk,
+    db,
+    page_cache,
+    recommender,
+    related_index,
+    search,
+    title_index,
+    user_cache,
+)
+from tutorial_app.config import TestConfig
+from tutorial_app.models import (
+    Resource,
+    Tutorial,
+    TutorialCategory,
+    Difficulty,
+    User,
+)
+
+app = create_app(TestConfig)
+
+"""
+Run these tests with the command:
+python3 -m unittest tutorial_app.api.tests
+"""
+
+#################################################
+# Setup
+#################################################
+
+
+def create_tutorials(count):
+    for i in range(count):
+        db.session.add(
+            Tutorial(
+                category=TutorialCategory.DL,
+                title=f"Tutorial {i}",
+                difficulty=Difficulty.EXPERT,
+                body="Test body",
+            )
+        )
+    db.session.commit()
+
+
+def create_user():
+    password_hash = bcrypt.generate_password_hash("password").decode("utf-8")
+    db.session.add(User(username="testuser", password=password_hash))
+    db.session.commit()
+
+
+def signin(client):
+    return client.post(
+        "/signin",
+        data=dict(username="testuser", password="password"),
+        follow_redirects=True,
+    )
+
+
+#################################################
+# Tests
+#################################################
+
+
+class ApiTests(unittest.TestCase):
+    """Tests for the JSON API."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = app.test_client()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
+
+    def test_tutorials_keyset_pages(self):
+        """Test that tutorials are paged by the `after` cursor."""
+        create_tutorials(3)
+
+        first = self.app.get("/api/tutorials?limit=2").get_json()
+        self.assertEqual([t["id"] for t in first["tutorials"]], [1, 2])
+        self.assertEqual(first["next"], 2)
+        self.assertEqual(first["tutorials"][0]["category"], "DL")
+        self.assertNotIn("body", first["tutorials"][0])
+
+        second = self.app.get("/api/tutorials?limit=2&after=2").get_json()
+        self.assertEqual([t["id"] for t in second["tutorials"]], [3])
+        self.assertIsNone(second["next"])
+
+    def test_suggest_titles(self):
+        """Test that misspelled queries find the closest titles."""
+        create_tutorials(3)
+        title_index.build()
+
+        matches = self.app.get("/api/titles/suggest?q=tutorail 2").get_json()
+        self.assertEqual(matches["matches"][0]["id"], 3)
+        self.assertEqual(matches["matches"][0]["title"], "Tutorial 2")
+
+        matches = self.app.get("/api/titles/suggest?q=").get_json()
+        self.assertEqual(matches["matches"], [])
+
+    def test_change_feed(self):
+        """Test that the change feed pages through writes and deletes."""
+        create_user()
+        signin(self.app)
+        for title in ["Perceptrons", "Transformers"]:
+            self.app.post(
+                "/new_tutorial",
+                data=dict(
+                    category="DL",
+                    title=title,
+                    difficulty="BEGINNER",
+                    body="Test body",
+                ),
+            )
+        self.app.post(
+            "/new_resource",
+            data=dict(
+                category="ML",
+                title="Docs",
+                description="Reference",
+                link="https://example.com",
+            ),
+        )
+        self.app.post(
+            "/tutorials/edit/1",
+            data=dict(
+                category="DL",
+                title="Perceptrons",
+                difficulty="EXPERT",
+                body="New body",
+            ),
+        )
+        self.app.get("/tutorials/delete/2")
+
+        first = self.app.get("/api/changes?since=0&limit=2").get_json()
+        # Tutorial 1's first entry made way for the one from its edit
+        self.assertEqual(
+            [(c["kind"], c["id"]) for c in first["changes"]],
+            [("resource", 1), ("tutorial", 1)],
+        )
+        self.assertTrue(first["more"])
+        self.assertEqual(
+            first["changes"][0]["record"]["link"], "https://example.com"
+        )
+        edited = first["changes"][1]
+        self.assertEqual(edited["version"], 2)
+        self.assertEqual(edited["record"]["difficulty"], "EXPERT")
+        self.assertEqual(edited["record"]["body"], "New body")
+
+        second = self.app.get(
+            f"/api/changes?since={first['since']}"
+        ).get_json()
+        self.assertEqual(
+            second["changes"],
+            [{"seq": 5, "kind": "tutorial", "id": 2, "deleted": True}],
+        )
+        self.assertFalse(second["more"])
+        caught_up = self.app.get(
+            f"/api/changes?since={second['since']}"
+        ).get_json()
+        self.assertEqual(caught_up["changes"], [])
+        self.assertEqual(caught_up["since"], 5)
+
+        bulk.import_records(
+            "tutorials",
+            [
+                (
+                    1,
+                    {
+                        "category": "ML",
+                        "title": "Imported",
+                        "difficulty": "EXPERT",
+                        "body": "Test body",
+                    },
+                )
+            ],
+        )
+        # Entries are held back until earlier transactions must be done
+        app.config["CHANGES_SETTLE_SECONDS"] = 60
+        self.addCleanup(app.config.update, CHANGES_SETTLE_SECONDS=0)
+        held = self.app.get("/api/changes?since=5").get_json()
+        self.assertEqual((held["changes"], held["since"]), ([], 5))
+        app.config["CHANGES_SETTLE_SECONDS"] = 0
+        # SQLite hands the deleted tutorial's id out again, and the new
+        # tutorial's entry replaces the tombstone
+        imported = self.app.get("/api/changes?since=5").get_json()
+        self.assertEqual(
+            [(c["kind"], c["id"]) for c in imported["changes"]],
+            [("tutorial", 2)],
+        )
+        self.assertEqual(imported["changes"][0]["record"]["title"], "Imported")
+
+
+class BulkTests(unittest.TestCase):
+    """Tests for bulk import and export."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = app.test_client()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
+        create_user()
+
+    def test_import_requires_login(self):
+        """Test that anonymous users can't import."""
+        response = self.app.post(
+            "/api/tutorials/import",
+            data="",
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Tutorial.query.count(), 0)
+
+    def test_import_tutorials_jsonl(self):
+        """Test that valid records are inserted, rendered and indexed."""
+        signin(self.app)
+        records = [
+            {
+                "category": "ML",
+                "title": "Gradient Descent",
+                "difficulty": "BEGINNER",
+                "body": "Take *small* steps downhill.",
+            },
+            {"category": "ML", "title": "No body", "difficulty": "EXPERT"},
+            {
+                "category": "NOPE",
+                "title": "Bad category",
+                "difficulty": "EXPERT",
+                "body": "Some body",
+            },
+        ]
+        data = "\n".join(json.dumps(record) for record in records)
+        data += "\n{not json\n"
+
+        response = self.app.post(
+            "/api/tutorials/import",
+            data=data,
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertEqual(result["inserted"], 1)
+        self.assertEqual(result["skipped"], 3)
+        self.assertEqual(
+            [error["record"] for error in result["errors"]], [2, 3, 4]
+        )
+        self.assertIn("body", result["errors"][0]["errors"])
+        self.assertIn("category", result["errors"][1]["errors"])
+
+        tutorial = Tutorial.query.one()
+        self.assertEqual(tutorial.category, TutorialCategory.ML)
+        self.assertEqual(tutorial.version, 1)
+        self.assertEqual(tutorial.save_count, 0)
+        self.assertIn("<em>small</em>", tutorial.body_html)
+        self.assertEqual(search.search("downhill")[0], [("tutorial", 1)])
+        self.assertEqual(title_index.lookup("gradient decent")[0][2], 1)
+
+    def test_import_resources_csv_in_chunks(self):
+        """Test that CSV imports commit every chunk."""
+        rows = ["category,title,description,link"]
+        rows += [
+            f"STATS,Resource {i},About stats,https://example.com/{i}"
+            for i in range(5)
+        ]
+        rows.append("STATS,Bad link,About stats,not a url")
+        with app.app_context():
+            stream = BytesIO("\r\n".join(rows).encode("utf-8"))
+            inserted, skipped, errors = bulk.import_records(
+                "resources", bulk.read_records(stream, "csv"), chunk=2
+            )
+        self.assertEqual(inserted, 5)
+        self.assertEqual(skipped, 1)
+        self.assertEqual(list(errors), [6])
+        self.assertEqual(Resource.query.count(), 5)
+        self.assertEqual(search.search("stats")[1], False)
+
+    def test_import_rejects_simple_content_types(self):
+        """Test that form-encodable bodies are refused."""
+        signin(self.app)
+        response = self.app.post(
+            "/api/tutorials/import", data="{}", content_type="text/plain"
+        )
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_malformed_json_array(self):
+        """Test that an unparseable JSON array is a bad request."""
+        signin(self.app)
+        response = self.app.post(
+            "/api/resources/import",
+            data='[{"title": ',
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["inserted"], 0)
+
+        # Chunks committed before the bad input stay, and are counted
+        record = {
+            "category": "STATS",
+            "title": "Resource",
+            "description": "About stats",
+            "link": "https://example.com",
+        }
+        data = "[" + ",".join([json.dumps(record)] * 3) + ', {"title": '
+        with app.app_context():
+            with self.assertRaises(bulk.MalformedInput) as raised:
+                bulk.import_records(
+                    "resources",
+                    bulk.read_records(BytesIO(data.encode("utf-8")), "json"),
+                    chunk=2,
+                )
+        self.assertEqual(raised.exception.inserted, 2)
+        self.assertEqual(Resource.query.count(), 2)
+
+    def test_import_reports_first_errors(self):
+        """Test that only the first errors are kept, but all are counted."""
+        records = [(number, "Invalid JSON") for number in range(1, 6)]
+        with app.app_context():
+            inserted, skipped, errors = bulk.import_records(
+                "tutorials", records, max_errors=2
+            )
+        self.assertEqual((inserted, skipped), (0, 5))
+        self.assertEqual(list(errors), [1, 2])
+
+    def test_export_round_trip(self):
+        """Test that every export format can be imported again."""
+        create_tutorials(3)
+        signin(self.app)
+
+        for fmt, content_type in (
+            ("jsonl", "application/x-ndjson"),
+            ("json", "application/json"),
+            ("csv", "text/csv"),
+        ):
+            response = self.app.get(f"/api/tutorials/export?format={fmt}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, content_type)
+            self.assertIn(
+                "attachment", response.headers["Content-Disposition"]
+            )
+
+            imported = self.app.post(
+                "/api/tutorials/import",
+                data=response.get_data(),
+                content_type=content_type,
+            ).get_json()
+            self.assertEqual(imported["inserted"], 3, fmt)
+            self.assertEqual(imported["skipped"], 0, fmt)
+            db.session.execute(
+                Tutorial.__table__.delete().where(Tutorial.id > 3)
+            )
+            db.session.commit()
+
+        exported = self.app.get("/api/tutorials/export").get_data(as_text=True)
+        first = json.loads(exported.splitlines()[0])
+        self.assertEqual(
+            first,
+            {
+                "id": 1,
+                "category": "DL",
+                "title": "Tutorial 0",
+                "difficulty": "EXPERT",
+                "body": "Test body",
+            },
+        )
+
+        # The stream is compressed as it's sent when the client takes it
+        response = self.app.get(
+            "/api/tutorials/export", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.content_encoding, "gzip")
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(
+            gzip.decompress(response.get_data()).decode(), exported
+        )
+
+    def test_export_empty(self):
+        """Test exports of an empty table."""
+        signin(self.app)
+        response = self.app.get("/api/resources/export?format=json")
+        self.assertEqual(json.loads(response.get_data()), [])
+        response = self.app.get("/api/resources/export?format=csv")
+        self.assertEqual(
+            response.get_data(as_text=True).strip(),
+            "id,category,title,description,link",
+        )
@@ -0,0 +1,136 @@
+"""Fingerprinted, pre-compressed static files.
+
+``flask build-assets`` (also run by gunicorn as it starts) copies every
+file under ``static/`` to ``ASSETS_BUILD_DIR`` with a hash of its
+content in the name, next to gzip and brotli versions of it, and records
+the names in a manifest. Templates link files with ``asset_url``, and
+those URLs are served with the best encoding the client accepts and as
+cacheable forever: a changed file gets a new name, so a repeat visit
+never downloads static content again.
+
+Without a build, ``asset_url`` falls back to the plain static URL.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+MANIFEST = "manifest.json"
+
+# A compressed copy must be at least this much smaller to be worth it
+MIN_SAVING = 0.1
+
+# In the order they're preferred, when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def build_dir(app):
+    """Return where built assets go: ``ASSETS_BUILD_DIR`` or static/dist."""
+    return app.config.get("ASSETS_BUILD_DIR") or os.path.join(
+        app.static_folder, "dist"
+    )
+
+
+def build(app):
+    """Fingerprint and compress every static file; return the manifest.
+
+    Files already built under the same hash are left alone, so running
+    it again only does the work for files that changed.
+    """
+    # Imported here so that serving never needs the extension
+    import brotli
+
+    source = app.static_folder
+    target = build_dir(app)
+    manifest = {}
+    for root, dirs, files in os.walk(source):
+        dirs[:] = [name for name in dirs if os.path.join(root, name) != target]
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            logical = os.path.relpath(path, source).replace(os.sep, "/")
+            with open(path, "rb") as original:
+                data = original.read()
+            stem, extension = posixpath.splitext(logical)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = f"{stem}.{digest}{extension}"
+            manifest[logical] = hashed
+            if os.path.exists(os.path.join(target, hashed)):
+                continue
+            for suffix, packed in (
+                (".gz", gzip.compress(data, 9, mtime=0)),
+                (".br", brotli.compress(data, quality=11)),
+            ):
+                if len(packed) <= len(data) * (1 - MIN_SAVING):
+                    _write(target, hashed + suffix, packed)
+            # Last, so a file that's there has its compressed copies too
+            _write(target, hashed, data)
+    _write(target, MANIFEST, json.dumps(manifest, indent=2).encode())
+    app.extensions["assets"] = manifest
+    return manifest
+
+
+def _write(directory, name, data):
+    """Write a file whole, so a running server never sees half of it."""
+    path = os.path.join(directory, *name.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = f"{path}.{os.getpid()}.tmp"
+    with open(staging, "wb") as output:
+        output.write(data)
+    os.replace(staging, path)
+
+
+def _manifest():
+    manifest = current_app.extensions.get("assets")
+    if manifest is None:
+        try:
+            path = os.path.join(build_dir(current_app), MANIFEST)
+            with open(path) as saved:
+                manifest = json.load(saved)
+        except FileNotFoundError:
+            manifest = {}
+        current_app.extensions["assets"] = manifest
+    return manifest
+
+
+def asset_url(filename):
+    """Return the URL of a static file, fingerprinted if it's been built."""
+    hashed = _manifest().get(filename)
+    if hashed is None:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=hashed)
+
+
+def serve_asset(filename):
+    """Serve a built file, pre-compressed if the client takes it."""
+    directory = build_dir(current_app)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in ENCODINGS:
+        if encoding in request.accept_encodings and os.path.isfile(
+            safe_join(directory, filename + suffix) or ""
+        ):
+            response = send_from_directory(
+                directory, filename + suffix, mimetype=mimetype
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+    # The name changes with the content, so this copy is good forever
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Serve built assets and give templates ``asset_url``."""
+    app.add_url_rule("/dist/<path:filename>", "asset", serve_asset)
+    app.add_template_global(asset_url)
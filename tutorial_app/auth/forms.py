@@ -1,8 +1,7 @@
 """Auth forms."""
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, PasswordField
-from wtforms.validators import DataRequired, Length, ValidationError
-from tutorial_app.models import User
+from wtforms.validators import DataRequired, Length
 
 
 class SignUpForm(FlaskForm):
@@ -12,13 +11,6 @@ class SignUpForm(FlaskForm):
     password = PasswordField("Password", validators=[DataRequired()])
     submit = SubmitField("Sign Up")
 
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError(
-                "That username is taken. Please choose a different one."
-            )
-
 
 class SignInForm(FlaskForm):
     username = StringField(
@@ -0,0 +1,163 @@
+"""Password hashing off the request thread."""
+import os
+import threading
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+
+from tutorial_app import profiling
+
+
+class HasherBusy(TooManyRequests):
+    """Raised when too many password hashes are already in flight."""
+
+    description = "Too many sign in attempts right now. Please try again."
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check_password(pw_hash, password):
+    return bcrypt.checkpw(password, pw_hash)
+
+
+class PasswordHasher(object):
+    """Run bcrypt in a process pool with a bounded number of jobs.
+
+    ``BCRYPT_LOG_ROUNDS`` sets the work factor, ``BCRYPT_POOL_SIZE`` the
+    number of hashing processes (0 hashes inline, which the tests use) and
+    ``BCRYPT_MAX_PENDING`` how many hashes may be queued or running at
+    once. Past that, callers get ``HasherBusy`` (a 429) straight away
+    instead of piling up behind the pool, and so do callers whose hash
+    isn't done within ``BCRYPT_TIMEOUT`` seconds. A pool broken by a
+    dead hashing process is replaced and the hash tried once more. Each
+    app gets its own settings and pool, in ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        previous = app.extensions.get("password_hasher")
+        if previous is not None:
+            previous.shutdown()
+        app.extensions["password_hasher"] = _Hasher(
+            rounds=app.config.get("BCRYPT_LOG_ROUNDS", 12),
+            pool_size=app.config.get("BCRYPT_POOL_SIZE", 2),
+            timeout=app.config.get("BCRYPT_TIMEOUT", 30),
+            max_pending=app.config.get("BCRYPT_MAX_PENDING", 8),
+        )
+
+    @property
+    def state(self):
+        """The current app's settings, slots and pool."""
+        return current_app.extensions["password_hasher"]
+
+    @property
+    def rounds(self):
+        return self.state.rounds
+
+    @property
+    def pool_size(self):
+        return self.state.pool_size
+
+    def generate(self, password):
+        """Return a bcrypt hash of ``password`` at the configured cost."""
+        state = self.state
+        return state.run(
+            _hash_password, password.encode("utf-8"), state.rounds
+        )
+
+    def check(self, pw_hash, password):
+        """Return whether ``password`` matches ``pw_hash``."""
+        return self.state.run(
+            _check_password, pw_hash.encode("utf-8"), password.encode("utf-8")
+        )
+
+    def needs_rehash(self, pw_hash):
+        """Return whether ``pw_hash`` was made with a different cost."""
+        # bcrypt hashes look like $2b$<cost>$<salt and digest>
+        return int(pw_hash.split("$")[2]) != self.rounds
+
+    def shutdown(self):
+        """Stop the current app's hashing processes, if it started any."""
+        self.state.shutdown()
+
+
+class _Hasher(object):
+    """One app's hashing settings, job slots and process pool."""
+
+    def __init__(self, rounds, pool_size, timeout, max_pending):
+        self.rounds = rounds
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def run(self, func, *args):
+        try:
+            return self._run(func, *args)
+        except BrokenProcessPool:
+            # A hashing process died (killed for memory, say), which
+            # breaks its pool for good; the next try starts a new one
+            return self._run(func, *args)
+
+    def _run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HasherBusy(retry_after=1)
+        if not self.pool_size:
+            try:
+                with profiling.section("bcrypt"):
+                    return func(*args)
+            finally:
+                self.slots.release()
+        try:
+            pool = self._pool()
+            future = pool.submit(func, *args)
+        except BrokenProcessPool:
+            self.slots.release()
+            self._discard(pool)
+            raise
+        except BaseException:
+            self.slots.release()
+            raise
+        # A job we gave up waiting for still runs, so it keeps its slot
+        future.add_done_callback(lambda _: self.slots.release())
+        with profiling.section("bcrypt"):
+            try:
+                return future.result(self.timeout)
+            except futures.TimeoutError:
+                raise HasherBusy(retry_after=1)
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+
+    def _pool(self):
+        # Started on first use so that gunicorn's --preload master never
+        # owns the pool; a forked worker starts its own.
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.pool_size)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard(self, pool):
+        # Another thread may already have replaced the broken pool
+        with self._executor_lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False)
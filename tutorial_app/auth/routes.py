@@ -8,10 +8,11 @@ from flask import (
     request,
 )
 from flask_login import login_required, current_user, logout_user, login_user
+from sqlalchemy.exc import IntegrityError
 from tutorial_app.auth.forms import SignInForm, SignUpForm
 from tutorial_app.models import User
 
-from tutorial_app import app, db, bcrypt
+from tutorial_app import db, password_hasher
 
 
 auth = Blueprint("auth", __name__)
@@ -25,9 +26,11 @@ def signin():
         user = User.query.filter_by(username=form.username.data).first()
         if not user:
             flash("No user with that username. Please try again.")
-        if user and bcrypt.check_password_hash(
-            user.password, form.password.data
-        ):
+        if user and password_hasher.check(user.password, form.password.data):
+            # Upgrade hashes made under an older work factor
+            if password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.generate(form.password.data)
+                db.session.commit()
             login_user(user, remember=True)
             next_page = request.args.get("next")
             return redirect(
@@ -41,12 +44,19 @@ def signup():
     """Sign up new user."""
     form = SignUpForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(
-            form.password.data
-        ).decode("utf-8")
+        hashed_password = password_hasher.generate(form.password.data)
         user = User(username=form.username.data, password=hashed_password)
         db.session.add(user)
-        db.session.commit()
+        # The unique index on username decides whether the name is free, so
+        # concurrent signups for the same name can't both succeed
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            form.username.errors.append(
+                "That username is taken. Please choose a different one."
+            )
+            return render_template("signup.html", form=form)
         flash("Account Created.")
         print("created")
         return redirect(url_for("auth.signin"))
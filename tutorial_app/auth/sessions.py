@@ -0,0 +1,114 @@
+"""Server-side sessions in a shared cache backend.
+
+With ``SESSION_BACKEND`` naming a callable that takes the app and
+returns a cachelib backend, session data lives in that backend and the
+cookie carries only a random session id. The data then never travels
+with each request, and every worker sees the same sessions. Without it
+Flask's signed cookie sessions are used.
+
+The id is replaced whenever someone signs in or out, so an id known
+before sign-in is worthless afterwards.
+"""
+import secrets
+import time
+
+from flask import session
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in, user_logged_out
+from werkzeug.datastructures import CallbackDict
+from werkzeug.utils import import_string
+
+from tutorial_app.cache import LRUBackend
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept server-side under ``sid``."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Set when the id changes; the data under it must be dropped
+        self.old_sid = None
+
+    def regenerate(self):
+        """Move the session to a fresh id."""
+        if self.old_sid is None:
+            self.old_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class CacheSessionInterface(SessionInterface):
+    """Keep sessions in a cachelib backend, keyed by a random id."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            entry = self.backend.get(self._key(sid))
+            # The in-process backend ignores timeouts, so check here
+            if entry is not None and entry[0] > time.time():
+                return ServerSession(entry[1], sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.old_sid is not None:
+            self.backend.delete(self._key(session.old_sid))
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(self._key(session.sid))
+                response.delete_cookie(
+                    app.session_cookie_name, domain=domain, path=path
+                )
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        self.backend.set(
+            self._key(session.sid),
+            (time.time() + lifetime, dict(session)),
+            timeout=int(lifetime),
+        )
+        response.set_cookie(
+            app.session_cookie_name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    @staticmethod
+    def _key(sid):
+        return f"session:{sid}"
+
+
+def memory_backend(app):
+    """Return a backend private to this process, for one worker or tests."""
+    return LRUBackend()
+
+
+def _regenerate(sender, **extra):
+    if isinstance(session._get_current_object(), ServerSession):
+        session.regenerate()
+
+
+def init_app(app):
+    """Use server-side sessions if ``SESSION_BACKEND`` is set."""
+    factory = app.config.get("SESSION_BACKEND")
+    if not factory:
+        return
+    app.session_interface = CacheSessionInterface(import_string(factory)(app))
+    user_logged_in.connect(_regenerate, app)
+    user_logged_out.connect(_regenerate, app)
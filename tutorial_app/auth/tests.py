@@ -3,9 +3,32 @@
 import os
 import unittest
 
-from tutorial_app import app, db, bcrypt
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from tutorial_app import (
+    create_app,
+    db,
+    bcrypt,
+    page_cache,
+    password_hasher,
+    recommender,
+    related_index,
+    user_cache,
+)
+from tutorial_app.auth.hashing import HasherBusy
+from tutorial_app.config import TestConfig
 from tutorial_app.models import User, Tutorial, Resource
 
+app = create_app(TestConfig)
+
+
+class SessionTestConfig(TestConfig):
+    SESSION_BACKEND = "tutorial_app.auth.sessions.memory_backend"
+
+
+session_app = create_app(SessionTestConfig)
+session_store = session_app.session_interface.backend
+
 """
 Run these tests with the command:
 python3 -m unittest tutorial_app.auth.tests
@@ -33,13 +56,16 @@ class AuthTests(unittest.TestCase):
 
     def setUp(self):
         """Executed prior to each test."""
-        app.config["TESTING"] = True
-        app.config["WTF_CSRF_ENABLED"] = False
-        app.config["DEBUG"] = False
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
         self.app = app.test_client()
         db.drop_all()
         db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
 
     def test_signup(self):
         """Test signup."""
@@ -70,6 +96,15 @@ class AuthTests(unittest.TestCase):
             response_text,
         )
 
+    def test_username_unique(self):
+        """Test that the database itself rejects a duplicate username."""
+        create_user()
+
+        db.session.add(User(username="testuser", password="x"))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
     def test_signin_correct_password(self):
         """Test logging in with the correct password."""
         post_data = {
@@ -115,3 +150,164 @@ class AuthTests(unittest.TestCase):
         response_text = response.get_data(as_text=True)
         self.assertIn("Sign In", response_text)
         self.assertNotIn("Sign Out", response_text)
+
+    def test_signin_rehashes_old_cost(self):
+        """Test that a hash made with an old work factor is upgraded."""
+        password_hash = bcrypt.generate_password_hash("password", 4)
+        user = User(username="testuser", password=password_hash.decode())
+        db.session.add(user)
+        db.session.commit()
+
+        post_data = {
+            "username": "testuser",
+            "password": "password",
+        }
+        response = self.app.post("/signin", data=post_data)
+        self.assertEqual(response.status_code, 302)
+
+        user = User.query.filter_by(username="testuser").one()
+        self.assertFalse(password_hasher.needs_rehash(user.password))
+        self.assertTrue(bcrypt.check_password_hash(user.password, "password"))
+
+    def test_apps_keep_their_own_settings(self):
+        """Test that creating another app leaves this one's settings."""
+
+        class OtherConfig(TestConfig):
+            BCRYPT_POOL_SIZE = 1
+
+        other = create_app(OtherConfig)
+        backend = page_cache.backend
+        self.assertEqual(password_hasher.pool_size, 0)
+        with other.app_context():
+            self.assertEqual(password_hasher.pool_size, 1)
+            self.assertIsNot(page_cache.backend, backend)
+
+    def test_hasher_timeout(self):
+        """Test that a hash past its timeout is busy yet keeps its slot."""
+        settings = {
+            "BCRYPT_POOL_SIZE": 1,
+            "BCRYPT_TIMEOUT": 0,
+            "BCRYPT_MAX_PENDING": 1,
+        }
+        self.addCleanup(
+            app.config.update, {name: app.config[name] for name in settings}
+        )
+        self.addCleanup(password_hasher.init_app, app)
+        app.config.update(settings)
+        password_hasher.init_app(app)
+
+        with self.assertRaises(HasherBusy):
+            password_hasher.generate("password")
+        # The job still runs in the pool, so its slot is only freed after
+        slots = password_hasher.state.slots
+        self.assertFalse(slots.acquire(blocking=False))
+        self.assertTrue(slots.acquire(timeout=30))
+        slots.release()
+
+    def test_hasher_recovers_from_a_dead_process(self):
+        """Test that a killed hashing process doesn't break hashing."""
+        settings = {"BCRYPT_POOL_SIZE": 1, "BCRYPT_MAX_PENDING": 2}
+        self.addCleanup(
+            app.config.update, {name: app.config[name] for name in settings}
+        )
+        self.addCleanup(password_hasher.init_app, app)
+        app.config.update(settings)
+        password_hasher.init_app(app)
+
+        pw_hash = password_hasher.generate("password")
+        pool = password_hasher.state._pool()
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+        self.assertTrue(password_hasher.check(pw_hash, "password"))
+        self.assertIsNot(password_hasher.state._pool(), pool)
+
+    def test_signin_busy_hasher(self):
+        """Test that signin answers 429 while the hashing queue is full."""
+        create_user()
+        app.config["BCRYPT_MAX_PENDING"] = 1
+        password_hasher.init_app(app)
+        self.addCleanup(password_hasher.init_app, app)
+        self.addCleanup(app.config.__setitem__, "BCRYPT_MAX_PENDING", 8)
+        password_hasher.state.slots.acquire()
+
+        post_data = {
+            "username": "testuser",
+            "password": "password",
+        }
+        response = self.app.post("/signin", data=post_data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        password_hasher.state.slots.release()
+        response = self.app.post("/signin", data=post_data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_user_loader_is_cached(self):
+        """Test that signed in requests skip the user lookup."""
+        create_user()
+        self.app.post(
+            "/signin", data={"username": "testuser", "password": "password"}
+        )
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        self.addCleanup(
+            event.remove, db.engine, "before_cursor_execute", listener
+        )
+
+        for _ in range(3):
+            response = self.app.get("/saved")
+            self.assertEqual(response.status_code, 200)
+        user_lookups = [s for s in statements if "FROM user" in s]
+        self.assertEqual(len(user_lookups), 1)
+
+        # Changing the user drops them from the cache
+        user = User.query.filter_by(username="testuser").one()
+        user.username = "renamed"
+        db.session.commit()
+        self.assertEqual(user_cache.get(user.id).username, "renamed")
+        self.assertIsNone(user_cache.get(user.id + 1))
+
+
+class ServerSessionTests(unittest.TestCase):
+    """Tests for sessions kept in a shared backend."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = session_app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = session_app.test_client()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        session_store.clear()
+
+    def session_id(self):
+        cookie = self.app.cookie_jar._cookies["localhost.local"]["/"]
+        return cookie["session"].value
+
+    def test_session_kept_server_side(self):
+        """Test that the cookie holds an id and sign in replaces it."""
+        create_user()
+        self.app.post("/signin", data={"username": "nobody", "password": "x"})
+        before = self.session_id()
+        self.assertIsNotNone(session_store.get(f"session:{before}"))
+
+        self.app.post(
+            "/signin", data={"username": "testuser", "password": "password"}
+        )
+        after = self.session_id()
+        self.assertNotEqual(after, before)
+        self.assertIsNone(session_store.get(f"session:{before}"))
+        _, data = session_store.get(f"session:{after}")
+        self.assertEqual(data["_user_id"], "1")
+        self.assertEqual(self.app.get("/saved").status_code, 200)
+
+        self.app.get("/signout")
+        self.assertIsNone(session_store.get(f"session:{after}"))
+        self.assertEqual(self.app.get("/saved").status_code, 302)
@@ -0,0 +1,118 @@
+"""Signed-in users without a database lookup per request.
+
+Flask-Login asks for the user on every authenticated request. The few
+fields a request needs are kept in a small per-process cache for
+``USER_CACHE_SECONDS``, behind which ``USER_CACHE_BACKEND`` may name a
+shared cachelib backend (Redis, memcached) so a user looked up by one
+worker is found by the others. Only a miss in both reads the database.
+
+Committing a change to a user drops them from this process's cache and
+the shared one. Other workers' own caches hold the old fields for at
+most ``USER_CACHE_SECONDS``.
+"""
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+from tutorial_app import db
+from tutorial_app.cache import LRUBackend
+from tutorial_app.models import User
+
+
+class CachedUser(UserMixin):
+    """The fields of a ``User`` that requests use, free of any session."""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    # Only reads self.id, so the model's query works as is
+    has_saved = User.has_saved
+
+
+# One app's cache settings and backends
+_Caches = namedtuple("_Caches", "ttl local shared")
+
+
+class UserCache(object):
+    """TTL-bounded cache of signed-in users, in front of the database.
+
+    Each app gets its own caches, in ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        factory = app.config.get("USER_CACHE_BACKEND")
+        app.extensions["user_cache"] = _Caches(
+            ttl=app.config.get("USER_CACHE_SECONDS", 60),
+            local=LRUBackend(app.config.get("USER_CACHE_SIZE", 10000)),
+            shared=import_string(factory)(app) if factory else None,
+        )
+        if not event.contains(Session, "after_flush", _note_changed_users):
+            event.listen(Session, "after_flush", _note_changed_users)
+            event.listen(Session, "after_rollback", _forget_changed_users)
+        if not event.contains(Session, "after_commit", self._after_commit):
+            event.listen(Session, "after_commit", self._after_commit)
+
+    def get(self, user_id):
+        """Return the user with ``user_id``, or None if there isn't one."""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        caches = current_app.extensions["user_cache"]
+        key = f"user:{user_id}"
+        entry = caches.local.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return CachedUser(*entry[1])
+        fields = caches.shared.get(key) if caches.shared is not None else None
+        if fields is None:
+            row = (
+                db.session.query(User.id, User.username)
+                .filter(User.id == user_id)
+                .first()
+            )
+            if row is None:
+                return None
+            fields = tuple(row)
+            if caches.shared is not None:
+                caches.shared.set(key, fields, timeout=caches.ttl)
+        caches.local.set(key, (time.monotonic() + caches.ttl, fields))
+        return CachedUser(*fields)
+
+    def invalidate(self, *user_ids):
+        """Drop users from this process's cache and the shared one."""
+        caches = current_app.extensions["user_cache"]
+        for user_id in user_ids:
+            key = f"user:{user_id}"
+            caches.local.delete(key)
+            if caches.shared is not None:
+                caches.shared.delete(key)
+
+    def clear(self):
+        current_app.extensions["user_cache"].local.clear()
+
+    def _after_commit(self, session):
+        changed = session.info.pop("changed_users", ())
+        # Sessions outside any app (scripts, migrations) have no cache
+        if changed and has_app_context():
+            self.invalidate(*changed)
+
+
+def _note_changed_users(session, flush_context):
+    changed = session.info.setdefault("changed_users", set())
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User):
+            changed.add(instance.id)
+
+
+def _forget_changed_users(session):
+    session.info.pop("changed_users", None)
@@ -0,0 +1,252 @@
+"""Streaming bulk import and export of tutorials and resources.
+
+Imports read JSON Lines, a JSON array or CSV one record at a time, check
+each record against the same form the site uses to add that kind of
+row, and insert the valid ones with one executemany and one commit per
+chunk, so memory use stays flat however large the file is. Invalid
+records are skipped and counted, and the first ``MAX_REPORTED_ERRORS``
+of them reported by their position in the file.
+
+Exports walk the table with a server-side cursor where the database has
+one and are yielded a chunk of rows at a time, ready to stream.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+import ijson
+import jsonlines
+from werkzeug.datastructures import MultiDict
+
+from tutorial_app import (
+    changes,
+    db,
+    page_cache,
+    related_index,
+    rendering,
+    search,
+    title_index,
+)
+from tutorial_app.main.forms import ResourceForm, TutorialForm
+from tutorial_app.models import Resource, Tutorial
+from tutorial_app.utils import FormEnum
+
+FORMATS = ("jsonl", "json", "csv")
+
+MIMETYPES = {
+    "jsonl": "application/x-ndjson",
+    "json": "application/json",
+    "csv": "text/csv",
+}
+
+# kind: (model, form, search kind, field holding the searchable text)
+KINDS = {
+    "tutorials": (Tutorial, TutorialForm, "tutorial", "body"),
+    "resources": (Resource, ResourceForm, "resource", "description"),
+}
+
+# Form fields that make up a record, in export column order
+FIELDS = {
+    "tutorials": ["category", "title", "difficulty", "body"],
+    "resources": ["category", "title", "description", "link"],
+}
+
+# Cached pages that list each kind
+NAMESPACES = {
+    "tutorials": ("tutorials", "popular"),
+    "resources": ("resources",),
+}
+
+# Most record errors an import keeps; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class MalformedInput(ValueError):
+    """Raised when an import stream can't be parsed any further.
+
+    ``inserted`` is how many records earlier chunks had committed by
+    then; those stay in.
+    """
+
+    inserted = 0
+
+
+def read_records(stream, fmt):
+    """Yield ``(number, record)`` for each record in a binary stream.
+
+    ``record`` is a dict, or an error message when that record couldn't
+    be parsed but the rest of the stream still can be.
+    """
+    if fmt == "jsonl":
+        reader = jsonlines.Reader(stream)
+        number = 0
+        while True:
+            number += 1
+            try:
+                yield number, reader.read()
+            except EOFError:
+                return
+            except jsonlines.InvalidLineError as error:
+                yield number, f"Invalid JSON: {error}"
+    elif fmt == "json":
+        try:
+            for number, record in enumerate(
+                ijson.items(stream, "item"), start=1
+            ):
+                yield number, record
+        except ijson.JSONError as error:
+            raise MalformedInput(f"Invalid JSON: {error}") from error
+    elif fmt == "csv":
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        try:
+            for number, record in enumerate(csv.DictReader(text), start=1):
+                yield number, record
+        except (csv.Error, UnicodeDecodeError) as error:
+            raise MalformedInput(f"Invalid CSV: {error}") from error
+        finally:
+            text.detach()
+    else:
+        raise ValueError(f"Unknown format {fmt!r}")
+
+
+def _validate(kind, record):
+    """Return ``(row, errors)`` for a record checked by the kind's form."""
+    if not isinstance(record, dict):
+        return None, {"record": ["Expected an object."]}
+    formdata = MultiDict(
+        (key, value if isinstance(value, str) else str(value))
+        for key, value in record.items()
+        if value is not None
+    )
+    form = KINDS[kind][1](formdata=formdata, meta={"csrf": False})
+    if not form.validate():
+        return None, form.errors
+    row = {name: form[name].data for name in FIELDS[kind]}
+    row["version"] = 1
+    return row, None
+
+
+def _insert_chunk(kind, rows):
+    """Insert validated rows and index them, all in one transaction."""
+    model, _, search_kind, content = KINDS[kind]
+    table = model.__table__
+    if kind == "tutorials":
+        for row in rows:
+            row["body_html"] = rendering.render_markdown(row["body"])
+            row["section_count"] = rendering.count_sections(row["body_html"])
+            row["body_hash"] = rendering.content_hash(row["body"])
+    start = db.session.execute(
+        db.select([db.func.coalesce(db.func.max(table.c.id), 0)])
+    ).scalar()
+    db.session.execute(table.insert(), rows)
+    # executemany can't hand back the new keys, but they all sort after
+    # the old maximum. Rows another writer added meanwhile get indexed
+    # again, which is harmless.
+    inserted = db.session.execute(
+        db.select([table.c.id, table.c.title, table.c[content]])
+        .where(table.c.id > start)
+        .order_by(table.c.id)
+    ).fetchall()
+    search.index_many(search_kind, inserted)
+    changes.record(search_kind, *(item_id for item_id, _, _ in inserted))
+    db.session.commit()
+    # These indexes live in this process's memory: workers see the new
+    # titles once they restart, and related lists after rebuild-related
+    for item_id, title, _ in inserted:
+        title_index.add(search_kind, item_id, title)
+    if kind == "tutorials":
+        related = related_index.add_many(inserted)
+        page_cache.invalidate(*(f"tutorial:{other}" for other in related))
+
+
+def import_records(kind, records, chunk=500, max_errors=MAX_REPORTED_ERRORS):
+    """Validate and insert ``(number, record)`` pairs of one kind.
+
+    Commits after every ``chunk`` valid records and returns
+    ``(inserted, skipped, errors)``, where ``errors`` maps the numbers of
+    the first ``max_errors`` skipped records to their field errors.
+    Input that can't be parsed past some point raises ``MalformedInput``
+    with the count of records already committed; valid records since
+    the last commit are dropped.
+    """
+    inserted = 0
+    skipped = 0
+    errors = {}
+    rows = []
+    try:
+        for number, record in records:
+            if isinstance(record, str):
+                row, row_errors = None, {"record": [record]}
+            else:
+                row, row_errors = _validate(kind, record)
+            if row_errors:
+                skipped += 1
+                if len(errors) < max_errors:
+                    errors[number] = row_errors
+                continue
+            rows.append(row)
+            if len(rows) >= chunk:
+                _insert_chunk(kind, rows)
+                inserted += len(rows)
+                rows = []
+        if rows:
+            _insert_chunk(kind, rows)
+            inserted += len(rows)
+    except MalformedInput as error:
+        error.inserted = inserted
+        raise
+    finally:
+        if inserted:
+            page_cache.invalidate(*NAMESPACES[kind])
+    return inserted, skipped, errors
+
+
+def export_rows(kind, fmt, chunk=500):
+    """Yield an export of every row of ``kind`` in id order, in pieces.
+
+    Rows are fetched ``chunk`` at a time and each piece holds one chunk.
+    """
+    model, _, _, _ = KINDS[kind]
+    names = ["id"] + FIELDS[kind]
+    table = model.__table__
+    result = db.session.execute(
+        db.select([table.c[name] for name in names])
+        .order_by(table.c.id)
+        .execution_options(stream_results=True)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(names)
+    elif fmt == "json":
+        buffer.write("[")
+    separator = ""
+    while True:
+        rows = result.fetchmany(chunk)
+        for row in rows:
+            values = [
+                value.name if isinstance(value, FormEnum) else value
+                for value in row
+            ]
+            if fmt == "csv":
+                writer.writerow(values)
+            elif fmt == "json":
+                buffer.write(separator + json.dumps(dict(zip(names, values))))
+                separator = ","
+            else:
+                buffer.write(json.dumps(dict(zip(names, values))) + "\n")
+        if not rows:
+            break
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if fmt == "json":
+        buffer.write("]\n")
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_filename(kind, fmt):
+    """Return the download name for an export of ``kind``."""
+    return f"{kind}-{datetime.utcnow():%Y%m%d}.{fmt}"
@@ -0,0 +1,259 @@
+"""Rendered-page cache for anonymous views."""
+import functools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import text
+from werkzeug.utils import import_string
+
+# Both SQLite and Postgres take these
+TOKEN_INSERT_SQL = (
+    "INSERT INTO page_token (namespace, token) VALUES (:namespace, :token) "
+    "ON CONFLICT (namespace) DO NOTHING"
+)
+TOKEN_UPSERT_SQL = (
+    "INSERT INTO page_token (namespace, token) VALUES (:namespace, :token) "
+    "ON CONFLICT (namespace) DO UPDATE SET token = excluded.token"
+)
+
+
+class LRUBackend(object):
+    """Bounded in-process cache backend.
+
+    Speaks the ``get``/``set``/``delete``/``clear`` subset of the cachelib
+    cache API, so a shared cachelib backend (Redis, memcached) can be
+    dropped in when several workers need to see the same entries.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+
+class PageCache(object):
+    """Cache rendered pages for anonymous users, grouped by namespace.
+
+    Each cached view names the namespaces its page depends on, such as
+    ``"tutorials"`` or ``"tutorial:{tutorial_id}"``. Every namespace has a
+    generation token that is part of the cache key, so invalidating a
+    namespace is a single write no matter how many pages it covers, and
+    the stale entries simply age out of the backend.
+
+    Tokens live in the ``page_token`` table, so an invalidation by any
+    worker or ``flask`` command reaches every worker; a cached page costs
+    one primary-key read of its tokens. ``PAGE_CACHE_BACKEND`` may name a
+    callable that takes the app and returns a backend for the pages; the
+    default is an ``LRUBackend`` holding ``PAGE_CACHE_SIZE`` pages, which
+    is private to each worker process. Each app gets its own backend, in
+    ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        factory = app.config.get("PAGE_CACHE_BACKEND")
+        if factory:
+            backend = import_string(factory)(app)
+        else:
+            backend = LRUBackend(app.config.get("PAGE_CACHE_SIZE", 1024))
+        app.extensions["page_cache"] = backend
+
+    @property
+    def backend(self):
+        """The current app's backend."""
+        return current_app.extensions["page_cache"]
+
+    def cached(self, *namespaces):
+        """Cache a view's response, keyed by path and namespace tokens.
+
+        Namespaces are formatted with the view's keyword arguments.
+        """
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if not self._cacheable():
+                    return view(**kwargs)
+                tokens = self._tokens(
+                    [namespace.format(**kwargs) for namespace in namespaces]
+                )
+                key = self._key(tokens)
+                cached = self.backend.get(key)
+                if cached is not None:
+                    body, headers = cached
+                    response = make_response(body)
+                    response.headers.extend(headers)
+                    return response.make_conditional(request)
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and self._settled(tokens):
+                    headers = [
+                        (name, value)
+                        for name, value in response.headers
+                        if name in ("ETag", "Last-Modified", "Vary")
+                    ]
+                    if response.is_streamed:
+                        response.response = self._store_when_sent(
+                            self.backend,
+                            key,
+                            response.response,
+                            response.charset,
+                            headers,
+                        )
+                    else:
+                        self.backend.set(key, (response.get_data(), headers))
+                return response
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _store_when_sent(backend, key, chunks, charset, headers):
+        """Pass a streamed body through, caching it once all of it is sent.
+
+        A stream cut short (the client went away) isn't cached.
+        """
+        body = []
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(charset)
+                body.append(chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        backend.set(key, (b"".join(body), headers))
+
+    def memoize(self, name, namespaces, compute):
+        """Return ``compute()``, cached until any of ``namespaces`` changes.
+
+        Unlike pages, values are cached for signed in visitors too, so
+        ``compute`` must not depend on who is asking.
+        """
+        tokens = self._tokens(namespaces)
+        key = "value:{}:{}".format(":".join(tokens), name)
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            if self._settled(tokens):
+                self.backend.set(key, value)
+        return value
+
+    def invalidate(self, *namespaces):
+        """Drop every cached page that depends on any of ``namespaces``.
+
+        The new tokens are committed straight away, so call this once the
+        write that prompted it is committed.
+        """
+        from tutorial_app import db
+
+        if not namespaces:
+            return
+        db.session.execute(
+            text(TOKEN_UPSERT_SQL),
+            [
+                {"namespace": namespace, "token": self._new_token()}
+                for namespace in namespaces
+            ],
+        )
+        db.session.commit()
+
+    def clear(self):
+        self.backend.clear()
+
+    def _cacheable(self):
+        return (
+            request.method == "GET"
+            and not current_user.is_authenticated
+            and "_flashes" not in session
+        )
+
+    @staticmethod
+    def _settled(tokens):
+        """Return whether a page rendered now can be cached.
+
+        A page read from a replica soon after one of its namespaces
+        changed may predate the change, and caching it would keep it
+        stale until the next change.
+        """
+        if g.get("db_replica") is None:
+            return True
+        settled = time.time() - current_app.config["REPLICA_LAG_SECONDS"]
+        return all(
+            float(token.rpartition("-")[0] or 0) <= settled for token in tokens
+        )
+
+    def _key(self, tokens):
+        return "page:{}:{}".format(":".join(tokens), request.full_path)
+
+    def _tokens(self, namespaces):
+        """Return the current token of each of ``namespaces``, in order.
+
+        Tokens are read from the primary, even in a replica request, so a
+        page is always looked up under the latest ones; ``_settled`` then
+        keeps a replica's possibly older page out of the cache.
+        """
+        from tutorial_app import db
+        from tutorial_app.models import page_token_table
+
+        table = page_token_table
+        query = db.select([table.c.namespace, table.c.token])
+        found = dict(
+            db.engine.execute(
+                query.where(table.c.namespace.in_(namespaces))
+            ).fetchall()
+        )
+        missing = [name for name in namespaces if name not in found]
+        if missing:
+            # A namespace without a token starts a fresh one: pages cached
+            # under an earlier one must not come back
+            db.engine.execute(
+                text(TOKEN_INSERT_SQL),
+                [
+                    {"namespace": namespace, "token": self._new_token()}
+                    for namespace in missing
+                ],
+            )
+            found.update(
+                db.engine.execute(
+                    query.where(table.c.namespace.in_(missing))
+                ).fetchall()
+            )
+        return [found[namespace] for namespace in namespaces]
+
+    @staticmethod
+    def _new_token():
+        # Tokens start with when they were made, for _settled
+        return "{:.3f}-{}".format(time.time(), uuid.uuid4().hex)
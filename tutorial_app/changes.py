@@ -0,0 +1,133 @@
+"""Change feed for keeping copies of the catalog in sync.
+
+Every write to a tutorial or resource logs an entry in ``change_log``,
+in the same transaction, under a sequence number that only grows. Each
+item keeps only its latest entry, so a client that last saw number
+``since`` catches up by reading the entries after it: the item as it is
+now or, for a deleted item, a tombstone. That's one entry per item
+changed since, however large the catalog is.
+
+Numbers are handed out when a transaction writes but show up when it
+commits, which can be in a different order. So the feed holds back
+entries younger than ``CHANGES_SETTLE_SECONDS``, and on a replica the
+replica lag as well; otherwise a client could move past a number that
+only appears afterwards.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from tutorial_app import db
+from tutorial_app.models import Change, Resource, Tutorial
+from tutorial_app.utils import FormEnum
+
+# kind: (model, fields of the record sent for it, as in an export)
+KINDS = {
+    "tutorial": (Tutorial, ["category", "title", "difficulty", "body"]),
+    "resource": (Resource, ["category", "title", "description", "link"]),
+}
+
+# An item written again moves its one entry to a new number. Postgres
+# takes it from the column's sequence; SQLite has one writer at a time,
+# so one past the largest number is as good.
+NEXT_SEQ = {
+    "postgresql": "nextval(pg_get_serial_sequence('change_log', 'seq'))",
+    "sqlite": "(SELECT max(seq) + 1 FROM change_log)",
+}
+
+UPSERT_SQL = (
+    "INSERT INTO change_log (kind, item_id, deleted, changed_at) "
+    "VALUES (:kind, :item_id, :deleted, :changed_at) "
+    "ON CONFLICT (kind, item_id) DO UPDATE SET "
+    "seq = {next_seq}, "
+    "deleted = excluded.deleted, "
+    "changed_at = excluded.changed_at"
+)
+
+
+def record(kind, *item_ids, deleted=False):
+    """Log writes to items of ``kind``, in the caller's transaction.
+
+    Each item's entry is upserted in one statement, so two transactions
+    writing the same item don't race on its unique index.
+    """
+    if not item_ids:
+        return
+    dialect = db.session.get_bind().dialect.name
+    changed_at = datetime.utcnow()
+    db.session.execute(
+        text(UPSERT_SQL.format(next_seq=NEXT_SEQ[dialect])),
+        [
+            {
+                "kind": kind,
+                "item_id": item_id,
+                "deleted": deleted,
+                "changed_at": changed_at,
+            }
+            for item_id in item_ids
+        ],
+    )
+
+
+def _records(changes):
+    """Load the current row of every item not deleted, by (kind, id)."""
+    rows = {}
+    for kind, (model, fields) in KINDS.items():
+        ids = [
+            change.item_id
+            for change in changes
+            if change.kind == kind and not change.deleted
+        ]
+        if not ids:
+            continue
+        columns = [model.id, model.version, model.updated_at] + [
+            getattr(model, field) for field in fields
+        ]
+        for row in db.session.query(*columns).filter(model.id.in_(ids)):
+            rows[kind, row.id] = row
+    return rows
+
+
+def feed(since, limit, delay):
+    """Return the entries after ``since``, at most ``limit`` of them.
+
+    Returns ``(entries, cursor, more)``: ``cursor`` is the number to ask
+    for next time and ``more`` whether there are entries after it
+    already. Entries younger than ``delay`` seconds are held back.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=delay)
+    changes = []
+    for change in (
+        Change.query.filter(Change.seq > since)
+        .order_by(Change.seq)
+        .limit(limit + 1)
+    ):
+        if change.changed_at > cutoff:
+            break
+        changes.append(change)
+    more = len(changes) > limit
+    changes = changes[:limit]
+    rows = _records(changes)
+    entries = []
+    for change in changes:
+        entry = {"seq": change.seq, "kind": change.kind, "id": change.item_id}
+        row = rows.get((change.kind, change.item_id))
+        if row is None:
+            entry["deleted"] = True
+        else:
+            entry.update(
+                deleted=False,
+                version=row.version,
+                updated_at=row.updated_at.isoformat(),
+                record={
+                    field: _value(getattr(row, field))
+                    for field in KINDS[change.kind][1]
+                },
+            )
+        entries.append(entry)
+    cursor = changes[-1].seq if changes else since
+    return entries, cursor, more
+
+
+def _value(value):
+    return value.name if isinstance(value, FormEnum) else value
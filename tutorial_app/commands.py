@@ -0,0 +1,147 @@
+"""Flask CLI commands."""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from tutorial_app import (
+    assets,
+    bulk,
+    page_cache,
+    popularity,
+    recommender,
+    related_index,
+    rendering,
+    search,
+)
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index():
+    """Re-index all tutorials and resources for full-text search."""
+    search.rebuild()
+    click.echo("Search index rebuilt.")
+
+
+@click.command("reconcile-save-counts")
+@with_appcontext
+def reconcile_save_counts():
+    """Rebuild every tutorial's save counters from saved_tutorials."""
+    saved = popularity.reconcile()
+    click.echo(f"Save counters rebuilt; {saved} tutorials have saves.")
+
+
+@click.command("rerender-tutorials")
+@with_appcontext
+def rerender_tutorials():
+    """Re-render tutorial bodies whose stored HTML is out of date."""
+    rendered = rendering.rerender_all()
+    click.echo(f"Re-rendered {rendered} tutorials.")
+
+
+@click.command("rebuild-related")
+@with_appcontext
+@click.option("--output", help="Where to save it, if not RELATED_INDEX_PATH.")
+def rebuild_related(output):
+    """Recompute every tutorial's related tutorials and save the index."""
+    if not (output or related_index.path):
+        raise click.ClickException("Set RELATED_INDEX_PATH or --output.")
+    related_index.build()
+    related_index.save(output)
+    if output is None:
+        # Workers reload the file on their next lookup
+        page_cache.invalidate("related")
+    click.echo(f"Related tutorials found for {len(related_index)} tutorials.")
+
+
+@click.command("compute-recommendations")
+@with_appcontext
+@click.option(
+    "--output", help="Where to save it, if not RECOMMENDATIONS_PATH."
+)
+def compute_recommendations(output):
+    """Recompute "saved this also saved" from every save and store it."""
+    if not (output or recommender.path):
+        raise click.ClickException("Set RECOMMENDATIONS_PATH or --output.")
+    recommender.build()
+    recommender.save(output)
+    click.echo(f"Recommendations computed for {len(recommender)} tutorials.")
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets():
+    """Fingerprint and pre-compress the static files."""
+    manifest = assets.build(current_app)
+    click.echo(f"Built {len(manifest)} static files.")
+
+
+@click.command("check-links")
+@with_appcontext
+@click.option("--batch", default=100, help="Resources checked per commit.")
+def check_links(batch):
+    """Check every resource link that is due for a check."""
+    # Imported here so that only this command pays for the HTTP client
+    from tutorial_app import linkcheck
+
+    checked = 0
+    while True:
+        count = linkcheck.check_links(batch_size=batch)
+        if not count:
+            break
+        checked += count
+    click.echo(f"Checked {checked} resource links.")
+
+
+@click.command("import-content")
+@with_appcontext
+@click.argument("kind", type=click.Choice(list(bulk.KINDS)))
+@click.argument("source", type=click.File("rb"))
+@click.option(
+    "--format", "fmt", type=click.Choice(bulk.FORMATS), default="jsonl"
+)
+@click.option("--chunk", default=500, help="Records per commit.")
+def import_content(kind, source, fmt, chunk):
+    """Bulk-load tutorials or resources from a JSONL, JSON or CSV file."""
+    try:
+        inserted, skipped, errors = bulk.import_records(
+            kind, bulk.read_records(source, fmt), chunk=chunk
+        )
+    except bulk.MalformedInput as error:
+        raise click.ClickException(
+            f"Imported {error.inserted} {kind}, then stopped. {error}"
+        )
+    for number, record_errors in errors.items():
+        click.echo(f"Record {number}: {record_errors}", err=True)
+    if skipped > len(errors):
+        click.echo(f"... and {skipped - len(errors)} more.", err=True)
+    click.echo(f"Imported {inserted} {kind}; skipped {skipped}.")
+
+
+@click.command("export-content")
+@with_appcontext
+@click.argument("kind", type=click.Choice(list(bulk.KINDS)))
+@click.argument("target", type=click.File("w"), default="-")
+@click.option(
+    "--format", "fmt", type=click.Choice(bulk.FORMATS), default="jsonl"
+)
+def export_content(kind, target, fmt):
+    """Write every tutorial or resource to a JSONL, JSON or CSV file."""
+    for piece in bulk.export_rows(kind, fmt):
+        target.write(piece)
+
+
+def init_app(app):
+    """Register every command on ``app``."""
+    for command in (
+        rebuild_search_index,
+        reconcile_save_counts,
+        rerender_tutorials,
+        rebuild_related,
+        compute_recommendations,
+        build_assets,
+        check_links,
+        import_content,
+        export_content,
+    ):
+        app.cli.add_command(command)
@@ -0,0 +1,123 @@
+"""Negotiated gzip and brotli compression of responses.
+
+Text responses are compressed on the way out with the best encoding the
+client accepts: brotli when the extension is installed, else gzip.
+Streamed responses are compressed a chunk at a time and each chunk is
+flushed through, so a streamed page still reaches the browser as it's
+rendered rather than when it's done.
+
+A compressed copy's bytes differ from the uncompressed one's, so its
+ETag is made weak; revalidation compares weakly, so either copy matches.
+"""
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Smaller bodies aren't worth the CPU or the header
+MIN_SIZE = 500
+
+GZIP_LEVEL = 6
+
+# Well below brotli's maximum of 11, which is too slow for every request
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE = {
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+
+
+def _compressible(response):
+    return response.mimetype.startswith("text/") or (
+        response.mimetype in COMPRESSIBLE
+    )
+
+
+def _encoding():
+    """Return the encoding to send, preferring brotli, or None."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def _compressor(encoding):
+    """Return ``(compress, flush, finish)`` functions for ``encoding``."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    # 16 more window bits asks zlib for a gzip header and trailer
+    compressor = zlib.compressobj(
+        GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16
+    )
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def _compress_stream(chunks, charset, encoding):
+    """Yield ``chunks`` compressed, flushing after each one.
+
+    Streams here come a few kilobytes a chunk (rendered pages, export
+    batches), so flushing each costs little in size.
+    """
+    compress, flush, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    """Compress ``response`` if the client and its content allow it."""
+    if not current_app.config["COMPRESS_RESPONSES"] or not _compressible(
+        response
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        request.method == "HEAD"
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    encoding = _encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(
+            response.response, response.charset, encoding
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        compress, _, finish = _compressor(encoding)
+        response.set_data(compress(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Compress every response the app sends."""
+    app.after_request(compress_response)
@@ -1,13 +1,131 @@
 """Initialize Config class to access environment variables."""
 from dotenv import load_dotenv
 import os
+import secrets
 
 load_dotenv()
 
 
+def engine_options(uri):
+    """Return SQLAlchemy engine options for ``uri`` from the environment.
+
+    SQLite gets its pool from Flask-SQLAlchemy, so only pre-ping applies to
+    it; the sizing and timeout settings are for server databases.
+    """
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower()
+        == "true"
+    }
+    if not uri or uri.startswith("sqlite"):
+        return options
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 10)),
+    )
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout and uri.startswith("postgres"):
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={statement_timeout}"
+        }
+    return options
+
+
+def load_secret_key(instance_path):
+    """Return the secret key kept in the instance folder, making it once.
+
+    Used when ``SECRET_KEY`` isn't set, so sessions survive restarts and
+    every worker on the machine signs with the same key. Set
+    ``SECRET_KEY`` wherever the filesystem isn't shared or kept, such as
+    on Heroku.
+    """
+    path = os.path.join(instance_path, "secret_key")
+    if not os.path.exists(path):
+        os.makedirs(instance_path, exist_ok=True)
+        # Written aside and linked into place, so a worker racing us
+        # either wins or reads the finished file
+        staging = f"{path}.{os.getpid()}"
+        with open(staging, "w") as f:
+            f.write(secrets.token_hex(32))
+        os.chmod(staging, 0o600)
+        try:
+            os.link(staging, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(staging)
+    with open(path) as f:
+        return f.read().strip()
+
+
 class Config(object):
     """Set environment variables."""
 
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_REPLICA_URIS = [
+        uri
+        for uri in os.getenv("SQLALCHEMY_REPLICA_URIS", "").split(",")
+        if uri.strip()
+    ]
+    REPLICA_LAG_SECONDS = float(os.getenv("REPLICA_LAG_SECONDS", 5))
     SECRET_KEY = os.getenv("SECRET_KEY")
+    TUTORIALS_PER_PAGE = int(os.getenv("TUTORIALS_PER_PAGE", 20))
+    PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", 1024))
+    PAGE_CACHE_BACKEND = os.getenv("PAGE_CACHE_BACKEND")
+    TRENDING_HALF_LIFE_DAYS = float(os.getenv("TRENDING_HALF_LIFE_DAYS", 7))
+    BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", 2))
+    BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 8))
+    BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", 30))
+    LINK_CHECK_CONCURRENCY = int(os.getenv("LINK_CHECK_CONCURRENCY", 20))
+    LINK_CHECK_PER_HOST = int(os.getenv("LINK_CHECK_PER_HOST", 2))
+    LINK_CHECK_TIMEOUT = float(os.getenv("LINK_CHECK_TIMEOUT", 10))
+    LINK_CHECK_MAX_AGE_HOURS = float(os.getenv("LINK_CHECK_MAX_AGE_HOURS", 24))
+    PROFILING = os.getenv("PROFILING", "false") == "true"
+    PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+    PROFILING_SLOW_SECONDS = float(os.getenv("PROFILING_SLOW_SECONDS", 1))
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+    RELATED_COUNT = int(os.getenv("RELATED_COUNT", 5))
+    RELATED_INDEX_PATH = os.getenv("RELATED_INDEX_PATH", "related.npz")
+    RECOMMENDATION_NEIGHBOURS = int(os.getenv("RECOMMENDATION_NEIGHBOURS", 20))
+    RECOMMENDATIONS_SHOWN = int(os.getenv("RECOMMENDATIONS_SHOWN", 4))
+    RECOMMENDATIONS_PATH = os.getenv(
+        "RECOMMENDATIONS_PATH", "recommendations.npz"
+    )
+    CHANGES_PER_PAGE = int(os.getenv("CHANGES_PER_PAGE", 500))
+    CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", 2))
+    ASSETS_BUILD_DIR = os.getenv("ASSETS_BUILD_DIR")
+    COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true") == "true"
+    STREAM_TEMPLATES = os.getenv("STREAM_TEMPLATES", "true") == "true"
+    HIDE_BROKEN_LINKS = os.getenv("HIDE_BROKEN_LINKS", "false") == "true"
+    PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", 5))
+    PROGRESS_MAX_PENDING = int(os.getenv("PROGRESS_MAX_PENDING", 1000))
+    USER_CACHE_SECONDS = float(os.getenv("USER_CACHE_SECONDS", 60))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND")
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND")
+
+
+class TestConfig(Config):
+    """Settings for the test suite.
+
+    Each test process gets its own in-memory database, so test modules
+    can run in parallel processes without sharing any state.
+    """
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SECRET_KEY = "testing"
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 5
+    BCRYPT_POOL_SIZE = 0
+    PROGRESS_FLUSH_SECONDS = None
+    RELATED_INDEX_PATH = None
+    RECOMMENDATIONS_PATH = None
+    CHANGES_SETTLE_SECONDS = 0
+    # The test client leaves bodies it isn't asked for unread
+    STREAM_TEMPLATES = False
@@ -0,0 +1,75 @@
+"""Facet counts for browsing tutorials and resources.
+
+Counting every category and difficulty takes one GROUP BY, which reads
+only the ``(category, difficulty, id)`` index. The result is a handful
+of rows, and it's kept in the page cache under the same namespace as
+the listings, so the count runs again only after a tutorial or resource
+is added, edited or removed.
+"""
+from flask import current_app
+
+from tutorial_app import db, page_cache
+from tutorial_app.models import (
+    Difficulty,
+    Resource,
+    Tutorial,
+    TutorialCategory,
+)
+
+
+def _tutorial_cells():
+    return [
+        (category.name, difficulty.name, count)
+        for category, difficulty, count in db.session.query(
+            Tutorial.category, Tutorial.difficulty, db.func.count()
+        )
+        .filter(Tutorial.category.isnot(None))
+        .filter(Tutorial.difficulty.isnot(None))
+        .group_by(Tutorial.category, Tutorial.difficulty)
+    ]
+
+
+def _resource_cells():
+    query = db.session.query(Resource.category, db.func.count())
+    if current_app.config["HIDE_BROKEN_LINKS"]:
+        query = query.filter(Resource.link_ok())
+    return [
+        (category.name, count)
+        for category, count in query.filter(
+            Resource.category.isnot(None)
+        ).group_by(Resource.category)
+    ]
+
+
+def tutorial_facets(category=None, difficulty=None):
+    """Return ``(categories, difficulties)`` to browse tutorials by.
+
+    Each is a list of ``(member, count)`` for every member of the enum.
+    Category counts are within the chosen difficulty and the other way
+    round, so a count is how many tutorials choosing it would show.
+    """
+    cells = page_cache.memoize(
+        "facets:tutorials", ("tutorials",), _tutorial_cells
+    )
+    categories = dict.fromkeys(TutorialCategory, 0)
+    difficulties = dict.fromkeys(Difficulty, 0)
+    for category_name, difficulty_name, count in cells:
+        cell_category = TutorialCategory[category_name]
+        cell_difficulty = Difficulty[difficulty_name]
+        if difficulty in (None, cell_difficulty):
+            categories[cell_category] += count
+        if category in (None, cell_category):
+            difficulties[cell_difficulty] += count
+    return list(categories.items()), list(difficulties.items())
+
+
+def resource_facets():
+    """Return ``(member, count)`` for every category of resource."""
+    hidden = current_app.config["HIDE_BROKEN_LINKS"]
+    cells = page_cache.memoize(
+        f"facets:resources:{hidden:d}", ("resources",), _resource_cells
+    )
+    categories = dict.fromkeys(TutorialCategory, 0)
+    for category_name, count in cells:
+        categories[TutorialCategory[category_name]] += count
+    return list(categories.items())
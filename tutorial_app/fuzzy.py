@@ -0,0 +1,126 @@
+"""In-memory trigram index for typo-tolerant title lookup."""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from operator import itemgetter
+
+from fuzzywuzzy import fuzz
+
+
+def trigrams(text):
+    """Return the set of padded word trigrams in ``text``."""
+    grams = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex(object):
+    """Trigram inverted index over tutorial and resource titles.
+
+    Lookups first shortlist the titles sharing at least ``min_overlap`` of
+    the query's trigrams, then run Levenshtein scoring on the shortlist
+    only. Candidates are drawn from the rarest query trigrams alone (any
+    title sharing enough trigrams must contain one of them), so common
+    trigrams never have their posting lists walked. Entries are keyed by
+    ``(kind, id)``.
+
+    The index lives in process memory, so every worker builds its own copy
+    on its first lookup and only sees the writes it handles itself until
+    the next restart or ``build()``.
+    """
+
+    def __init__(self, shortlist=50, min_overlap=0.5):
+        self.shortlist = shortlist
+        self.min_overlap = min_overlap
+        self._titles = {}
+        self._postings = {}
+        self._built = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def build(self):
+        """Load every tutorial and resource title from the database."""
+        from tutorial_app.models import Tutorial, Resource
+        from tutorial_app import db
+
+        with self._lock:
+            self._titles = {}
+            self._postings = {}
+            for kind, model in (
+                ("tutorial", Tutorial),
+                ("resource", Resource),
+            ):
+                for item_id, title in db.session.query(model.id, model.title):
+                    self._add((kind, item_id), title)
+            self._built = True
+
+    def add(self, kind, item_id, title):
+        """Index a title, replacing any previous title for the same item."""
+        with self._lock:
+            # Before the first build the database is the only copy
+            if not self._built:
+                return
+            self._remove((kind, item_id))
+            self._add((kind, item_id), title)
+
+    def remove(self, kind, item_id):
+        """Drop an item from the index."""
+        with self._lock:
+            self._remove((kind, item_id))
+
+    def lookup(self, query, limit=5, min_score=60):
+        """Return up to ``limit`` ``(score, kind, id, title)`` matches."""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        if not self._built:
+            self.build()
+        required = max(1, math.ceil(len(grams) * self.min_overlap))
+        with self._lock:
+            postings = sorted(
+                (self._postings.get(gram, ()) for gram in grams), key=len
+            )
+            rare = postings[: len(postings) - required + 1]
+            common = postings[len(rare) :]
+            overlap = Counter()
+            for keys in rare:
+                overlap.update(keys)
+            for keys in common:
+                overlap.update(overlap.keys() & keys)
+            best = heapq.nlargest(
+                self.shortlist, overlap.items(), key=itemgetter(1)
+            )
+            titles = [
+                (key, self._titles[key])
+                for key, count in best
+                if count >= required
+            ]
+        query = query.lower()
+        scored = []
+        for (kind, item_id), title in titles:
+            score = fuzz.ratio(query, title.lower())
+            if score >= min_score:
+                scored.append((score, kind, item_id, title))
+        return heapq.nlargest(limit, scored, key=itemgetter(0))
+
+    def _add(self, key, title):
+        self._titles[key] = title
+        for gram in trigrams(title):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def _remove(self, key):
+        title = self._titles.pop(key, None)
+        if title is None:
+            return
+        for gram in trigrams(title):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
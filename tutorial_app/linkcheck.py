@@ -0,0 +1,158 @@
+"""Background health checks for resource links.
+
+Resources are only an external link, so the useful thing to know about
+one is whether that link still answers. ``check_links`` takes the
+resources checked longest ago, probes their links concurrently and
+stores the status code, latency and check time on each row. The
+resources page reads those columns and never touches the network.
+
+Probes are scheduled with asyncio under a global limit and a per-host
+limit, so a batch full of links to one site doesn't hammer it. Each
+probe runs on a worker thread through one pooled ``requests`` session,
+which keeps connections to the same host alive across the batch.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam
+
+from tutorial_app import db, page_cache
+from tutorial_app.models import Resource
+
+USER_AGENT = "ML-Tutorial-Central link checker"
+
+# Servers that refuse HEAD get asked again with GET
+HEAD_REFUSED = {403, 405, 501}
+
+
+def _ok(status):
+    return status is not None and 200 <= status < 400
+
+
+def probe(session, link, timeout):
+    """Return ``(status, latency_ms)`` for one link.
+
+    ``status`` is None when the server couldn't be reached at all.
+    """
+    started = time.perf_counter()
+    try:
+        response = session.head(link, allow_redirects=True, timeout=timeout)
+        if response.status_code in HEAD_REFUSED:
+            # Only the status line is needed, so don't read the body
+            with session.get(
+                link, allow_redirects=True, timeout=timeout, stream=True
+            ) as response:
+                pass
+        status = response.status_code
+    except (requests.RequestException, ValueError):
+        status = None
+    return status, round((time.perf_counter() - started) * 1000)
+
+
+def _session(concurrency, per_host):
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=per_host)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+async def _probe_all(links, concurrency, per_host, timeout):
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    host_slots = defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    async def check(link, session, executor):
+        async with slots, host_slots[urlsplit(link).hostname]:
+            return await loop.run_in_executor(
+                executor, probe, session, link, timeout
+            )
+
+    with ThreadPoolExecutor(concurrency) as executor, _session(
+        concurrency, per_host
+    ) as session:
+        return await asyncio.gather(
+            *(check(link, session, executor) for link in links)
+        )
+
+
+def probe_links(links, concurrency=20, per_host=2, timeout=10):
+    """Probe ``links`` concurrently; return their ``(status, latency_ms)``."""
+    return asyncio.run(_probe_all(links, concurrency, per_host, timeout))
+
+
+def check_links(batch_size=100):
+    """Re-check the links of the resources checked longest ago.
+
+    Only resources never checked or not checked within
+    ``LINK_CHECK_MAX_AGE_HOURS`` are picked. Commits the batch and
+    returns how many resources were checked.
+    """
+    config = current_app.config
+    checked_before = datetime.utcnow() - timedelta(
+        hours=config["LINK_CHECK_MAX_AGE_HOURS"]
+    )
+    resources = (
+        Resource.query.with_entities(
+            Resource.id,
+            Resource.link,
+            Resource.link_status,
+            Resource.link_checked_at,
+        )
+        .filter(
+            db.or_(
+                Resource.link_checked_at.is_(None),
+                Resource.link_checked_at < checked_before,
+            )
+        )
+        .order_by(Resource.link_checked_at.isnot(None))
+        .order_by(Resource.link_checked_at, Resource.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not resources:
+        return 0
+    results = probe_links(
+        [resource.link for resource in resources],
+        concurrency=config["LINK_CHECK_CONCURRENCY"],
+        per_host=config["LINK_CHECK_PER_HOST"],
+        timeout=config["LINK_CHECK_TIMEOUT"],
+    )
+    checked_at = datetime.utcnow()
+    table = Resource.__table__
+    # updated_at is passed through so a check doesn't count as an edit
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam("resource_id"))
+        .values(
+            link_status=bindparam("status"),
+            link_latency_ms=bindparam("latency_ms"),
+            link_checked_at=checked_at,
+            updated_at=table.c.updated_at,
+        ),
+        [
+            {
+                "resource_id": resource.id,
+                "status": status,
+                "latency_ms": latency_ms,
+            }
+            for resource, (status, latency_ms) in zip(resources, results)
+        ],
+    )
+    db.session.commit()
+    # Only a link turning broken or coming back changes the page
+    if any(
+        (resource.link_checked_at is None or _ok(resource.link_status))
+        != _ok(status)
+        for resource, (status, _) in zip(resources, results)
+    ):
+        page_cache.invalidate("resources")
+    return len(resources)
@@ -5,9 +5,16 @@ from wtforms import (
     SelectField,
     SubmitField,
     FloatField,
+    IntegerField,
     TextAreaField,
 )
-from wtforms.validators import DataRequired, Length, URL
+from wtforms.validators import (
+    DataRequired,
+    InputRequired,
+    Length,
+    NumberRange,
+    URL,
+)
 from tutorial_app.models import (
     Tutorial,
     Resource,
@@ -50,3 +57,17 @@ class ResourceForm(FlaskForm):
         "Link", validators=[DataRequired(), URL(), Length(max=300)]
     )
     submit = SubmitField("Submit")
+
+
+class SaveTutorialForm(FlaskForm):
+    """Form for saving or unsaving a Tutorial."""
+
+    submit = SubmitField("Save")
+
+
+class ProgressForm(FlaskForm):
+    """Form for marking a section of a Tutorial as read."""
+
+    section = IntegerField(
+        "Section", validators=[InputRequired(), NumberRange(min=0)]
+    )
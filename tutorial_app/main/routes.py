@@ -1,21 +1,95 @@
 """Main routes."""
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    render_template,
+    redirect,
+    request,
+    url_for,
+    flash,
+)
 from flask_login import login_required, current_user
-from tutorial_app.main.forms import TutorialForm, ResourceForm
-from tutorial_app.models import Tutorial, Resource, User
+from sqlalchemy.exc import IntegrityError
+from tutorial_app.main.forms import (
+    TutorialForm,
+    ResourceForm,
+    ProgressForm,
+    SaveTutorialForm,
+)
+from tutorial_app.models import (
+    Difficulty,
+    Tutorial,
+    TutorialCategory,
+    Resource,
+    User,
+    saved_tutorial_table,
+)
 
-from tutorial_app import db
-
-# TODO: enable user to track their own progress?
+from sqlalchemy.orm import defer
+from tutorial_app import (
+    changes,
+    db,
+    facets,
+    page_cache,
+    popularity,
+    progress,
+    progress_buffer,
+    recommender,
+    related_index,
+    rendering,
+    search,
+    title_index,
+)
+from tutorial_app.replicas import read_only
+from tutorial_app.utils import (
+    conditional_page,
+    enum_arg,
+    keyset_page,
+    page_etag,
+    stream_template,
+)
 
 main = Blueprint("main", __name__)
 
+# Resources read from the database at a time while the list renders
+RESOURCES_CHUNK = 500
+
 
 @main.route("/")
+@read_only
+@page_cache.cached("tutorials")
 def homepage():
-    """Return landing page with list of tutorials."""
-    tutorials = Tutorial.query.all()
-    return render_template("index.html", tutorials=tutorials)
+    """Return landing page with a page of tutorials."""
+    after = request.args.get("after", type=int)
+    tutorials, next_cursor = keyset_page(
+        Tutorial.card_query(),
+        Tutorial.id,
+        after=after,
+        limit=current_app.config["TUTORIALS_PER_PAGE"],
+    )
+    recommended = []
+    if current_user.is_authenticated and after is None:
+        recommended = recommender.for_user(
+            current_user.id, current_app.config["RECOMMENDATIONS_SHOWN"]
+        )
+    return conditional_page(
+        page_etag(
+            "tutorials",
+            [
+                (tutorial.id, tutorial.version, tutorial.save_count)
+                for tutorial in tutorials + recommended
+            ],
+            len(recommended),
+            next_cursor,
+        ),
+        lambda: stream_template(
+            "index.html",
+            tutorials=tutorials,
+            recommended=recommended,
+            next_cursor=next_cursor,
+        ),
+    )
 
 
 @main.route("/new_resource", methods=["GET", "POST"])
@@ -32,7 +106,12 @@ def new_resource():
             description=form.description.data,
         )
         db.session.add(resource)
+        db.session.flush()
+        search.index_resource(resource)
+        changes.record("resource", resource.id)
         db.session.commit()
+        title_index.add("resource", resource.id, resource.title)
+        page_cache.invalidate("resources")
         flash("Thank you for sharing your new resource!")
         return redirect(url_for("main.resources"))
     return render_template("new_resource.html", form=form)
@@ -51,8 +130,19 @@ def new_tutorial():
             difficulty=form.difficulty.data,
             body=form.body.data,
         )
+        rendering.render_tutorial(tutorial)
         db.session.add(tutorial)
+        db.session.flush()
+        search.index_tutorial(tutorial)
+        changes.record("tutorial", tutorial.id)
         db.session.commit()
+        title_index.add("tutorial", tutorial.id, tutorial.title)
+        related = related_index.add(tutorial.id, tutorial.title, tutorial.body)
+        page_cache.invalidate(
+            "tutorials",
+            "popular",
+            *(f"tutorial:{other}" for other in related),
+        )
         flash("Thank you for adding this tutorial!")
         return redirect(
             url_for("main.tutorial_details", tutorial_id=tutorial.id)
@@ -61,12 +151,37 @@ def new_tutorial():
 
 
 @main.route("/resources")
+@read_only
+@page_cache.cached("resources")
 def resources():
-    """See list of resources."""
+    """See list of resources, optionally in one category."""
     # Resources won't have a details page
     # All resources have a short description and an external link
-    resources = Resource.query.all()
-    return render_template("resources.html", resources=resources)
+    category = enum_arg(TutorialCategory, "category")
+    query = Resource.query
+    if category:
+        query = query.filter(Resource.category == category)
+    if current_app.config["HIDE_BROKEN_LINKS"]:
+        query = query.filter(Resource.link_ok())
+    query = query.order_by(Resource.id)
+    # The page isn't paginated, so only the columns the validators need
+    # are read up front; the rows stream from the database as it renders
+    stamps = query.with_entities(
+        Resource.id,
+        Resource.version,
+        Resource.link_status,
+        Resource.link_checked_at,
+    ).all()
+    categories = facets.resource_facets()
+    return conditional_page(
+        page_etag("resources", [tuple(stamp) for stamp in stamps], categories),
+        lambda: stream_template(
+            "resources.html",
+            resources=query.yield_per(RESOURCES_CHUNK),
+            category=category,
+            categories=categories,
+        ),
+    )
 
 
 @main.route("/resources/delete/<resource_id>")
@@ -77,17 +192,227 @@ def delete_resource(resource_id):
     # being able to delete a resource, but for our MVP that's fine
     resource = Resource.query.get(resource_id)
     db.session.delete(resource)
+    search.remove("resource", resource.id)
+    changes.record("resource", resource.id, deleted=True)
     db.session.commit()
+    title_index.remove("resource", resource.id)
+    page_cache.invalidate("resources")
     flash("Resource successfully deleted!")
     return redirect(url_for("main.resources"))
 
 
-@main.route("/tutorials/<tutorial_id>")
+@main.route("/tutorials")
+@read_only
+@page_cache.cached("tutorials")
+def browse_tutorials():
+    """Browse tutorials by category and difficulty."""
+    category = enum_arg(TutorialCategory, "category")
+    difficulty = enum_arg(Difficulty, "difficulty")
+    # Both filters and the cursor are one range of the composite index
+    query = Tutorial.card_query()
+    if category:
+        query = query.filter(Tutorial.category == category)
+    if difficulty:
+        query = query.filter(Tutorial.difficulty == difficulty)
+    tutorials, next_cursor = keyset_page(
+        query,
+        Tutorial.id,
+        after=request.args.get("after", type=int),
+        limit=current_app.config["TUTORIALS_PER_PAGE"],
+    )
+    categories, difficulties = facets.tutorial_facets(category, difficulty)
+    return conditional_page(
+        page_etag(
+            "browse",
+            [
+                (tutorial.id, tutorial.version, tutorial.save_count)
+                for tutorial in tutorials
+            ],
+            next_cursor,
+            categories,
+            difficulties,
+        ),
+        lambda: stream_template(
+            "browse_tutorials.html",
+            tutorials=tutorials,
+            next_cursor=next_cursor,
+            category=category,
+            difficulty=difficulty,
+            categories=categories,
+            difficulties=difficulties,
+        ),
+    )
+
+
+@main.route("/tutorials/<int:tutorial_id>")
+@read_only
+@page_cache.cached("tutorial:{tutorial_id}", "related")
 def tutorial_details(tutorial_id):
     """View tutorial content."""
-    # In the future it would be nice if users could track their progress!
-    tutorial = Tutorial.query.get(tutorial_id)
-    return render_template("tutorial_detail.html", tutorial=tutorial)
+    # Check the client's copy against the version before loading the body
+    stamp = (
+        db.session.query(
+            Tutorial.version,
+            Tutorial.save_count,
+            Tutorial.section_count,
+        )
+        .filter(Tutorial.id == tutorial_id)
+        .first()
+    )
+    if stamp is None:
+        abort(404)
+    related = related_index.lookup(tutorial_id)
+    saved = completed = None
+    if current_user.is_authenticated:
+        saved = current_user.has_saved(tutorial_id)
+        completed = progress.completed_sections(
+            progress_buffer.sections(current_user.id, [tutorial_id]).get(
+                tutorial_id, 0
+            ),
+            stamp.section_count,
+        )
+    return conditional_page(
+        page_etag(
+            "tutorial",
+            tutorial_id,
+            stamp.version,
+            stamp.save_count,
+            saved,
+            completed,
+            related,
+        ),
+        lambda: render_template(
+            "tutorial_detail.html",
+            tutorial=Tutorial.query.options(defer("body")).get(tutorial_id),
+            saved=saved,
+            save_form=SaveTutorialForm(),
+            progress_form=ProgressForm(),
+            completed=completed,
+            related=related,
+        ),
+    )
+
+
+@main.route("/tutorials/<int:tutorial_id>/progress", methods=["POST"])
+@login_required
+def record_progress(tutorial_id):
+    """Mark a section of a tutorial as read by the current user."""
+    section_count = (
+        db.session.query(Tutorial.section_count)
+        .filter(Tutorial.id == tutorial_id)
+        .scalar()
+    )
+    if section_count is None:
+        abort(404)
+    form = ProgressForm()
+    if not form.validate_on_submit():
+        abort(400)
+    # Headings past the last tracked section all count toward it
+    progress_buffer.record(
+        current_user.id,
+        tutorial_id,
+        min(form.section.data, section_count - 1),
+    )
+    return "", 204
+
+
+@main.route("/tutorials/<int:tutorial_id>/save", methods=["POST"])
+@login_required
+def save_tutorial(tutorial_id):
+    """Add a tutorial to the current user's saved tutorials."""
+    if db.session.query(Tutorial.id).filter_by(id=tutorial_id).first() is None:
+        abort(404)
+    form = SaveTutorialForm()
+    if form.validate_on_submit():
+        # The primary key rejects a second save of the same tutorial
+        try:
+            popularity.record_save(tutorial_id, current_user.id)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        else:
+            page_cache.invalidate(
+                "tutorials", "popular", f"tutorial:{tutorial_id}"
+            )
+    return redirect(url_for("main.tutorial_details", tutorial_id=tutorial_id))
+
+
+@main.route("/tutorials/<int:tutorial_id>/unsave", methods=["POST"])
+@login_required
+def unsave_tutorial(tutorial_id):
+    """Remove a tutorial from the current user's saved tutorials."""
+    form = SaveTutorialForm()
+    if form.validate_on_submit():
+        removed = popularity.record_unsave(tutorial_id, current_user.id)
+        db.session.commit()
+        if removed:
+            page_cache.invalidate(
+                "tutorials", "popular", f"tutorial:{tutorial_id}"
+            )
+    return redirect(url_for("main.tutorial_details", tutorial_id=tutorial_id))
+
+
+@main.route("/saved")
+@read_only
+@login_required
+def saved_tutorials():
+    """List the tutorials the current user has saved."""
+    tutorials, next_cursor = keyset_page(
+        Tutorial.card_query()
+        .join(saved_tutorial_table)
+        .filter(saved_tutorial_table.c.user_id == current_user.id),
+        Tutorial.id,
+        after=request.args.get("after", type=int),
+        limit=current_app.config["TUTORIALS_PER_PAGE"],
+    )
+    # One range of the progress primary key covers the whole page
+    sections = progress_buffer.sections(
+        current_user.id, [tutorial.id for tutorial in tutorials]
+    )
+    return stream_template(
+        "saved_tutorials.html",
+        tutorials=tutorials,
+        next_cursor=next_cursor,
+        percents={
+            tutorial.id: progress.percent_complete(
+                sections.get(tutorial.id, 0), tutorial.section_count
+            )
+            for tutorial in tutorials
+        },
+    )
+
+
+@main.route("/tutorials/most_saved")
+@read_only
+@page_cache.cached("popular")
+def most_saved():
+    """List the tutorials saved by the most users."""
+    tutorials = (
+        Tutorial.card_query()
+        .order_by(Tutorial.save_count.desc(), Tutorial.id.desc())
+        .limit(current_app.config["TUTORIALS_PER_PAGE"])
+        .all()
+    )
+    return stream_template(
+        "popular_tutorials.html", heading="Most Saved", tutorials=tutorials
+    )
+
+
+@main.route("/tutorials/trending")
+@read_only
+@page_cache.cached("popular")
+def trending():
+    """List the tutorials with the most recent saves."""
+    tutorials = (
+        Tutorial.card_query()
+        .filter(Tutorial.save_count > 0)
+        .order_by(Tutorial.trending_score.desc(), Tutorial.id.desc())
+        .limit(current_app.config["TUTORIALS_PER_PAGE"])
+        .all()
+    )
+    return stream_template(
+        "popular_tutorials.html", heading="Trending", tutorials=tutorials
+    )
 
 
 @main.route("/tutorials/edit/<tutorial_id>", methods=["GET", "POST"])
@@ -103,7 +428,18 @@ def edit_tutorial(tutorial_id):
         tutorial.category = form.category.data
         tutorial.difficulty = form.difficulty.data
         tutorial.body = form.body.data
+        rendering.render_tutorial(tutorial)
+        search.index_tutorial(tutorial)
+        changes.record("tutorial", tutorial.id)
         db.session.commit()
+        title_index.add("tutorial", tutorial.id, tutorial.title)
+        related = related_index.add(tutorial.id, tutorial.title, tutorial.body)
+        page_cache.invalidate(
+            "tutorials",
+            "popular",
+            f"tutorial:{tutorial.id}",
+            *(f"tutorial:{other}" for other in related),
+        )
         flash("Tutorial has been successfully updated.")
         return redirect(
             url_for("main.tutorial_details", tutorial_id=tutorial.id)
@@ -118,7 +454,56 @@ def delete_tutorial(tutorial_id):
     # We also have the poor "real world" case of anyone logged in
     # being able to delete a tutorial, but for our MVP that's fine
     tutorial = Tutorial.query.get(tutorial_id)
+    progress.remove(tutorial.id)
     db.session.delete(tutorial)
+    search.remove("tutorial", tutorial.id)
+    changes.record("tutorial", tutorial.id, deleted=True)
     db.session.commit()
+    title_index.remove("tutorial", tutorial.id)
+    related = related_index.remove(tutorial.id)
+    page_cache.invalidate(
+        "tutorials",
+        "popular",
+        f"tutorial:{tutorial.id}",
+        *(f"tutorial:{other}" for other in related),
+    )
     flash("Tutorial successfully deleted!")
     return redirect(url_for("main.homepage"))
+
+
+@main.route("/search")
+@read_only
+def search_results():
+    """Search tutorials and resources by keyword."""
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    hits, has_more = search.search(
+        query, page=page, per_page=current_app.config["TUTORIALS_PER_PAGE"]
+    )
+    tutorial_ids = [item_id for kind, item_id in hits if kind == "tutorial"]
+    resource_ids = [item_id for kind, item_id in hits if kind == "resource"]
+    found = {}
+    if tutorial_ids:
+        for tutorial in Tutorial.card_query().filter(
+            Tutorial.id.in_(tutorial_ids)
+        ):
+            found["tutorial", tutorial.id] = tutorial
+    if resource_ids:
+        for resource in Resource.query.filter(Resource.id.in_(resource_ids)):
+            found["resource", resource.id] = resource
+    # Rows deleted since they were indexed (or not on this replica yet)
+    # drop out here
+    results = [
+        (kind, found[kind, item_id])
+        for kind, item_id in hits
+        if (kind, item_id) in found
+    ]
+    suggestions = [] if results else title_index.lookup(query)
+    return stream_template(
+        "search.html",
+        query=query,
+        results=results,
+        suggestions=suggestions,
+        page=page,
+        has_more=has_more,
+    )
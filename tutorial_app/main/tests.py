@@ -1,15 +1,57 @@
+import gzip
 import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from tutorial_app import app, db, bcrypt
+import brotli
+from sqlalchemy import event, orm
+from tutorial_app import (
+    assets,
+    bulk,
+    create_app,
+    db,
+    bcrypt,
+    facets,
+    linkcheck,
+    page_cache,
+    popularity,
+    profiler,
+    progress_buffer,
+    recommender,
+    related_index,
+    rendering,
+    title_index,
+    user_cache,
+)
+from tutorial_app.config import TestConfig
+from tutorial_app.replicas import PRIMARY_UNTIL
 from tutorial_app.models import (
+    Change,
     User,
     Tutorial,
     Resource,
     TutorialCategory,
     Difficulty,
+    saved_tutorial_table,
+    tutorial_progress_table,
 )
 
+app = create_app(TestConfig)
+
+
+class ReplicaTestConfig(TestConfig):
+    SQLALCHEMY_REPLICA_URIS = ["sqlite://"]
+    REPLICA_LAG_SECONDS = 60
+
+
+replica_app = create_app(ReplicaTestConfig)
+
 """
 Run these tests with the command:
 python3 -m unittest tutorial_app.main.tests
@@ -54,6 +96,39 @@ def create_resource():
     db.session.commit()
 
 
+class StubLinkHandler(BaseHTTPRequestHandler):
+    """Answers link checks: /ok, /gone, /no-head and /slow."""
+
+    in_flight = 0
+    most_in_flight = 0
+    lock = threading.Lock()
+
+    def do_HEAD(self):
+        if self.path == "/no-head":
+            self.respond(405)
+        else:
+            self.do_GET()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.most_in_flight = max(cls.most_in_flight, cls.in_flight)
+        if self.path == "/slow":
+            time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        self.respond(404 if self.path == "/gone" else 200)
+
+    def respond(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
 def create_user():
     password_hash = bcrypt.generate_password_hash("password").decode("utf-8")
     user = User(username="testuser", password=password_hash)
@@ -69,13 +144,17 @@ def create_user():
 class MainTests(unittest.TestCase):
     def setUp(self):
         """Executed prior to each test."""
-        app.config["TESTING"] = True
-        app.config["WTF_CSRF_ENABLED"] = False
-        app.config["DEBUG"] = False
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
         self.app = app.test_client()
         db.drop_all()
         db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
 
     # Test that when logged out, nav options are correct and we see
     # our "Test Tutorial" on the main page
@@ -194,3 +273,1241 @@ class MainTests(unittest.TestCase):
         # Make sure that the user was redirecte to the signin page
         self.assertEqual(response.status_code, 302)
         self.assertIn("/signin?next=%2Fnew_tutorial", response.location)
+
+    # Test that the homepage pages through tutorials by id cursor
+    def test_homepage_pagination(self):
+        """Test that the homepage only shows one page of tutorials."""
+        app.config["TUTORIALS_PER_PAGE"] = 2
+        self.addCleanup(app.config.__setitem__, "TUTORIALS_PER_PAGE", 20)
+        for title in ["First", "Second", "Third"]:
+            db.session.add(
+                Tutorial(
+                    category=TutorialCategory.ML,
+                    title=title,
+                    difficulty=Difficulty.BEGINNER,
+                    body="Test body",
+                )
+            )
+        db.session.commit()
+
+        response = self.app.get("/")
+        response_text = response.get_data(as_text=True)
+        self.assertIn("First", response_text)
+        self.assertIn("Second", response_text)
+        self.assertNotIn("Third", response_text)
+        self.assertIn("/?after=2", response_text)
+
+        response = self.app.get("/?after=2")
+        response_text = response.get_data(as_text=True)
+        self.assertIn("Third", response_text)
+        self.assertNotIn("Second", response_text)
+        self.assertNotIn("More Tutorials", response_text)
+
+    # Test that tutorials created, edited and deleted through the routes
+    # are kept in sync with the search index
+    def test_search_tracks_tutorial_writes(self):
+        """Test that search results follow tutorial writes."""
+        create_user()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="DL",
+                title="Convolutions",
+                difficulty="BEGINNER",
+                body="Training convolutional networks on images",
+            ),
+        )
+
+        response = self.app.get("/search?q=train")
+        self.assertIn("Convolutions", response.get_data(as_text=True))
+
+        self.app.post(
+            "/tutorials/edit/1",
+            data=dict(
+                category="DL",
+                title="Convolutions",
+                difficulty="BEGINNER",
+                body="Pooling layers explained",
+            ),
+        )
+        response = self.app.get("/search?q=train")
+        self.assertNotIn("Convolutions", response.get_data(as_text=True))
+        response = self.app.get("/search?q=pooling")
+        self.assertIn("Convolutions", response.get_data(as_text=True))
+
+        self.app.get("/tutorials/delete/1")
+        response = self.app.get("/search?q=pooling")
+        response_text = response.get_data(as_text=True)
+        self.assertNotIn("Convolutions", response_text)
+        self.assertIn("No tutorials or resources matched", response_text)
+
+        # A hit whose row is gone from under the index is left out
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="DL",
+                title="Recurrent Networks",
+                difficulty="BEGINNER",
+                body="Pooling over time",
+            ),
+        )
+        db.session.execute(Tutorial.__table__.delete())
+        db.session.commit()
+        response = self.app.get("/search?q=pooling")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Recurrent Networks", response.get_data(as_text=True))
+
+    # Test that resources are searchable and odd input doesn't error
+    def test_search_resources(self):
+        """Test that resources show up in search results."""
+        create_user()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_resource",
+            data=dict(
+                category="STATS",
+                title="Bayes Primer",
+                description="A gentle intro to priors",
+                link="https://example.com/bayes",
+            ),
+        )
+
+        response = self.app.get("/search?q=priors")
+        self.assertIn("Bayes Primer", response.get_data(as_text=True))
+
+        response = self.app.get('/search?q="unbalanced AND (')
+        self.assertEqual(response.status_code, 200)
+
+    # Test that a misspelled search offers close titles instead
+    def test_search_did_you_mean(self):
+        """Test that fuzzy title suggestions follow tutorial writes."""
+        create_user()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Gradient Descent",
+                difficulty="BEGINNER",
+                body="Walking downhill",
+            ),
+        )
+
+        response = self.app.get("/search?q=gradiant+decent")
+        response_text = response.get_data(as_text=True)
+        self.assertIn("Did you mean", response_text)
+        self.assertIn("Gradient Descent", response_text)
+
+        self.app.get("/tutorials/delete/1")
+        response = self.app.get("/search?q=gradiant+decent")
+        self.assertNotIn("Gradient Descent", response.get_data(as_text=True))
+
+    # Test that anonymous pages are served from the cache until a write
+    # invalidates them
+    def test_page_cache_invalidation(self):
+        """Test that cached pages are dropped by the write routes."""
+        create_tutorial()
+        create_user()
+
+        response = self.app.get("/tutorials/1")
+        self.assertIn("Test body", response.get_data(as_text=True))
+        self.app.get("/")
+
+        # Changing the row behind the cache's back leaves the page cached
+        tutorial = Tutorial.query.get(1)
+        tutorial.body = "Changed body"
+        db.session.commit()
+        response = self.app.get("/tutorials/1")
+        self.assertIn("Test body", response.get_data(as_text=True))
+
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/tutorials/edit/1",
+            data=dict(
+                category="ML",
+                title="Edited Tutorial",
+                difficulty="BEGINNER",
+                body="Edited body",
+            ),
+        )
+        signout(self.app)
+
+        response = self.app.get("/tutorials/1")
+        self.assertIn("Edited body", response.get_data(as_text=True))
+        response = self.app.get("/")
+        self.assertIn("Edited Tutorial", response.get_data(as_text=True))
+
+    # Test that a client holding the current copy of a page gets a 304
+    def test_tutorial_detail_conditional_get(self):
+        """Test ETag revalidation of tutorial pages."""
+        create_tutorial()
+        create_user()
+
+        response = self.app.get("/tutorials/1")
+        etag = response.headers["ETag"]
+        # Related tutorials change without moving the tutorial's updated_at
+        self.assertNotIn("Last-Modified", response.headers)
+
+        response = self.app.get(
+            "/tutorials/1", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+
+        response = self.app.get(
+            "/tutorials/1",
+            headers={"If-Modified-Since": response.headers["Date"]},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        signin(self.app, "testuser", "password")
+        response = self.app.get(
+            "/tutorials/1", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.app.post(
+            "/tutorials/edit/1",
+            data=dict(
+                category="ML",
+                title="Test Tutorial",
+                difficulty="BEGINNER",
+                body="Edited body",
+            ),
+        )
+        self.assertEqual(Tutorial.query.get(1).version, 2)
+        signout(self.app)
+
+        response = self.app.get(
+            "/tutorials/1", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    # Test that list pages revalidate against the rows they show
+    def test_homepage_conditional_get(self):
+        """Test that the homepage ETag changes when a tutorial is added."""
+        create_tutorial()
+
+        response = self.app.get("/")
+        etag = response.headers["ETag"]
+        # Deletions and facet counts don't move any row's updated_at
+        self.assertNotIn("Last-Modified", response.headers)
+        response = self.app.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        create_tutorial()
+        page_cache.invalidate("tutorials")
+        response = self.app.get("/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    # Test saving and unsaving a tutorial
+    def test_save_and_unsave_tutorial(self):
+        """Test that saved tutorials show up on the saved page."""
+        create_tutorial()
+        create_user()
+        signin(self.app, "testuser", "password")
+
+        self.app.post("/tutorials/1/save")
+        # Saving twice is harmless
+        self.app.post("/tutorials/1/save")
+
+        response = self.app.get("/saved")
+        response_text = response.get_data(as_text=True)
+        self.assertIn("Test Tutorial", response_text)
+        self.assertIn("Saved by 1", response_text)
+
+        response = self.app.get("/tutorials/1")
+        response_text = response.get_data(as_text=True)
+        self.assertIn("Saved by 1 user", response_text)
+        self.assertIn("Unsave Tutorial", response_text)
+
+        self.app.post("/tutorials/1/unsave")
+        response = self.app.get("/saved")
+        self.assertNotIn("Test Tutorial", response.get_data(as_text=True))
+        response = self.app.get("/tutorials/1")
+        self.assertIn("Saved by 0 users", response.get_data(as_text=True))
+
+    # Test that listing save counts doesn't cost a query per tutorial
+    def test_homepage_save_counts_query_count(self):
+        """Test that the homepage query count doesn't grow with rows."""
+        users = [User(username=f"user{i}", password="x") for i in range(3)]
+        db.session.add_all(users)
+        for i in range(10):
+            tutorial = Tutorial(
+                category=TutorialCategory.ML,
+                title=f"Tutorial {i}",
+                difficulty=Difficulty.BEGINNER,
+                body="Test body",
+            )
+            tutorial.saved_by = users[: i % 4]
+            db.session.add(tutorial)
+        db.session.commit()
+        with app.app_context():
+            popularity.reconcile()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        self.addCleanup(
+            event.remove, db.engine, "before_cursor_execute", listener
+        )
+        response = self.app.get("/")
+
+        self.assertIn("Saved by 3", response.get_data(as_text=True))
+        # Besides the page cache's token lookups
+        statements = [sql for sql in statements if "page_token" not in sql]
+        self.assertEqual(len(statements), 1)
+
+    # Test that the leaderboards follow saves and the counters reconcile
+    def test_most_saved_and_trending(self):
+        """Test the popularity listings and counter reconciliation."""
+        create_user()
+        for title in ["Alpha", "Beta"]:
+            db.session.add(
+                Tutorial(
+                    category=TutorialCategory.ML,
+                    title=title,
+                    difficulty=Difficulty.BEGINNER,
+                    body="Test body",
+                )
+            )
+        db.session.commit()
+        signin(self.app, "testuser", "password")
+        self.app.post("/tutorials/2/save")
+
+        response_text = self.app.get("/tutorials/most_saved").get_data(
+            as_text=True
+        )
+        self.assertLess(
+            response_text.index("Beta"), response_text.index("Alpha")
+        )
+        response_text = self.app.get("/tutorials/trending").get_data(
+            as_text=True
+        )
+        self.assertIn("Beta", response_text)
+        self.assertNotIn("Alpha", response_text)
+
+        beta = Tutorial.query.get(2)
+        self.assertEqual(beta.save_count, 1)
+        self.assertGreater(beta.trending_score, 0)
+        score = beta.trending_score
+
+        # Knock the counters out of line, then rebuild them
+        beta.save_count = 7
+        beta.trending_score = 0
+        db.session.commit()
+        with app.app_context():
+            popularity.reconcile()
+        beta = Tutorial.query.get(2)
+        self.assertEqual(beta.save_count, 1)
+        self.assertAlmostEqual(beta.trending_score, score)
+
+        self.app.post("/tutorials/2/unsave")
+        beta = Tutorial.query.get(2)
+        self.assertEqual(beta.save_count, 0)
+        self.assertAlmostEqual(beta.trending_score, 0)
+
+        # Cached listings pick up new and deleted tutorials
+        signout(self.app)
+        self.app.get("/tutorials/most_saved")
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Gamma",
+                difficulty="BEGINNER",
+                body="Test body",
+            ),
+        )
+        signout(self.app)
+        response_text = self.app.get("/tutorials/most_saved").get_data(
+            as_text=True
+        )
+        self.assertIn("Gamma", response_text)
+        signin(self.app, "testuser", "password")
+        self.app.get("/tutorials/delete/1")
+        signout(self.app)
+        response_text = self.app.get("/tutorials/most_saved").get_data(
+            as_text=True
+        )
+        self.assertNotIn("Alpha", response_text)
+
+    def test_trending_with_short_half_life(self):
+        """Test that trending scores stay finite and exact over years."""
+        app.config["TRENDING_HALF_LIFE_DAYS"] = 0.5
+        self.addCleanup(app.config.__setitem__, "TRENDING_HALF_LIFE_DAYS", 7)
+        create_tutorial()
+        create_user()
+        db.session.add(User(username="ada", password="unused"))
+        db.session.commit()
+        # Ada saved it a year ago, thousands of half-lives back
+        year_ago = datetime.utcnow() - timedelta(days=365)
+        db.session.execute(
+            saved_tutorial_table.insert().values(
+                tutorial_id=1, user_id=2, saved_at=year_ago
+            )
+        )
+        db.session.commit()
+        popularity.reconcile()
+        old = popularity.save_weight(year_ago)
+        self.assertAlmostEqual(Tutorial.query.get(1).trending_score, old)
+
+        signin(self.app, "testuser", "password")
+        response = self.app.post("/tutorials/1/save")
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        tutorial = Tutorial.query.get(1)
+        self.assertEqual(tutorial.save_count, 2)
+        self.assertGreater(tutorial.trending_score, old + 500)
+
+        # Taking the new save off leaves the old one, not nothing
+        response = self.app.post("/tutorials/1/unsave")
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        tutorial = Tutorial.query.get(1)
+        self.assertEqual(tutorial.save_count, 1)
+        self.assertAlmostEqual(tutorial.trending_score, old)
+
+    # Test "saved this also saved" recommendations on the homepage
+    def test_recommendations(self):
+        """Test co-save recommendations and their saved table."""
+        for title in ["Alpha", "Beta", "Gamma", "Delta"]:
+            db.session.add(
+                Tutorial(
+                    category=TutorialCategory.ML,
+                    title=title,
+                    difficulty=Difficulty.BEGINNER,
+                    body="Test body",
+                )
+            )
+        password_hash = bcrypt.generate_password_hash("password").decode()
+        for username in ["testuser", "ada", "alan"]:
+            db.session.add(User(username=username, password=password_hash))
+        db.session.commit()
+        # Alpha goes with Beta twice and with Gamma once
+        for tutorial_id, user_id in [(1, 2), (2, 2), (1, 3), (2, 3), (3, 3)]:
+            popularity.record_save(tutorial_id, user_id)
+        popularity.record_save(4, 1)
+        db.session.commit()
+
+        signin(self.app, "testuser", "password")
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertNotIn("Recommended for You", response_text)
+
+        self.app.post("/tutorials/1/save")
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("Recommended for You", response_text)
+        recommended = response_text[: response_text.index("Browse Tutorials")]
+        self.assertLess(recommended.index("Beta"), recommended.index("Gamma"))
+        self.assertNotIn("Alpha", recommended)
+        self.assertNotIn("Delta", recommended)
+        # Later pages leave them out
+        response_text = self.app.get("/?after=1").get_data(as_text=True)
+        self.assertNotIn("Recommended for You", response_text)
+
+        # A saved table loads back the same recommendations
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recommendations.npz")
+            recommender.build()
+            recommender.save(path)
+            recommender.clear()
+            recommender.load(path)
+        self.assertEqual(recommender.recommend([1], 1), [2])
+        self.assertEqual(recommender.recommend([1, 2], 5), [3, 4])
+        self.assertEqual(recommender.recommend([4], 5), [1])
+        self.assertEqual(recommender.recommend([99], 5), [])
+
+    # Test that tutorials can be browsed by category and difficulty
+    def test_browse_tutorials(self):
+        """Test faceted browsing and its facet counts."""
+        for title, category, difficulty in [
+            ("Perceptrons", TutorialCategory.DL, Difficulty.BEGINNER),
+            ("Transformers", TutorialCategory.DL, Difficulty.EXPERT),
+            ("Regression", TutorialCategory.ML, Difficulty.BEGINNER),
+        ]:
+            db.session.add(
+                Tutorial(
+                    category=category,
+                    title=title,
+                    difficulty=difficulty,
+                    body="Test body",
+                )
+            )
+        db.session.commit()
+
+        response_text = self.app.get(
+            "/tutorials?category=DL&difficulty=BEGINNER"
+        ).get_data(as_text=True)
+        self.assertIn("Perceptrons", response_text)
+        self.assertNotIn("Transformers", response_text)
+        self.assertNotIn("Regression", response_text)
+
+        # Category counts are within the chosen difficulty and back
+        self.assertEqual(
+            facets.tutorial_facets(difficulty=Difficulty.BEGINNER)[0][:3],
+            [
+                (TutorialCategory.ML, 1),
+                (TutorialCategory.STATS, 0),
+                (TutorialCategory.DL, 1),
+            ],
+        )
+        self.assertEqual(
+            facets.tutorial_facets(category=TutorialCategory.DL)[1],
+            [
+                (Difficulty.BEGINNER, 1),
+                (Difficulty.INTERMEDIATE, 0),
+                (Difficulty.EXPERT, 1),
+            ],
+        )
+
+        response = self.app.get("/tutorials?difficulty=HARD")
+        self.assertEqual(response.status_code, 400)
+
+    # Test that facet counts are cached until tutorials change
+    def test_facet_counts_cached(self):
+        """Test that the facet GROUP BY runs once per change."""
+        create_tutorial()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        self.addCleanup(
+            event.remove, db.engine, "before_cursor_execute", listener
+        )
+
+        self.app.get("/tutorials?category=ML")
+        self.app.get("/tutorials?difficulty=EXPERT")
+        self.assertEqual(len([s for s in statements if "GROUP BY" in s]), 1)
+
+        create_user()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="DL",
+                title="Convolutions",
+                difficulty="EXPERT",
+                body="Training convolutional networks on images",
+            ),
+        )
+        response_text = self.app.get("/tutorials?category=DL").get_data(
+            as_text=True
+        )
+        self.assertIn("Convolutions", response_text)
+        self.assertEqual(len([s for s in statements if "GROUP BY" in s]), 2)
+        self.assertEqual(
+            facets.tutorial_facets()[0][2], (TutorialCategory.DL, 1)
+        )
+
+    # Test that resources can be narrowed to one category
+    def test_resources_by_category(self):
+        """Test the category filter and counts on the resources page."""
+        create_resource()
+        response_text = self.app.get("/resources?category=OTHER").get_data(
+            as_text=True
+        )
+        self.assertIn("Test Resource", response_text)
+        self.assertIn("Other (1)", response_text)
+        response_text = self.app.get("/resources?category=DL").get_data(
+            as_text=True
+        )
+        self.assertNotIn("Test Resource", response_text)
+
+    # Test that reading progress pings are coalesced and written in bulk
+    def test_progress_pings_coalesce(self):
+        """Test recording, reading and flushing section progress."""
+        self.addCleanup(progress_buffer.flush)
+        create_user()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Regression",
+                difficulty="BEGINNER",
+                body="# Fitting\n\nText\n\n## Loss\n\nText\n\n# Wrap up",
+            ),
+        )
+        self.assertEqual(Tutorial.query.get(1).section_count, 3)
+
+        for section in [0, 0, 2, 0]:
+            response = self.app.post(
+                "/tutorials/1/progress", data=dict(section=section)
+            )
+            self.assertEqual(response.status_code, 204)
+        self.assertEqual(db.session.query(tutorial_progress_table).count(), 0)
+        # Pending pings already show on the page
+        response_text = self.app.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn('aria-valuenow="66"', response_text)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        self.addCleanup(
+            event.remove, db.engine, "before_cursor_execute", listener
+        )
+        self.assertEqual(progress_buffer.flush(), 1)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(
+            db.session.query(tutorial_progress_table.c.sections).scalar(),
+            0b101,
+        )
+
+        # Sections past the last fold into it, and bits only accumulate
+        self.app.post("/tutorials/1/progress", data=dict(section=1))
+        self.app.post("/tutorials/1/progress", data=dict(section=9))
+        progress_buffer.flush()
+        self.assertEqual(
+            db.session.query(tutorial_progress_table.c.sections).scalar(),
+            0b111,
+        )
+
+        self.app.post("/tutorials/1/save")
+        response_text = self.app.get("/saved").get_data(as_text=True)
+        self.assertIn('aria-valuenow="100"', response_text)
+
+        response = self.app.post("/tutorials/1/progress", data={})
+        self.assertEqual(response.status_code, 400)
+        response = self.app.post("/tutorials/2/progress", data=dict(section=0))
+        self.assertEqual(response.status_code, 404)
+
+        # Deleting the tutorial takes everyone's progress with it
+        self.app.get("/tutorials/delete/1")
+        self.assertEqual(db.session.query(tutorial_progress_table).count(), 0)
+
+    # Test that tutorial bodies are rendered once, on save
+    def test_tutorial_markdown_rendering(self):
+        """Test that Markdown bodies are rendered and sanitized on save."""
+        create_user()
+        signin(self.app, "testuser", "password")
+        body = (
+            "# Linear Models\n\n"
+            "Fit $y = w_1 x_1 + b$ by *least squares*.\n\n"
+            "Placeholders like MATHSPAN3ENDMATH are just text.\n\n"
+            "```\nmodel.fit(X, y)\n```\n\n"
+            "<script>alert('hi')</script>"
+        )
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Regression",
+                difficulty="BEGINNER",
+                body=body,
+            ),
+        )
+
+        response_text = self.app.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("<h1>Linear Models</h1>", response_text)
+        self.assertIn("<em>least squares</em>", response_text)
+        self.assertIn("$y = w_1 x_1 + b$", response_text)
+        self.assertIn("like MATHSPAN3ENDMATH are", response_text)
+        self.assertIn("<code>model.fit(X, y)", response_text)
+        self.assertNotIn("<script>alert", response_text)
+
+        tutorial = Tutorial.query.get(1)
+        self.assertEqual(tutorial.body_hash, rendering.content_hash(body))
+
+        # Stale HTML is picked up by the bulk re-render, fresh HTML isn't,
+        # and the change feed hears about it
+        tutorial.body_hash = "stale"
+        db.session.commit()
+        seq = Change.query.one().seq
+        with app.app_context():
+            self.assertEqual(rendering.rerender_all(), 1)
+            self.assertEqual(rendering.rerender_all(), 0)
+        self.assertGreater(Change.query.one().seq, seq)
+
+    def test_related_tutorials(self):
+        """Test that related tutorials follow writes and survive a save."""
+        create_user()
+        signin(self.app, "testuser", "password")
+        bodies = [
+            ("Backpropagation", "Training neural networks by gradients"),
+            ("Optimizers", "Gradient descent for training neural networks"),
+            ("Clustering", "Grouping points with k-means"),
+        ]
+        for title, body in bodies[:2]:
+            self.app.post(
+                "/new_tutorial",
+                data=dict(
+                    category="DL",
+                    title=title,
+                    difficulty="BEGINNER",
+                    body=body,
+                ),
+            )
+
+        # The first lookup builds the index from the database
+        response_text = self.app.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Related tutorials", response_text)
+        self.assertIn("Optimizers", response_text)
+
+        # Later writes update it in place, and the cached page with it
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Clustering",
+                difficulty="BEGINNER",
+                body="Grouping points with gradient free training",
+            ),
+        )
+        self.assertEqual(
+            [title for _, title in related_index.lookup(1)],
+            ["Optimizers", "Clustering"],
+        )
+        self.app.post(
+            "/tutorials/edit/3",
+            data=dict(
+                category="ML",
+                title="Clustering",
+                difficulty="BEGINNER",
+                body=bodies[2][1],
+            ),
+        )
+        self.assertEqual(related_index.lookup(1), [(2, "Optimizers")])
+        self.assertEqual(related_index.lookup(3), [])
+
+        self.app.get("/tutorials/delete/2")
+        response_text = self.app.get("/tutorials/1").get_data(as_text=True)
+        self.assertNotIn("Optimizers", response_text)
+        self.assertNotIn("Related tutorials", response_text)
+
+        # A saved index loads back the same neighbours
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "related.npz")
+            related_index.build()
+            related_index.save(path)
+            saved = dict(related_index.index._neighbours)
+            related_index.clear()
+            related_index.load(path)
+        self.assertEqual(related_index.index._neighbours, saved)
+
+    def test_built_assets(self):
+        """Test that built assets are fingerprinted, compressed and cached."""
+        # Unbuilt, pages link the plain static files
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("/static/bootstrap.min.css", response_text)
+        self.assertNotIn("cdn.jsdelivr.net", response_text)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        app.config["ASSETS_BUILD_DIR"] = directory.name
+        self.addCleanup(app.config.pop, "ASSETS_BUILD_DIR")
+        self.addCleanup(app.extensions.pop, "assets", None)
+        manifest = assets.build(app)
+        hashed = manifest["bootstrap.min.css"]
+        self.assertRegex(hashed, r"^bootstrap\.min\.[0-9a-f]{12}\.css$")
+        self.assertTrue(manifest["assets/logo.png"].startswith("assets/"))
+
+        # Building again writes nothing new
+        before = sorted(os.listdir(directory.name))
+        self.assertEqual(assets.build(app), manifest)
+        self.assertEqual(sorted(os.listdir(directory.name)), before)
+
+        # A fresh worker reads the manifest the build left
+        app.extensions.pop("assets")
+        page_cache.clear()
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn(f"/dist/{hashed}", response_text)
+        self.assertNotIn("/static/bootstrap.min.css", response_text)
+
+        with open(
+            os.path.join(app.static_folder, "bootstrap.min.css"), "rb"
+        ) as f:
+            original = f.read()
+        for accept, encoding in (
+            ("gzip, deflate, br", "br"),
+            ("gzip", "gzip"),
+            ("identity", None),
+        ):
+            response = self.app.get(
+                f"/dist/{hashed}", headers={"Accept-Encoding": accept}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "text/css")
+            self.assertEqual(response.content_encoding, encoding)
+            self.assertIn("Accept-Encoding", response.vary)
+            self.assertTrue(response.cache_control.immutable)
+            self.assertEqual(response.cache_control.max_age, 365 * 86400)
+            data = response.get_data()
+            if encoding == "gzip":
+                data = gzip.decompress(data)
+            elif encoding == "br":
+                data = brotli.decompress(data)
+            self.assertEqual(data, original)
+            response.close()
+
+        self.assertEqual(self.app.get("/dist/missing.css").status_code, 404)
+
+    def test_streamed_compressed_pages(self):
+        """Test that list pages stream, compress and still get cached."""
+        app.config["STREAM_TEMPLATES"] = True
+        self.addCleanup(app.config.__setitem__, "STREAM_TEMPLATES", False)
+        create_tutorial()
+        create_resource()
+
+        # Streamed, the page's length isn't known until it's sent
+        response = self.app.get("/resources")
+        self.assertIsNone(response.content_length)
+        page = response.get_data(as_text=True)
+        self.assertIn("Test Resource", page)
+        etag = response.headers["ETag"]
+
+        # Once sent whole the page was cached, and comes back compressed
+        response = self.app.get(
+            "/resources", headers={"Accept-Encoding": "br"}
+        )
+        self.assertIsNotNone(response.content_length)
+        self.assertEqual(response.content_encoding, "br")
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(brotli.decompress(response.get_data()).decode(), page)
+        self.assertEqual(response.headers["ETag"], f"W/{etag}")
+        response = self.app.get(
+            "/resources", headers={"If-None-Match": f"W/{etag}"}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # A streamed page is compressed chunk by chunk
+        response = self.app.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertIsNone(response.content_length)
+        self.assertEqual(response.content_encoding, "gzip")
+        page = gzip.decompress(response.get_data()).decode()
+        self.assertIn("Test Tutorial", page)
+        self.assertEqual(self.app.get("/").get_data(as_text=True), page)
+
+        # Small bodies aren't worth compressing
+        response = self.app.get(
+            "/api/titles/suggest?q=", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertIsNone(response.content_encoding)
+
+
+class LinkCheckTests(unittest.TestCase):
+    """Tests for the resource link checker."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = app.test_client()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubLinkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def add_resources(self, paths):
+        for path in paths:
+            db.session.add(
+                Resource(
+                    category=TutorialCategory.OTHER,
+                    title=f"Resource {path}",
+                    description="Test resource",
+                    link=self.base + path,
+                )
+            )
+        db.session.commit()
+
+    def test_check_links_records_status(self):
+        """Test that statuses, latency and check times are stored."""
+        # Nothing listens on port 9 of localhost, so that link is down
+        self.add_resources(["/ok", "/gone", "/no-head"])
+        db.session.add(
+            Resource(title="Down", link="http://127.0.0.1:9/", description="")
+        )
+        db.session.commit()
+        updated_at = Resource.query.get(1).updated_at
+
+        with app.app_context():
+            self.assertEqual(linkcheck.check_links(), 4)
+            # Fresh checks aren't due again
+            self.assertEqual(linkcheck.check_links(), 0)
+
+        statuses = [
+            r.link_status for r in Resource.query.order_by(Resource.id)
+        ]
+        self.assertEqual(statuses, [200, 404, 200, None])
+        resource = Resource.query.get(1)
+        self.assertIsNotNone(resource.link_checked_at)
+        self.assertGreaterEqual(resource.link_latency_ms, 0)
+        self.assertEqual(resource.updated_at, updated_at)
+        self.assertEqual(resource.version, 1)
+
+        response_text = self.app.get("/resources").get_data(as_text=True)
+        self.assertEqual(response_text.count("Link may be broken"), 2)
+
+        app.config["HIDE_BROKEN_LINKS"] = True
+        self.addCleanup(app.config.__setitem__, "HIDE_BROKEN_LINKS", False)
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        response_text = self.app.get("/resources").get_data(as_text=True)
+        self.assertIn("Resource /ok", response_text)
+        self.assertNotIn("Resource /gone", response_text)
+        self.assertNotIn("Link may be broken", response_text)
+
+    def test_probe_links_limits_each_host(self):
+        """Test that one host never sees more than its share of probes."""
+        StubLinkHandler.most_in_flight = 0
+        results = linkcheck.probe_links(
+            [self.base + "/slow"] * 6, concurrency=6, per_host=2, timeout=5
+        )
+        self.assertEqual([status for status, _ in results], [200] * 6)
+        self.assertLessEqual(StubLinkHandler.most_in_flight, 2)
+        self.assertGreater(min(latency for _, latency in results), 0)
+
+
+class ProfilingTests(unittest.TestCase):
+    """Tests for the request profiler and /metrics."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = app.test_client()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
+        profiler.clear()
+        app.config["PROFILING"] = True
+        self.addCleanup(app.config.__setitem__, "PROFILING", False)
+
+    def test_metrics_off_by_default(self):
+        """Test that nothing is recorded or served unless enabled."""
+        app.config["PROFILING"] = False
+        self.app.get("/")
+        self.assertEqual(self.app.get("/metrics").status_code, 404)
+        self.assertEqual(profiler.requests.expose().count("\n"), 1)
+
+    def test_metrics_per_endpoint(self):
+        """Test that wall time, SQL, templates and bcrypt are recorded."""
+        create_tutorial()
+        create_user()
+        self.app.get("/")
+        self.app.get("/")
+        signin(self.app, "testuser", "password")
+
+        metrics = self.app.get("/metrics").get_data(as_text=True)
+        # Signing in redirects to the homepage, a third request
+        self.assertIn(
+            'http_request_duration_seconds_count{endpoint="main.homepage"} 3',
+            metrics,
+        )
+        # The first visit reads the page's token, finds none and makes
+        # one, then reads the tutorials; the cached visit only reads the
+        # token. Signed in, the page isn't cached, and loading the user
+        # and, on first use, the recommendations take two more.
+        self.assertIn(
+            'http_request_sql_queries_bucket{endpoint="main.homepage",'
+            'le="1"} 1',
+            metrics,
+        )
+        self.assertIn(
+            'http_request_sql_queries_sum{endpoint="main.homepage"} 8',
+            metrics,
+        )
+        for line in metrics.splitlines():
+            if line.startswith(
+                "http_request_section_duration_seconds_sum"
+                '{endpoint="auth.signin",section="bcrypt"}'
+            ):
+                self.assertGreater(float(line.split()[-1]), 0)
+                break
+        else:
+            self.fail("No bcrypt time recorded for signin")
+        self.assertIn('endpoint="main.homepage",section="template"', metrics)
+
+    def test_slow_requests_are_profiled(self):
+        """Test that sampled slow requests get their stats dumped."""
+        directory = tempfile.mkdtemp()
+        app.config.update(
+            PROFILING_SAMPLE_RATE=1,
+            PROFILING_SLOW_SECONDS=0,
+            PROFILING_DIR=directory,
+        )
+        self.addCleanup(
+            app.config.update,
+            PROFILING_SAMPLE_RATE=0,
+            PROFILING_SLOW_SECONDS=1,
+            PROFILING_DIR="profiles",
+        )
+        self.app.get("/")
+
+        dumps = os.listdir(directory)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].startswith("main.homepage-"))
+        for name in dumps:
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+class ReplicaTests(unittest.TestCase):
+    """Tests for routing read-only requests to a replica."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        self.context = replica_app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.app = replica_app.test_client()
+        self.replica = db.get_engine(replica_app, bind="replica-0")
+        for bind in (db.engine, self.replica):
+            db.Model.metadata.drop_all(bind=bind)
+            db.Model.metadata.create_all(bind=bind)
+        page_cache.clear()
+        user_cache.clear()
+        related_index.clear()
+        recommender.clear()
+        title_index.build()
+
+        # The replica holds a tutorial the primary doesn't, so pages
+        # show which database they were read from
+        create_user()
+        session = orm.Session(bind=self.replica)
+        session.add(
+            User(username="testuser", password=User.query.one().password)
+        )
+        tutorial = Tutorial(
+            category=TutorialCategory.ML,
+            title="Replica Tutorial",
+            difficulty=Difficulty.BEGINNER,
+            body="Test body",
+        )
+        rendering.render_tutorial(tutorial)
+        session.add(tutorial)
+        session.commit()
+        session.close()
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        """Test that a user reads their own writes, then the replica."""
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("Replica Tutorial", response_text)
+
+        signin(self.app, "testuser", "password")
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("Replica Tutorial", response_text)
+
+        # The new tutorial is only on the primary, yet its page loads
+        response = self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="DL",
+                title="Convolutions",
+                difficulty="BEGINNER",
+                body="Training convolutional networks on images",
+            ),
+            follow_redirects=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Convolutions", response.get_data(as_text=True))
+        self.assertEqual(Tutorial.query.count(), 1)
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("Convolutions", response_text)
+        self.assertNotIn("Replica Tutorial", response_text)
+
+        with self.app.session_transaction() as session:
+            session[PRIMARY_UNTIL] = 0
+        response_text = self.app.get("/").get_data(as_text=True)
+        self.assertIn("Replica Tutorial", response_text)
+        with self.app.session_transaction() as session:
+            self.assertNotIn(PRIMARY_UNTIL, session)
+
+    def test_fresh_replica_pages_are_not_cached(self):
+        """Test that pages aren't cached from a replica that may lag."""
+        self.app.get("/")
+        self.replica.execute(
+            Tutorial.__table__.update().values(title="Renamed")
+        )
+        self.assertIn("Renamed", self.app.get("/").get_data(as_text=True))
+
+        replica_app.config["REPLICA_LAG_SECONDS"] = 0
+        self.addCleanup(
+            replica_app.config.__setitem__, "REPLICA_LAG_SECONDS", 60
+        )
+        self.app.get("/")
+        self.replica.execute(
+            Tutorial.__table__.update().values(title="Renamed again")
+        )
+        self.assertNotIn(
+            "Renamed again", self.app.get("/").get_data(as_text=True)
+        )
+
+
+class SharedPageCacheTests(unittest.TestCase):
+    """Tests for page cache invalidation across worker processes."""
+
+    def setUp(self):
+        """Executed prior to each test."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        class SharedConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(
+                directory.name, "shared.db"
+            )
+            RELATED_INDEX_PATH = os.path.join(directory.name, "related.npz")
+
+        # Apps on one database stand in for two workers and a flask
+        # command, each with a page cache of its own
+        self.web, self.other, self.command = [
+            create_app(SharedConfig) for _ in range(3)
+        ]
+        for process in (self.web, self.other, self.command):
+            self.addCleanup(db.get_engine(process).dispose)
+        with self.web.app_context():
+            db.create_all()
+            create_user()
+        self.app = self.web.test_client()
+        signin(self.app, "testuser", "password")
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Regression",
+                difficulty="BEGINNER",
+                body="Least squares",
+            ),
+        )
+
+    def test_invalidation_reaches_other_workers(self):
+        """Test that a write in one worker refreshes another's pages."""
+        reader = self.other.test_client()
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Least squares", response_text)
+
+        self.app.post(
+            "/tutorials/edit/1",
+            data=dict(
+                category="ML",
+                title="Regression",
+                difficulty="BEGINNER",
+                body="Gradient descent",
+            ),
+        )
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Gradient descent", response_text)
+        self.assertNotIn("Least squares", response_text)
+
+    def test_link_checks_reach_workers(self):
+        """Test that flask check-links refreshes the workers' pages."""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubLinkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.app.post(
+            "/new_resource",
+            data=dict(
+                category="OTHER",
+                title="Gone",
+                description="Test resource",
+                link=f"http://127.0.0.1:{server.server_port}/gone",
+            ),
+        )
+        reader = self.other.test_client()
+        response_text = reader.get("/resources").get_data(as_text=True)
+        self.assertNotIn("Link may be broken", response_text)
+
+        with self.command.app_context():
+            self.assertEqual(linkcheck.check_links(), 1)
+        response_text = reader.get("/resources").get_data(as_text=True)
+        self.assertIn("Link may be broken", response_text)
+
+    def test_rerenders_reach_workers(self):
+        """Test that flask rerender-tutorials refreshes the workers' pages."""
+        reader = self.other.test_client()
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Least squares", response_text)
+
+        # A body changed behind the app's back only shows once re-rendered
+        with self.command.app_context():
+            Tutorial.query.get(1).body = "Gradient descent"
+            db.session.commit()
+            self.assertIn(
+                "Least squares",
+                reader.get("/tutorials/1").get_data(as_text=True),
+            )
+            self.assertEqual(rendering.rerender_all(), 1)
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Gradient descent", response_text)
+
+    def test_imports_reach_workers(self):
+        """Test that flask import-content refreshes the workers' pages."""
+        reader = self.other.test_client()
+        response_text = reader.get("/tutorials").get_data(as_text=True)
+        self.assertNotIn("Imported", response_text)
+
+        record = dict(
+            category="ML",
+            title="Imported",
+            difficulty="EXPERT",
+            body="Test body",
+        )
+        with self.command.app_context():
+            self.assertEqual(
+                bulk.import_records("tutorials", [(1, record)])[0], 1
+            )
+        response_text = reader.get("/tutorials").get_data(as_text=True)
+        self.assertIn("Imported", response_text)
+
+    def test_related_rebuilds_reach_workers(self):
+        """Test that flask rebuild-related refreshes the workers' pages."""
+        self.app.post(
+            "/new_tutorial",
+            data=dict(
+                category="ML",
+                title="Ridge regression",
+                difficulty="BEGINNER",
+                body="Least squares with a penalty",
+            ),
+        )
+        reader = self.other.test_client()
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Ridge regression", response_text)
+
+        # A title changed behind the app's back shows after a rebuild
+        with self.command.app_context():
+            Tutorial.query.get(2).title = "Lasso regression"
+            db.session.commit()
+        runner = self.command.test_cli_runner()
+        result = runner.invoke(args=["rebuild-related"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        response_text = reader.get("/tutorials/1").get_data(as_text=True)
+        self.assertIn("Lasso regression", response_text)
+
+
+class BenchmarkTests(unittest.TestCase):
+    """Smoke runs of the route benchmark."""
+
+    def test_cold_run(self):
+        """Test that a benchmark run with an emptied page cache finishes."""
+        command = [sys.executable, "-m", "benchmarks.routes", "--cold"]
+        for option in ("tutorials", "resources", "users", "saves"):
+            command += [f"--{option}", "10"]
+        command += ["--requests", "2", "--only", "homepage", "resources"]
+        finished = subprocess.run(
+            command,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(finished.returncode, 0, finished.stderr)
+        self.assertIn("homepage", finished.stdout)
@@ -1,5 +1,8 @@
 """Database models for SQLAlchemy."""
+from datetime import datetime
+
 from flask_login import UserMixin
+from sqlalchemy.orm import load_only
 from tutorial_app import db
 
 from tutorial_app.utils import FormEnum
@@ -27,12 +30,23 @@ class User(UserMixin, db.Model):
     """User model."""
 
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(20), nullable=False)
+    username = db.Column(
+        db.String(20), nullable=False, unique=True, index=True
+    )
     password = db.Column(db.String(160), nullable=False)
     saved_tutorials = db.relationship(
         "Tutorial", secondary="saved_tutorials", back_populates="saved_by"
     )
 
+    def has_saved(self, tutorial_id):
+        """Return whether this user saved the tutorial, via the primary key."""
+        return (
+            db.session.query(saved_tutorial_table)
+            .filter_by(tutorial_id=tutorial_id, user_id=self.id)
+            .first()
+            is not None
+        )
+
 
 class Tutorial(db.Model):
     """Tutorial model."""
@@ -46,12 +60,59 @@ class Tutorial(db.Model):
         db.Enum(Difficulty), default=Difficulty.INTERMEDIATE
     )
     body = db.Column(db.String(10000), nullable=False)
+    # Rendered by tutorial_app.rendering when the body is saved
+    body_html = db.Column(db.Text, nullable=True)
+    body_hash = db.Column(db.String(64), nullable=True)
+    section_count = db.Column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+    version = db.Column(db.Integer, nullable=False)
+    # Maintained by tutorial_app.popularity alongside saved_tutorials
+    save_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    trending_score = db.Column(
+        db.Float, nullable=False, default=0.0, server_default="0"
+    )
     saved_by = db.relationship(
         "User",
         secondary="saved_tutorials",
         back_populates="saved_tutorials",
     )
 
+    __table_args__ = (
+        db.Index("ix_tutorial_save_count", "save_count", "id"),
+        db.Index("ix_tutorial_trending_score", "trending_score", "id"),
+        # Browsing by category, difficulty or both, in id order
+        db.Index(
+            "ix_tutorial_category_difficulty", "category", "difficulty", "id"
+        ),
+        db.Index("ix_tutorial_difficulty", "difficulty", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+    @classmethod
+    def card_query(cls):
+        """Query loading only the columns shown on a tutorial card."""
+        return cls.query.options(
+            load_only(
+                "id",
+                "title",
+                "category",
+                "difficulty",
+                "version",
+                "updated_at",
+                "save_count",
+                "section_count",
+            )
+        )
+
 
 class Resource(db.Model):
     """Resource model."""
@@ -63,10 +124,101 @@ class Resource(db.Model):
     title = db.Column(db.String(40), nullable=False)
     description = db.Column(db.String(120), nullable=True)
     link = db.Column(db.String(120), nullable=False)
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+    version = db.Column(db.Integer, nullable=False)
+    # Written by tutorial_app.linkcheck; a null status means no response
+    link_status = db.Column(db.Integer, nullable=True)
+    link_latency_ms = db.Column(db.Integer, nullable=True)
+    link_checked_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    __table_args__ = (db.Index("ix_resource_category", "category", "id"),)
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def link_broken(self):
+        """Whether the last check of the link failed."""
+        return self.link_checked_at is not None and not (
+            self.link_status is not None and 200 <= self.link_status < 400
+        )
+
+    @classmethod
+    def link_ok(cls):
+        """SQL condition for resources whose link isn't known to be broken."""
+        return db.or_(
+            cls.link_checked_at.is_(None), cls.link_status.between(200, 399)
+        )
+
+
+class Change(db.Model):
+    """The latest write to one tutorial or resource, for the change feed.
+
+    Written by tutorial_app.changes; see there.
+    """
+
+    __tablename__ = "change_log"
+
+    seq = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_change_log_item", "kind", "item_id", unique=True),
+        # Without AUTOINCREMENT SQLite would hand the number of a deleted
+        # last entry out again, and clients past it would miss the change
+        {"sqlite_autoincrement": True},
+    )
 
 
+# The primary key serves lookups by tutorial and the index lookups by user
 saved_tutorial_table = db.Table(
     "saved_tutorials",
-    db.Column("tutorial_id", db.Integer, db.ForeignKey("tutorial.id")),
-    db.Column("user_id", db.Integer, db.ForeignKey("user.id")),
+    db.Column(
+        "tutorial_id",
+        db.Integer,
+        db.ForeignKey("tutorial.id"),
+        primary_key=True,
+    ),
+    db.Column(
+        "user_id", db.Integer, db.ForeignKey("user.id"), primary_key=True
+    ),
+    db.Column(
+        "saved_at", db.DateTime, nullable=False, default=datetime.utcnow
+    ),
+    db.Index("ix_saved_tutorials_user_id", "user_id", "tutorial_id"),
+)
+
+
+# Sections of a tutorial a user has read, one bit each, written in
+# batches by tutorial_app.progress. The primary key leads with the user,
+# so one range scan reads a user's progress across many tutorials.
+tutorial_progress_table = db.Table(
+    "tutorial_progress",
+    db.Column(
+        "user_id", db.Integer, db.ForeignKey("user.id"), primary_key=True
+    ),
+    db.Column(
+        "tutorial_id",
+        db.Integer,
+        db.ForeignKey("tutorial.id"),
+        primary_key=True,
+    ),
+    db.Column("sections", db.BigInteger, nullable=False),
+    db.Column("updated_at", db.DateTime, nullable=False),
+    db.Index("ix_tutorial_progress_tutorial_id", "tutorial_id"),
+)
+
+
+# The current generation token of each cached-page namespace, so every
+# worker and command sees an invalidation; see tutorial_app.cache
+page_token_table = db.Table(
+    "page_token",
+    db.Column("namespace", db.String(128), primary_key=True),
+    db.Column("token", db.String(64), nullable=False),
 )
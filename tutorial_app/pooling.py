@@ -0,0 +1,33 @@
+"""Keep pooled database connections from crossing a fork."""
+import os
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool
+
+
+def _record_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get("pid") != os.getpid():
+        # Detach rather than close: closing would tear down the socket the
+        # parent process is still using.
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            "Connection belongs to pid %s, discarding in pid %s"
+            % (connection_record.info.get("pid"), os.getpid())
+        )
+
+
+def discard_connections_after_fork():
+    """Make every pool replace connections inherited from a parent process.
+
+    Under ``gunicorn --preload`` the app is imported in the master, so a
+    worker can inherit pooled connections. A connection checked out in a
+    different process than the one that opened it is dropped without
+    being closed, and the pool opens a fresh one.
+    """
+    if not event.contains(Pool, "connect", _record_pid):
+        event.listen(Pool, "connect", _record_pid)
+        event.listen(Pool, "checkout", _check_pid)
@@ -0,0 +1,156 @@
+"""Denormalized save counters behind the popularity listings.
+
+Each tutorial keeps a ``save_count`` and a ``trending_score`` next to its
+row, both indexed, so the "most saved" and "trending" listings are plain
+index scans instead of a GROUP BY over ``saved_tutorials``.
+
+The trending score ranks by a sum of exponentially growing weights, one
+per save: a save made ``TRENDING_HALF_LIFE_DAYS`` later counts twice as
+much. Ordering by that sum is the same as ordering by a score where every
+save decays with that half-life, without ever rewriting old rows. The
+sums outgrow a float within years, so the score is their logarithm and
+weights are added and taken off in log space.
+"""
+import math
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam
+
+from tutorial_app import db
+from tutorial_app.models import Tutorial, saved_tutorial_table
+
+# Weights are 2 ** half-lives since this moment
+EPOCH = datetime(2021, 1, 1)
+
+# Taking off a save that's more than this share of the sum would leave
+# too few significant digits, so the rest is summed again from its rows
+CANCELLATION = 0.999
+
+
+def save_weight(saved_at):
+    """Return the log of the trending weight of a save at ``saved_at``."""
+    half_life = current_app.config["TRENDING_HALF_LIFE_DAYS"] * 86400
+    return math.log(2) * (saved_at - EPOCH).total_seconds() / half_life
+
+
+def log_sum(weights):
+    """Return the log of the sum of weights given by their logs.
+
+    A tutorial nobody saved scores 0; its ``save_count`` tells it apart.
+    """
+    weights = list(weights)
+    if not weights:
+        return 0.0
+    top = max(weights)
+    return top + math.log(sum(math.exp(weight - top) for weight in weights))
+
+
+def _counters(tutorial_id):
+    """Read a tutorial's counters, locking its row until commit."""
+    return (
+        db.session.query(Tutorial.save_count, Tutorial.trending_score)
+        .filter(Tutorial.id == tutorial_id)
+        .with_for_update()
+        .one()
+    )
+
+
+def _store(tutorial_id, save_count, score):
+    tutorial = Tutorial.__table__
+    db.session.execute(
+        tutorial.update()
+        .where(tutorial.c.id == tutorial_id)
+        .values(save_count=save_count, trending_score=score)
+    )
+
+
+def record_save(tutorial_id, user_id):
+    """Save a tutorial for a user and bump its counters.
+
+    Runs in the caller's transaction; a repeated save raises
+    ``IntegrityError`` from the primary key before any counter moves.
+    """
+    saved_at = datetime.utcnow()
+    db.session.execute(
+        saved_tutorial_table.insert().values(
+            tutorial_id=tutorial_id, user_id=user_id, saved_at=saved_at
+        )
+    )
+    save_count, score = _counters(tutorial_id)
+    weight = save_weight(saved_at)
+    if save_count:
+        weight = max(score, weight) + math.log1p(
+            math.exp(-abs(score - weight))
+        )
+    _store(tutorial_id, save_count + 1, weight)
+
+
+def record_unsave(tutorial_id, user_id):
+    """Remove a user's save and take its weight back off the counters.
+
+    Returns whether there was a save to remove.
+    """
+    saved = saved_tutorial_table
+    match = (saved.c.tutorial_id == tutorial_id) & (
+        saved.c.user_id == user_id
+    )
+    saved_at = db.session.execute(
+        db.select([saved.c.saved_at]).where(match)
+    ).scalar()
+    if saved_at is None:
+        return False
+    # Only the request that actually deleted the row may decrement
+    if not db.session.execute(saved.delete().where(match)).rowcount:
+        return False
+    save_count, score = _counters(tutorial_id)
+    share = math.exp(min(save_weight(saved_at) - score, 0.0))
+    if save_count <= 1:
+        score = 0.0
+    elif share < CANCELLATION:
+        score += math.log1p(-share)
+    else:
+        score = log_sum(
+            save_weight(row.saved_at)
+            for row in db.session.execute(
+                db.select([saved.c.saved_at]).where(
+                    saved.c.tutorial_id == tutorial_id
+                )
+            )
+        )
+    _store(tutorial_id, save_count - 1, score)
+    return True
+
+
+def reconcile(chunk=1000):
+    """Recompute every tutorial's counters from ``saved_tutorials``."""
+    tutorial = Tutorial.__table__
+    saved = saved_tutorial_table
+    db.session.execute(
+        tutorial.update().values(
+            save_count=db.select([db.func.count()])
+            .where(saved.c.tutorial_id == tutorial.c.id)
+            .as_scalar(),
+            trending_score=0.0,
+        )
+    )
+    # SQLite may lack exp() and log(), so the sums are taken here
+    weights = {}
+    rows = db.session.execute(
+        db.select([saved.c.tutorial_id, saved.c.saved_at])
+    )
+    for tutorial_id, saved_at in rows:
+        weights.setdefault(tutorial_id, []).append(save_weight(saved_at))
+    update = (
+        tutorial.update()
+        .where(tutorial.c.id == bindparam("tutorial_id"))
+        .values(trending_score=bindparam("score"))
+    )
+    params = [
+        {"tutorial_id": tutorial_id, "score": log_sum(tutorial_weights)}
+        for tutorial_id, tutorial_weights in weights.items()
+    ]
+    for start in range(0, len(params), chunk):
+        db.session.execute(update, params[start : start + chunk])
+    db.session.commit()
+    return len(params)
@@ -0,0 +1,259 @@
+"""Opt-in per-endpoint timing, exposed as Prometheus histograms.
+
+With ``PROFILING`` on, every request records its wall time, how many
+SQL statements it ran and how long they took, and time spent rendering
+templates and hashing passwords. Each is observed into a histogram
+labelled with the endpoint and served in the Prometheus text format at
+``/metrics``. The numbers are per worker process; Prometheus sums them
+across workers when it scrapes each one.
+
+``PROFILING_SAMPLE_RATE`` runs that share of requests under cProfile,
+and any sampled request slower than ``PROFILING_SLOW_SECONDS`` has its
+stats written to ``PROFILING_DIR`` for ``python -m pstats`` or snakeviz.
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import (
+    Response,
+    abort,
+    before_render_template,
+    current_app,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus' default buckets, in seconds
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Stats of the request the current thread is serving, if it's profiled
+_current = threading.local()
+
+
+class RequestStats(object):
+    """What one request has spent its time on so far."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sections = {}
+        self.profile = None
+
+    def add(self, section, seconds):
+        self.sections[section] = self.sections.get(section, 0.0) + seconds
+
+
+@contextmanager
+def section(name):
+    """Time a block and charge it to ``name`` on the current request."""
+    stats = getattr(_current, "stats", None)
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add(name, time.perf_counter() - started)
+
+
+class Histogram(object):
+    """A labelled histogram in the Prometheus exposition format."""
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels: [count per bucket..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[labels] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, values in series:
+            label_text = ",".join(
+                '{}="{}"'.format(name, _escape(value))
+                for name, value in zip(self.label_names, labels)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'{self.name}_bucket{{{label_text},le="+Inf"}} {values[-1]}'
+            )
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-1]}")
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, params, context, many):
+    if getattr(_current, "stats", None) is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, params, context, many):
+    stats = getattr(_current, "stats", None)
+    started = conn.info.get("query_started")
+    if stats is not None and started:
+        stats.queries += 1
+        stats.add("sql", time.perf_counter() - started.pop())
+
+
+def _before_render(sender, template, context, **extra):
+    if getattr(_current, "stats", None) is not None:
+        _current.template_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    stats = getattr(_current, "stats", None)
+    started = getattr(_current, "template_started", None)
+    if stats is not None and started is not None:
+        stats.add("template", time.perf_counter() - started)
+        _current.template_started = None
+
+
+class RequestProfiler(object):
+    """Collect per-endpoint request metrics while ``PROFILING`` is on.
+
+    The hooks are always installed but do nothing unless the setting is
+    on when a request starts, and ``/metrics`` is a 404 while it's off.
+    """
+
+    def __init__(self, app=None):
+        self.requests = Histogram(
+            "http_request_duration_seconds",
+            "Wall time spent serving a request.",
+            ("endpoint",),
+            TIME_BUCKETS,
+        )
+        self.queries = Histogram(
+            "http_request_sql_queries",
+            "SQL statements executed by a request.",
+            ("endpoint",),
+            COUNT_BUCKETS,
+        )
+        self.sections = Histogram(
+            "http_request_section_duration_seconds",
+            "Time a request spent in SQL, templates or password hashing.",
+            ("endpoint", "section"),
+            TIME_BUCKETS,
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self._metrics)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_rendered, app)
+        if not event.contains(
+            Engine, "before_cursor_execute", _before_cursor_execute
+        ):
+            event.listen(
+                Engine, "before_cursor_execute", _before_cursor_execute
+            )
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def clear(self):
+        for histogram in (self.requests, self.queries, self.sections):
+            histogram.clear()
+
+    def _start(self):
+        _current.stats = None
+        config = current_app.config
+        if not config.get("PROFILING"):
+            return
+        stats = _current.stats = RequestStats()
+        if random.random() < config.get("PROFILING_SAMPLE_RATE", 0):
+            stats.profile = cProfile.Profile()
+            stats.profile.enable()
+
+    def _finish(self, exc):
+        stats = getattr(_current, "stats", None)
+        _current.stats = None
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or "none"
+        self.requests.observe((endpoint,), elapsed)
+        self.queries.observe((endpoint,), stats.queries)
+        for name in ("sql", "template", "bcrypt"):
+            self.sections.observe(
+                (endpoint, name), stats.sections.get(name, 0.0)
+            )
+        if stats.profile is not None:
+            stats.profile.disable()
+            if elapsed >= current_app.config.get("PROFILING_SLOW_SECONDS", 1):
+                self._dump(stats, endpoint, elapsed)
+
+    def _dump(self, stats, endpoint, elapsed):
+        directory = current_app.config.get("PROFILING_DIR", "profiles")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory,
+            "{}-{:%Y%m%dT%H%M%S%f}.prof".format(endpoint, datetime.utcnow()),
+        )
+        stats.profile.dump_stats(path)
+        current_app.logger.warning(
+            "Slow request to %s took %.3fs (%d queries, %.3fs SQL); "
+            "profile written to %s",
+            endpoint,
+            elapsed,
+            stats.queries,
+            stats.sections.get("sql", 0.0),
+            path,
+        )
+
+    def _metrics(self):
+        if not current_app.config.get("PROFILING"):
+            abort(404)
+        body = "\n".join(
+            histogram.expose()
+            for histogram in (self.requests, self.queries, self.sections)
+        )
+        return Response(body + "\n", mimetype="text/plain; version=0.0.4")
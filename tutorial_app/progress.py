@@ -0,0 +1,185 @@
+"""Per-user reading progress through tutorials.
+
+The tutorial page pings once for each section the reader scrolls past.
+Pings are coalesced in memory: each user and tutorial has one pending
+set of section bits, and repeated pings just OR into it. The pending
+sets are written out together, as one executemany of upserts that OR
+into the stored bits, when ``PROGRESS_FLUSH_SECONDS`` have passed since
+the first pending ping or ``PROGRESS_MAX_PENDING`` sets are waiting,
+whichever comes first.
+
+Pending pings live in the worker that received them, so until a flush
+other workers see a user's progress a little behind. The worker that
+took the ping folds its pending bits into every read.
+"""
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from tutorial_app import db
+from tutorial_app.models import tutorial_progress_table
+
+# Both SQLite and Postgres take this upsert. Rows for tutorials deleted
+# since the ping are skipped.
+UPSERT_SQL = (
+    "INSERT INTO tutorial_progress "
+    "(user_id, tutorial_id, sections, updated_at) "
+    "SELECT :user_id, :tutorial_id, :sections, :updated_at "
+    "WHERE EXISTS (SELECT 1 FROM tutorial WHERE id = :tutorial_id) "
+    "ON CONFLICT (user_id, tutorial_id) DO UPDATE SET "
+    "sections = tutorial_progress.sections | excluded.sections, "
+    "updated_at = excluded.updated_at"
+)
+
+
+def percent_complete(sections, section_count):
+    """Return the share of ``section_count`` sections set in the bits."""
+    read = bin(sections & ((1 << section_count) - 1)).count("1")
+    return read * 100 // section_count
+
+
+def completed_sections(sections, section_count):
+    """Return the numbers of the sections set in the bits."""
+    return [
+        section for section in range(section_count) if sections >> section & 1
+    ]
+
+
+def remove(tutorial_id):
+    """Delete every user's progress through a tutorial being deleted.
+
+    Runs in the caller's transaction. Pending pings for the tutorial are
+    dropped by the upsert once it's gone.
+    """
+    db.session.execute(
+        tutorial_progress_table.delete().where(
+            tutorial_progress_table.c.tutorial_id == tutorial_id
+        )
+    )
+
+
+class ProgressBuffer(object):
+    """Coalesce progress pings and write them to the database in batches.
+
+    ``PROGRESS_FLUSH_SECONDS`` of None turns off the flush timer, leaving
+    flushes to ``PROGRESS_MAX_PENDING`` and explicit ``flush`` calls; the
+    tests use that. Call ``flush`` before a worker exits so its pending
+    pings aren't lost. Each app buffers its own pings, in
+    ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["progress_buffer"] = _Pending(
+            flush_seconds=app.config.get("PROGRESS_FLUSH_SECONDS", 5),
+            max_pending=app.config.get("PROGRESS_MAX_PENDING", 1000),
+        )
+
+    @property
+    def state(self):
+        """The current app's pending pings and settings."""
+        return current_app.extensions["progress_buffer"]
+
+    def record(self, user_id, tutorial_id, section):
+        """Note that a user has read one section of a tutorial."""
+        state = self.state
+        with state.lock:
+            key = (user_id, tutorial_id)
+            state.pings[key] = state.pings.get(key, 0) | 1 << section
+            full = len(state.pings) >= state.max_pending
+            if (
+                not full
+                and state.timer is None
+                and state.flush_seconds is not None
+            ):
+                state.timer = threading.Timer(
+                    state.flush_seconds,
+                    self._flush_later,
+                    [current_app._get_current_object()],
+                )
+                state.timer.daemon = True
+                state.timer.start()
+        if full:
+            self.flush()
+
+    def sections(self, user_id, tutorial_ids):
+        """Return the section bits a user has read, by tutorial id.
+
+        Stored and pending progress are combined; tutorials the user
+        hasn't started are left out.
+        """
+        if not tutorial_ids:
+            return {}
+        table = tutorial_progress_table
+        found = dict(
+            db.session.execute(
+                db.select([table.c.tutorial_id, table.c.sections]).where(
+                    (table.c.user_id == user_id)
+                    & table.c.tutorial_id.in_(tutorial_ids)
+                )
+            ).fetchall()
+        )
+        state = self.state
+        with state.lock:
+            for tutorial_id in tutorial_ids:
+                pending = state.pings.get((user_id, tutorial_id))
+                if pending:
+                    found[tutorial_id] = found.get(tutorial_id, 0) | pending
+        return found
+
+    def flush(self):
+        """Write out every pending ping; return how many sets were written."""
+        state = self.state
+        with state.lock:
+            pending, state.pings = state.pings, {}
+            timer, state.timer = state.timer, None
+        if timer is not None:
+            timer.cancel()
+        if not pending:
+            return 0
+        updated_at = datetime.utcnow()
+        try:
+            db.session.execute(
+                text(UPSERT_SQL),
+                [
+                    {
+                        "user_id": user_id,
+                        "tutorial_id": tutorial_id,
+                        "sections": sections,
+                        "updated_at": updated_at,
+                    }
+                    for (user_id, tutorial_id), sections in pending.items()
+                ],
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Keep the pings for the next flush
+            with state.lock:
+                for key, sections in pending.items():
+                    state.pings[key] = state.pings.get(key, 0) | sections
+            raise
+        return len(pending)
+
+    def _flush_later(self, app):
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                app.logger.exception("Couldn't write reading progress")
+
+
+class _Pending(object):
+    """One app's pending section bits, by user and tutorial."""
+
+    def __init__(self, flush_seconds, max_pending):
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.pings = {}
+        self.lock = threading.Lock()
+        self.timer = None
@@ -0,0 +1,254 @@
+"""Item-to-item "saved this also saved" recommendations.
+
+``saved_tutorials`` is read as a sparse users-by-tutorials matrix of
+ones. Multiplying its transpose by it counts, for every two tutorials,
+how many users saved both; dividing by the square root of each one's
+saves makes that a cosine, so a tutorial everyone saves doesn't top
+every list. The ``RECOMMENDATION_NEIGHBOURS`` best of each tutorial are
+kept in a compact table of numpy arrays, a row per tutorial.
+
+A user's recommendations add up the rows of the tutorials they saved,
+leaving out what they already have. That reads the user's saves by
+index and the table in memory; nothing is aggregated per request.
+
+``flask compute-recommendations`` rebuilds the table from every save
+and writes it to ``RECOMMENDATIONS_PATH`` in the instance folder. Run
+it on a schedule; workers load the file as they start and again when
+it's replaced. Without the file a worker computes the table itself as
+it starts.
+"""
+import os
+from array import array
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+
+# Tutorials whose co-saves are multiplied out at a time
+CHUNK = 1024
+
+
+def co_saves(users, tutorials, count, chunk=CHUNK):
+    """Return each tutorial's ``count`` most co-saved tutorials.
+
+    ``users`` and ``tutorials`` are parallel arrays of saves. Returns
+    ``(ids, neighbours, scores)``: the sorted tutorial ids, and for the
+    tutorial in each row its neighbours' ids, best first and padded
+    with -1, and their cosine scores.
+    """
+    ids, columns = np.unique(tutorials, return_inverse=True)
+    _, rows = np.unique(users, return_inverse=True)
+    neighbours = np.full((len(ids), count), -1, dtype=np.int64)
+    scores = np.zeros((len(ids), count), dtype=np.float32)
+    if not len(ids):
+        return ids, neighbours, scores
+    saves = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(rows.max() + 1, len(ids)),
+    )
+    norms = np.sqrt(np.asarray(saves.sum(axis=0)).ravel())
+    saved_by = saves.T.tocsr()
+    for start in range(0, len(ids), chunk):
+        together = (saved_by[start : start + chunk] @ saves).tocsr()
+        lengths = np.diff(together.indptr)
+        own = start + np.repeat(np.arange(len(lengths)), lengths)
+        together.data /= norms[own] * norms[together.indices]
+        together.data[together.indices == own] = 0
+        for offset in range(len(lengths)):
+            begin, end = together.indptr[offset], together.indptr[offset + 1]
+            row_scores = together.data[begin:end]
+            row_columns = together.indices[begin:end]
+            if len(row_scores) > count:
+                best = np.argpartition(-row_scores, count)[:count]
+                row_scores, row_columns = row_scores[best], row_columns[best]
+            order = np.argsort(-row_scores, kind="stable")
+            order = order[row_scores[order] > 0]
+            neighbours[start + offset, : len(order)] = ids[row_columns[order]]
+            scores[start + offset, : len(order)] = row_scores[order]
+    return ids, neighbours, scores
+
+
+class Recommender(object):
+    """The current app's recommendations.
+
+    Each app gets its own co-save table, in ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = app.config.get("RECOMMENDATIONS_PATH")
+        app.extensions["recommender"] = _CoSaves(
+            neighbours=app.config.get("RECOMMENDATION_NEIGHBOURS", 20),
+            path=os.path.join(app.instance_path, path) if path else None,
+        )
+
+    @property
+    def table(self):
+        return current_app.extensions["recommender"]
+
+    @property
+    def path(self):
+        return self.table.path
+
+    def __len__(self):
+        return len(self.table)
+
+    def build(self, chunk=10000):
+        self.table.build(chunk)
+
+    def save(self, path=None):
+        self.table.save(path)
+
+    def load(self, path=None):
+        self.table.load(path)
+
+    def clear(self):
+        self.table.clear()
+
+    def refresh(self):
+        self.table.refresh()
+
+    def recommend(self, saved_ids, limit):
+        return self.table.recommend(saved_ids, limit)
+
+    def for_user(self, user_id, limit):
+        return self.table.for_user(user_id, limit)
+
+
+class _CoSaves(object):
+    """Serve recommendations from a precomputed top-k co-save table.
+
+    The table is three arrays swapped in together, so lookups read it
+    without a lock.
+    """
+
+    def __init__(self, neighbours, path):
+        self.neighbours = neighbours
+        self.path = path
+        self.clear()
+
+    def __len__(self):
+        return len(self._table[0])
+
+    def build(self, chunk=10000):
+        """Recompute the table from every row of ``saved_tutorials``."""
+        from tutorial_app import db
+        from tutorial_app.models import saved_tutorial_table
+
+        table = saved_tutorial_table
+        users = array("q")
+        tutorials = array("q")
+        result = db.session.execute(
+            db.select(
+                [table.c.user_id, table.c.tutorial_id]
+            ).execution_options(stream_results=True)
+        )
+        while True:
+            rows = result.fetchmany(chunk)
+            if not rows:
+                break
+            for user_id, tutorial_id in rows:
+                users.append(user_id)
+                tutorials.append(tutorial_id)
+        self._table = co_saves(
+            np.frombuffer(users, dtype=np.int64),
+            np.frombuffer(tutorials, dtype=np.int64),
+            self.neighbours,
+        )
+        self._built = True
+
+    def save(self, path=None):
+        """Write the table to ``path``, replacing any earlier file whole."""
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        staging = f"{path}.{os.getpid()}.npz"
+        ids, neighbours, scores = self._table
+        np.savez_compressed(
+            staging, ids=ids, neighbours=neighbours, scores=scores
+        )
+        os.replace(staging, path)
+
+    def load(self, path=None):
+        """Replace the table with the one saved at ``path``."""
+        with np.load(path or self.path) as saved:
+            self._table = (saved["ids"], saved["neighbours"], saved["scores"])
+        self._built = True
+
+    def clear(self):
+        """Forget the table; the next lookup loads or builds it again."""
+        self._table = (
+            np.zeros(0, dtype=np.int64),
+            np.zeros((0, 0), dtype=np.int64),
+            np.zeros((0, 0), dtype=np.float32),
+        )
+        self._built = False
+        self._mtime = None
+
+    def recommend(self, saved_ids, limit):
+        """Return up to ``limit`` tutorial ids for someone who saved some.
+
+        Best first; tutorials in ``saved_ids`` are never recommended.
+        """
+        self.refresh()
+        ids, neighbours, scores = self._table
+        saved = np.unique(np.asarray(saved_ids, dtype=np.int64))
+        if not len(saved) or not len(ids):
+            return []
+        rows = np.searchsorted(ids, saved)
+        rows = rows[rows < len(ids)]
+        rows = rows[np.isin(ids[rows], saved)]
+        candidates = neighbours[rows].ravel()
+        weights = scores[rows].ravel()
+        keep = (candidates >= 0) & ~np.isin(candidates, saved)
+        candidates, positions = np.unique(
+            candidates[keep], return_inverse=True
+        )
+        totals = np.bincount(positions, weights=weights[keep])
+        best = np.argsort(-totals, kind="stable")[:limit]
+        return candidates[best].tolist()
+
+    def for_user(self, user_id, limit):
+        """Return up to ``limit`` tutorial cards recommended for a user."""
+        from tutorial_app import db
+        from tutorial_app.models import Tutorial, saved_tutorial_table
+
+        self.refresh()
+        if not len(self):
+            return []
+        table = saved_tutorial_table
+        saved_ids = [
+            tutorial_id
+            for tutorial_id, in db.session.execute(
+                db.select([table.c.tutorial_id]).where(
+                    table.c.user_id == user_id
+                )
+            )
+        ]
+        ids = self.recommend(saved_ids, limit)
+        if not ids:
+            return []
+        cards = {
+            tutorial.id: tutorial
+            for tutorial in Tutorial.card_query().filter(Tutorial.id.in_(ids))
+        }
+        # Tutorials deleted since the table was built drop out here
+        return [
+            cards[tutorial_id] for tutorial_id in ids if tutorial_id in cards
+        ]
+
+    def refresh(self):
+        """Load or build the table if this worker hasn't, or it's stale."""
+        mtime = None
+        if self.path is not None:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                pass
+        if mtime is not None and mtime != self._mtime:
+            self.load()
+            self._mtime = mtime
+        elif not self._built:
+            self.build()
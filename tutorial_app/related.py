@@ -0,0 +1,439 @@
+"""Content-based "related tutorials" from TF-IDF vectors.
+
+Every tutorial's title and body become one row of a sparse TF-IDF
+matrix with unit-length rows, so the dot product of two rows is their
+cosine similarity. The ``RELATED_COUNT`` most similar tutorials of each
+one are worked out ahead of time, and the detail page only reads them
+out of a dictionary.
+
+``flask rebuild-related`` computes the whole index offline and saves
+it to ``RELATED_INDEX_PATH`` in the instance folder and invalidates the
+``related`` page cache namespace, which every detail page depends on;
+workers load that file as they start and again on the first lookup
+after it's replaced. Without the file a worker builds the index itself
+from the database as it starts.
+
+Creating, editing or deleting a tutorial updates the index in place:
+the tutorial's row is re-vectorized against the saved vocabulary, and
+only tutorials whose neighbours it enters or leaves are re-ranked.
+Words the vocabulary hasn't seen count only after the next rebuild,
+and, as with the title index, each worker only sees the writes it
+handles itself until then.
+"""
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can for from has have how if in into "
+    "is it its not of on or so than that the their then there these this "
+    "to was we what when which will with you your".split()
+)
+
+# A word in the title counts as much as this many in the body
+TITLE_WEIGHT = 3
+
+# Rows are ranked against the whole matrix this many at a time
+CHUNK = 256
+
+
+def words(text):
+    """Return the indexable words of ``text``, lowercased, in order."""
+    return [
+        word
+        for word in re.findall(r"[a-z][a-z0-9+#]*", text.lower())
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def term_counts(title, body):
+    """Return how often each word appears in a tutorial, title weighted."""
+    counts = Counter(words(body))
+    for word in words(title):
+        counts[word] += TITLE_WEIGHT
+    return counts
+
+
+class RelatedIndex(object):
+    """The current app's related-tutorials index.
+
+    Each app gets its own index, in ``app.extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = app.config.get("RELATED_INDEX_PATH")
+        app.extensions["related_index"] = _Index(
+            count=app.config.get("RELATED_COUNT", 5),
+            path=os.path.join(app.instance_path, path) if path else None,
+        )
+
+    @property
+    def index(self):
+        return current_app.extensions["related_index"]
+
+    @property
+    def path(self):
+        return self.index.path
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, tutorial_id):
+        return self.index.lookup(tutorial_id)
+
+    def build(self):
+        self.index.build()
+
+    def save(self, path=None):
+        self.index.save(path)
+
+    def load(self, path=None):
+        self.index.load(path)
+
+    def add(self, tutorial_id, title, body):
+        return self.index.add(tutorial_id, title, body)
+
+    def add_many(self, tutorials):
+        return self.index.add_many(tutorials)
+
+    def remove(self, tutorial_id):
+        return self.index.remove(tutorial_id)
+
+    def clear(self):
+        self.index.clear()
+
+    def refresh(self):
+        self.index.refresh()
+
+
+class _Index(object):
+    """Precomputed nearest neighbours of every tutorial by TF-IDF cosine.
+
+    Holds the vocabulary and IDF weights, the row of each tutorial in
+    the matrix and its neighbours as ``(score, tutorial_id)`` pairs,
+    best first. Rows of deleted tutorials are emptied rather than
+    removed, until the next rebuild.
+    """
+
+    def __init__(self, count, path):
+        self.count = count
+        self.path = path
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, tutorial_id):
+        """Return ``(tutorial_id, title)`` of the tutorials most like one."""
+        self.refresh()
+        with self._lock:
+            return [
+                (related_id, self._titles[related_id])
+                for _, related_id in self._neighbours.get(tutorial_id, ())
+            ]
+
+    def build(self):
+        """Compute the whole index from every tutorial in the database."""
+        from tutorial_app import db
+        from tutorial_app.models import Tutorial
+
+        rows = db.session.query(Tutorial.id, Tutorial.title, Tutorial.body)
+        self._compute(rows.order_by(Tutorial.id).all())
+
+    def save(self, path=None):
+        """Write the index to ``path``, replacing any earlier file whole."""
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        staging = f"{path}.{os.getpid()}.npz"
+        with self._lock:
+            ids = self._row_ids()
+            neighbour_ids = np.full((len(ids), self.count), -1, np.int64)
+            neighbour_scores = np.zeros((len(ids), self.count))
+            for tutorial_id, row in self._rows.items():
+                for rank, (score, related_id) in enumerate(
+                    self._neighbours.get(tutorial_id, ())
+                ):
+                    neighbour_ids[row, rank] = related_id
+                    neighbour_scores[row, rank] = score
+            np.savez_compressed(
+                staging,
+                data=self._matrix.data,
+                indices=self._matrix.indices,
+                indptr=self._matrix.indptr,
+                shape=self._matrix.shape,
+                ids=ids,
+                titles=np.array(
+                    [self._titles.get(i, "") for i in ids.tolist()]
+                ),
+                terms=np.array(self._terms),
+                idf=self._idf,
+                neighbour_ids=neighbour_ids,
+                neighbour_scores=neighbour_scores,
+            )
+        os.replace(staging, path)
+
+    def load(self, path=None):
+        """Replace the index with the one saved at ``path``."""
+        path = path or self.path
+        with np.load(path) as saved:
+            matrix = sparse.csr_matrix(
+                (saved["data"], saved["indices"], saved["indptr"]),
+                shape=tuple(saved["shape"]),
+            )
+            ids = saved["ids"].tolist()
+            titles = saved["titles"].tolist()
+            terms = saved["terms"].tolist()
+            idf = saved["idf"]
+            neighbour_ids = saved["neighbour_ids"].tolist()
+            neighbour_scores = saved["neighbour_scores"].tolist()
+        with self._lock:
+            self._matrix = matrix
+            self._terms = terms
+            self._vocabulary = {term: i for i, term in enumerate(terms)}
+            self._idf = idf
+            self._rows = {}
+            self._titles = {}
+            self._neighbours = {}
+            for row, tutorial_id in enumerate(ids):
+                if tutorial_id < 0:
+                    continue
+                self._rows[tutorial_id] = row
+                self._titles[tutorial_id] = titles[row]
+                self._neighbours[tutorial_id] = [
+                    (score, related_id)
+                    for related_id, score in zip(
+                        neighbour_ids[row], neighbour_scores[row]
+                    )
+                    if related_id >= 0
+                ]
+            self._built = True
+
+    def add(self, tutorial_id, title, body):
+        """Index a new or edited tutorial.
+
+        Returns the ids of the other tutorials whose neighbours changed.
+        """
+        return self.add_many([(tutorial_id, title, body)])
+
+    def add_many(self, tutorials):
+        """Index ``(tutorial_id, title, body)`` rows in one pass."""
+        with self._lock:
+            # Before the first lookup the database is the only copy
+            if not self._built or not tutorials:
+                return set()
+            affected = set()
+            for tutorial_id, _, _ in tutorials:
+                affected |= self._drop(tutorial_id)
+            vectors = self._vectorize(
+                [term_counts(title, body) for _, title, body in tutorials]
+            )
+            start = self._matrix.shape[0]
+            self._matrix = sparse.vstack([self._matrix, vectors], format="csr")
+            new_ids = [tutorial_id for tutorial_id, _, _ in tutorials]
+            for offset, (tutorial_id, title, _) in enumerate(tutorials):
+                self._rows[tutorial_id] = start + offset
+                self._titles[tutorial_id] = title
+            self._rank_rows(np.arange(start, start + len(tutorials)))
+            # Offer the new tutorials to the lists of the older ones; at
+            # most ``count`` of them can get into any one list
+            ids = self._row_ids()
+            scores = (self._matrix[:start] @ vectors.T).tocsr()
+            for row in range(start):
+                begin, end = scores.indptr[row], scores.indptr[row + 1]
+                if begin == end or ids[row] < 0:
+                    continue
+                row_scores = scores.data[begin:end]
+                columns = scores.indices[begin:end]
+                if len(row_scores) > self.count:
+                    best = np.argpartition(-row_scores, self.count)
+                    best = best[: self.count]
+                    row_scores, columns = row_scores[best], columns[best]
+                for score, column in zip(row_scores, columns):
+                    if self._offer(int(ids[row]), new_ids[column], score):
+                        affected.add(int(ids[row]))
+            return affected - set(new_ids)
+
+    def remove(self, tutorial_id):
+        """Drop a tutorial from the index.
+
+        Returns the ids of the other tutorials whose neighbours changed.
+        """
+        with self._lock:
+            if not self._built:
+                return set()
+            return self._drop(tutorial_id)
+
+    def refresh(self):
+        """Load or build the index if this worker hasn't, or it's stale."""
+        mtime = None
+        if self.path is not None:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                pass
+        if mtime is not None and mtime != self._mtime:
+            self.load()
+            self._mtime = mtime
+        elif not self._built:
+            self.build()
+
+    def clear(self):
+        """Forget the index; the next lookup loads or builds it again."""
+        self._built = False
+        self._mtime = None
+        self._terms = []
+        self._vocabulary = {}
+        self._idf = np.zeros(0)
+        self._matrix = sparse.csr_matrix((0, 0))
+        self._rows = {}
+        self._titles = {}
+        self._neighbours = {}
+
+    def _compute(self, tutorials):
+        documents = [term_counts(title, body) for _, title, body in tutorials]
+        frequencies = Counter()
+        for counts in documents:
+            frequencies.update(counts.keys())
+        # A word in only one tutorial can't make two tutorials similar
+        terms = sorted(
+            term for term, count in frequencies.items() if count > 1
+        )
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        total = len(documents)
+        found_in = np.array([frequencies[term] for term in terms], float)
+        idf = np.log((1 + total) / (1 + found_in)) + 1
+        with self._lock:
+            self._terms = terms
+            self._vocabulary = vocabulary
+            self._idf = idf
+            self._matrix = self._vectorize(documents)
+            self._rows = {
+                tutorial_id: row
+                for row, (tutorial_id, _, _) in enumerate(tutorials)
+            }
+            self._titles = {
+                tutorial_id: title for tutorial_id, title, _ in tutorials
+            }
+            self._neighbours = {}
+            self._rank_rows(np.arange(total))
+            self._built = True
+
+    def _vectorize(self, documents):
+        """Return unit-length TF-IDF rows, one per dict of term counts."""
+        columns = []
+        counts = []
+        indptr = [0]
+        for document in documents:
+            for term, count in document.items():
+                column = self._vocabulary.get(term)
+                if column is not None:
+                    columns.append(column)
+                    counts.append(count)
+            indptr.append(len(columns))
+        columns = np.array(columns, dtype=np.int32)
+        weights = (1 + np.log(np.array(counts, dtype=float))) * self._idf[
+            columns
+        ]
+        lengths = np.diff(indptr)
+        norms = np.sqrt(
+            np.bincount(
+                np.repeat(np.arange(len(documents)), lengths),
+                weights=weights**2,
+                minlength=len(documents),
+            )
+        )
+        norms[lengths == 0] = 1
+        return sparse.csr_matrix(
+            (weights / np.repeat(norms, lengths), columns, indptr),
+            shape=(len(documents), len(self._terms)),
+        )
+
+    def _rank_many(self, rows):
+        """Return the neighbours of several matrix rows at once."""
+        ids = self._row_ids()
+        scores = (self._matrix[rows] @ self._matrix.T).toarray()
+        scores[np.arange(len(rows)), rows] = 0
+        ranked = []
+        for row_scores in scores:
+            if len(row_scores) > self.count:
+                best = np.argpartition(-row_scores, self.count)[: self.count]
+            else:
+                best = np.arange(len(row_scores))
+            ranked.append(
+                sorted(
+                    (
+                        (float(row_scores[column]), int(ids[column]))
+                        for column in best
+                        if row_scores[column] > 0 and ids[column] >= 0
+                    ),
+                    reverse=True,
+                )
+            )
+        return ranked
+
+    def _rank_rows(self, rows):
+        """Store the neighbours of every tutorial in ``rows``."""
+        ids = self._row_ids()
+        for start in range(0, len(rows), CHUNK):
+            chunk = rows[start : start + CHUNK]
+            for row, ranked in zip(chunk, self._rank_many(chunk)):
+                self._neighbours[int(ids[row])] = ranked
+
+    def _row_ids(self):
+        """Return the tutorial id of each matrix row, -1 for empty rows."""
+        ids = np.full(self._matrix.shape[0], -1, dtype=np.int64)
+        for tutorial_id, row in self._rows.items():
+            ids[row] = tutorial_id
+        return ids
+
+    def _offer(self, tutorial_id, candidate_id, score):
+        """Put a new tutorial among another's neighbours if it ranks.
+
+        Returns whether it did.
+        """
+        current = self._neighbours.get(tutorial_id, [])
+        if len(current) == self.count and score <= current[-1][0]:
+            return False
+        current = sorted(
+            current + [(float(score), candidate_id)], reverse=True
+        )
+        self._neighbours[tutorial_id] = current[: self.count]
+        return True
+
+    def _drop(self, tutorial_id):
+        """Empty a tutorial's row and take it out of every list it's in.
+
+        A list shorter than ``count`` already holds every tutorial with
+        any similarity, so only full lists that lose an entry are ranked
+        again from the matrix. Returns the ids of the lists changed.
+        """
+        row = self._rows.pop(tutorial_id, None)
+        self._titles.pop(tutorial_id, None)
+        self._neighbours.pop(tutorial_id, None)
+        if row is None:
+            return set()
+        start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+        self._matrix.data[start:end] = 0
+        self._matrix.eliminate_zeros()
+        affected = set()
+        stale = []
+        for other_id, neighbours in self._neighbours.items():
+            kept = [entry for entry in neighbours if entry[1] != tutorial_id]
+            if len(kept) < len(neighbours):
+                affected.add(other_id)
+                self._neighbours[other_id] = kept
+                if len(neighbours) == self.count:
+                    stale.append(self._rows[other_id])
+        if stale:
+            self._rank_rows(np.array(stale))
+        return affected
@@ -0,0 +1,177 @@
+"""Markdown rendering for tutorial bodies.
+
+Bodies are rendered to sanitized HTML when a tutorial is saved and the
+result is stored next to the source, together with a hash of the source
+and the renderer version. Pages only ever read the stored HTML, and a
+save that doesn't change the body doesn't re-render it.
+"""
+import hashlib
+import re
+import secrets
+
+from markupsafe import escape
+from sqlalchemy.orm import load_only
+
+from tutorial_app import db, page_cache
+
+# Bump whenever the output for the same source changes (new extensions,
+# sanitizer rules), then run `flask rerender-tutorials`
+RENDERER_VERSION = 2
+
+EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+
+# bleach's defaults plus what Markdown produces
+ALLOWED_TAGS = [
+    "a",
+    "abbr",
+    "acronym",
+    "b",
+    "blockquote",
+    "br",
+    "code",
+    "del",
+    "em",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "hr",
+    "i",
+    "img",
+    "li",
+    "ol",
+    "p",
+    "pre",
+    "strong",
+    "sub",
+    "sup",
+    "table",
+    "tbody",
+    "td",
+    "th",
+    "thead",
+    "tr",
+    "ul",
+]
+
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title"],
+    "abbr": ["title"],
+    "acronym": ["title"],
+    "code": ["class"],
+    "img": ["src", "alt", "title"],
+    "td": ["align"],
+    "th": ["align"],
+}
+
+# Progress is tracked per section, and sections start at these headings.
+# Sections are bits of a 64-bit integer, so later headings fold into the
+# last section.
+SECTION_HEADING = re.compile(r"<h[12][\s>]")
+MAX_SECTIONS = 63
+
+# TeX is passed through untouched for MathJax to typeset in the browser.
+# Placeholders carry a fresh nonce each render, so a body can't contain
+# one by chance or on purpose.
+MATH = re.compile(r"\$\$.+?\$\$|\$[^$\n]+?\$", re.DOTALL)
+MATH_PLACEHOLDER = "MATH{nonce}X{index}END"
+
+
+def content_hash(source):
+    """Return the cache key for ``source`` under the current renderer."""
+    key = f"{RENDERER_VERSION}\0{source}".encode("utf-8")
+    return hashlib.sha256(key).hexdigest()
+
+
+def render_markdown(source):
+    """Render Markdown to HTML that is safe to put on the page as is."""
+    # Only writes render, so the app starts without loading these
+    import bleach
+    import markdown
+
+    nonce = secrets.token_hex(8)
+    spans = []
+
+    def stash(match):
+        spans.append(match.group(0))
+        return MATH_PLACEHOLDER.format(nonce=nonce, index=len(spans) - 1)
+
+    def restore(match):
+        index = int(match.group(1))
+        if index >= len(spans):
+            return match.group(0)
+        return str(escape(spans[index]))
+
+    html = markdown.markdown(
+        MATH.sub(stash, source), extensions=EXTENSIONS, output_format="html5"
+    )
+    html = bleach.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=["http", "https", "mailto"],
+        strip=True,
+    )
+    return re.sub(
+        MATH_PLACEHOLDER.format(nonce=nonce, index=r"(\d+)"), restore, html
+    )
+
+
+def count_sections(html):
+    """Return how many sections progress is tracked in for ``html``.
+
+    Anything before the first heading belongs to the first section, and
+    a body without headings is a single section.
+    """
+    return min(max(len(SECTION_HEADING.findall(html)), 1), MAX_SECTIONS)
+
+
+def render_tutorial(tutorial):
+    """Refresh ``tutorial.body_html`` if its body or the renderer changed.
+
+    Returns whether the tutorial was re-rendered.
+    """
+    key = content_hash(tutorial.body)
+    if tutorial.body_hash == key:
+        return False
+    tutorial.body_html = render_markdown(tutorial.body)
+    tutorial.section_count = count_sections(tutorial.body_html)
+    tutorial.body_hash = key
+    return True
+
+
+def rerender_all(chunk=500):
+    """Re-render every tutorial whose stored HTML is out of date.
+
+    Walks the table by primary key one chunk at a time, committing after
+    each chunk, and returns how many tutorials were re-rendered. Their
+    cached pages are dropped and the change feed records them.
+    """
+    from tutorial_app import changes
+    from tutorial_app.models import Tutorial
+
+    rendered = 0
+    last_id = 0
+    while True:
+        tutorials = (
+            Tutorial.query.options(
+                load_only("id", "version", "body", "body_hash")
+            )
+            .filter(Tutorial.id > last_id)
+            .order_by(Tutorial.id)
+            .limit(chunk)
+            .all()
+        )
+        if not tutorials:
+            return rendered
+        changed = [
+            tutorial.id for tutorial in tutorials if render_tutorial(tutorial)
+        ]
+        changes.record("tutorial", *changed)
+        last_id = tutorials[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+        page_cache.invalidate(*(f"tutorial:{i}" for i in changed))
+        rendered += len(changed)
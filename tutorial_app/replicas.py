@@ -0,0 +1,126 @@
+"""Send read-only requests to database replicas.
+
+``SQLALCHEMY_REPLICA_URIS`` lists replicas of the primary database. A
+GET to a view marked with ``read_only`` has its SELECTs run on one of
+them, picked per request; everything else, including every write and
+any read after a write in the same request, goes to the primary.
+
+Replicas lag the primary a little, so after a request commits a write
+its session reads from the primary for ``REPLICA_LAG_SECONDS``, and the
+user sees their own change on the page they're redirected to. The
+deadline is kept in the signed session cookie, so it holds whichever
+worker serves the next request.
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import SelectBase
+
+# Session key holding the time until which reads stay on the primary
+PRIMARY_UNTIL = "_primary_until"
+
+
+def read_only(view):
+    """Mark a view whose GET requests may read from a replica."""
+    view.reads_from_replica = True
+    return view
+
+
+def _is_read(clause):
+    if isinstance(clause, SelectBase):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == "SELECT"
+    return False
+
+
+class RoutingSession(SignallingSession):
+    """A session that runs a replica request's SELECTs on its replica."""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get("db_replica") if has_request_context() else None
+        if replica is not None:
+            if not self._flushing and _is_read(clause):
+                return get_state(self.app).db.get_engine(
+                    self.app, bind=replica
+                )
+            if self._flushing or clause is not None:
+                # Read the rest of the request back from the primary
+                g.db_replica = None
+        if self._flushing or (clause is not None and not _is_read(clause)):
+            self.info["wrote"] = True
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("wrote", None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions that can read from replicas."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter(object):
+    """Pick a replica for each read-only request.
+
+    Each URI in ``SQLALCHEMY_REPLICA_URIS`` becomes a ``replica-<n>``
+    bind, so its engine is made and pooled like the primary's. With no
+    replicas configured every request uses the primary.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        keys = []
+        for number, uri in enumerate(
+            app.config.get("SQLALCHEMY_REPLICA_URIS") or ()
+        ):
+            keys.append(f"replica-{number}")
+            binds[keys[-1]] = uri
+        app.config["SQLALCHEMY_BINDS"] = binds or None
+        app.extensions["replicas"] = keys
+        app.before_request(self._choose)
+        app.after_request(self._stick)
+        app.teardown_request(self._forget)
+
+    def _choose(self):
+        g.db_replica = None
+        keys = current_app.extensions["replicas"]
+        view = current_app.view_functions.get(request.endpoint)
+        if not keys or request.method not in ("GET", "HEAD"):
+            return
+        if not getattr(view, "reads_from_replica", False):
+            return
+        if PRIMARY_UNTIL in session:
+            if session[PRIMARY_UNTIL] > time.time():
+                return
+            session.pop(PRIMARY_UNTIL)
+        g.db_replica = random.choice(keys)
+
+    def _stick(self, response):
+        if g.pop("db_wrote", False) and current_app.extensions["replicas"]:
+            session[PRIMARY_UNTIL] = (
+                time.time() + current_app.config["REPLICA_LAG_SECONDS"]
+            )
+        return response
+
+    def _forget(self, exc):
+        g.pop("db_replica", None)
+        g.pop("db_wrote", None)
@@ -0,0 +1,187 @@
+"""Full-text search index for tutorials and resources.
+
+Tutorials and resources each get a companion search table keyed by the
+row id. On SQLite these are FTS5 virtual tables ranked with BM25; on
+Postgres they hold a weighted ``tsvector`` behind a GIN index and are
+ranked with ``ts_rank_cd``. The routes write to the index inside the same
+transaction as the row itself, so the index never drifts from the data.
+"""
+import re
+
+from sqlalchemy import DDL, event, text
+
+from tutorial_app import db
+
+SQLITE_DDL = {
+    "create": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tutorial_search "
+        "USING fts5(title, body, tokenize='porter unicode61')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS resource_search "
+        "USING fts5(title, description, tokenize='porter unicode61')",
+    ],
+    "drop": [
+        "DROP TABLE IF EXISTS tutorial_search",
+        "DROP TABLE IF EXISTS resource_search",
+    ],
+}
+
+POSTGRES_DDL = {
+    "create": [
+        "CREATE TABLE IF NOT EXISTS tutorial_search ("
+        "id INTEGER PRIMARY KEY, title TEXT, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_tutorial_search_document "
+        "ON tutorial_search USING GIN (document)",
+        "CREATE TABLE IF NOT EXISTS resource_search ("
+        "id INTEGER PRIMARY KEY, title TEXT, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_resource_search_document "
+        "ON resource_search USING GIN (document)",
+    ],
+    "drop": [
+        "DROP TABLE IF EXISTS tutorial_search",
+        "DROP TABLE IF EXISTS resource_search",
+    ],
+}
+
+for dialect, statements in (
+    ("sqlite", SQLITE_DDL),
+    ("postgresql", POSTGRES_DDL),
+):
+    for statement in statements["create"]:
+        event.listen(
+            db.metadata,
+            "after_create",
+            DDL(statement).execute_if(dialect=dialect),
+        )
+    for statement in statements["drop"]:
+        event.listen(
+            db.metadata,
+            "before_drop",
+            DDL(statement).execute_if(dialect=dialect),
+        )
+
+# (table, first field, second field) for each kind of searchable row
+TABLES = {
+    "tutorial": ("tutorial_search", "title", "body"),
+    "resource": ("resource_search", "title", "description"),
+}
+
+SEARCH_SQL = {
+    "sqlite": (
+        "SELECT 'tutorial' AS kind, rowid AS id, "
+        "bm25(tutorial_search, 10.0, 1.0) AS rank "
+        "FROM tutorial_search WHERE tutorial_search MATCH :query "
+        "UNION ALL "
+        "SELECT 'resource' AS kind, rowid AS id, "
+        "bm25(resource_search, 10.0, 1.0) AS rank "
+        "FROM resource_search WHERE resource_search MATCH :query "
+        "ORDER BY rank, id LIMIT :limit OFFSET :offset"
+    ),
+    "postgresql": (
+        "SELECT 'tutorial' AS kind, id, -ts_rank_cd(document, query) AS rank "
+        "FROM tutorial_search, plainto_tsquery('english', :query) query "
+        "WHERE document @@ query "
+        "UNION ALL "
+        "SELECT 'resource' AS kind, id, -ts_rank_cd(document, query) AS rank "
+        "FROM resource_search, plainto_tsquery('english', :query) query "
+        "WHERE document @@ query "
+        "ORDER BY rank, id LIMIT :limit OFFSET :offset"
+    ),
+}
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _fts5_query(query):
+    """Quote each search term so user input can't break FTS5 syntax."""
+    terms = re.findall(r"\w+", query)
+    return " ".join('"{}"'.format(term) for term in terms)
+
+
+def _index_statement(kind):
+    table, first, second = TABLES[kind]
+    if _dialect() == "postgresql":
+        return text(
+            f"INSERT INTO {table} (id, title, document) VALUES (:id, "
+            ":title, setweight(to_tsvector('english', :title), 'A') || "
+            "setweight(to_tsvector('english', :content), 'B')) "
+            "ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, "
+            "document = EXCLUDED.document"
+        )
+    return text(
+        f"INSERT OR REPLACE INTO {table} "
+        f"(rowid, {first}, {second}) VALUES (:id, :title, :content)"
+    )
+
+
+def index(kind, item_id, title, content):
+    """Add or replace the search entry for one tutorial or resource."""
+    index_many(kind, [(item_id, title, content)])
+
+
+def index_many(kind, entries):
+    """Add or replace search entries from ``(id, title, content)`` rows.
+
+    All entries go to the database in a single executemany.
+    """
+    params = [
+        {"id": item_id, "title": title, "content": content or ""}
+        for item_id, title, content in entries
+    ]
+    if params:
+        db.session.execute(_index_statement(kind), params)
+
+
+def index_tutorial(tutorial):
+    """Index a tutorial's title and body."""
+    index("tutorial", tutorial.id, tutorial.title, tutorial.body)
+
+
+def index_resource(resource):
+    """Index a resource's title and description."""
+    index("resource", resource.id, resource.title, resource.description)
+
+
+def remove(kind, item_id):
+    """Drop a tutorial or resource from the search index."""
+    table, _, _ = TABLES[kind]
+    key = "id" if _dialect() == "postgresql" else "rowid"
+    db.session.execute(
+        text(f"DELETE FROM {table} WHERE {key} = :id"), {"id": item_id}
+    )
+
+
+def search(query, page=1, per_page=20):
+    """Return ``(hits, has_more)`` for one page of ranked search results.
+
+    Each hit is a ``(kind, id)`` pair, best match first.
+    """
+    dialect = _dialect()
+    if dialect == "sqlite":
+        query = _fts5_query(query)
+    if not query.strip():
+        return [], False
+    rows = db.session.execute(
+        text(SEARCH_SQL[dialect]),
+        {
+            "query": query,
+            "limit": per_page + 1,
+            "offset": (page - 1) * per_page,
+        },
+    ).fetchall()
+    hits = [(row.kind, row.id) for row in rows[:per_page]]
+    return hits, len(rows) > per_page
+
+
+def rebuild():
+    """Re-index every tutorial and resource from scratch."""
+    from tutorial_app.models import Tutorial, Resource
+
+    for table, _, _ in TABLES.values():
+        db.session.execute(text(f"DELETE FROM {table}"))
+    for tutorial in Tutorial.query.yield_per(500):
+        index_tutorial(tutorial)
+    for resource in Resource.query.yield_per(500):
+        index_resource(resource)
+    db.session.commit()
@@ -1,6 +1,22 @@
 """Utility classes & functions."""
 # Credit to Meredith Murphy, BEW instructor, for this enum utility function
 import enum
+import hashlib
+
+from flask import (
+    Response,
+    abort,
+    before_render_template,
+    current_app,
+    make_response,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+)
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
 
 
 class FormEnum(enum.Enum):
@@ -12,3 +28,99 @@ class FormEnum(enum.Enum):
 
     def __str__(self):
         return str(self.value)
+
+
+def enum_arg(enum, name):
+    """Return the member of ``enum`` named by query argument ``name``.
+
+    Returns None when the argument is missing or empty, and answers 400
+    when it names no member.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return enum[value]
+    except KeyError:
+        abort(400)
+
+
+def keyset_page(query, column, after=None, limit=20):
+    """Return one page of ``query`` ordered by ``column`` after a cursor.
+
+    Paging by key rather than OFFSET keeps every page an index range scan,
+    so the cost of a page doesn't depend on how deep into the table it is.
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last
+    page.
+    """
+    if after is not None:
+        query = query.filter(column > after)
+    items = query.order_by(column).limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        return items, getattr(items[-1], column.key)
+    return items, None
+
+
+def page_etag(*parts):
+    """Return a strong ETag for a page built from ``parts``.
+
+    Pages differ for signed in visitors (the navbar, saved tutorials), so
+    the visitor is part of the tag.
+    """
+    parts += (current_user.get_id(),)
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def conditional_page(etag, render):
+    """Answer 304 if the client's copy is current, else call ``render``.
+
+    Only the ETag decides: no single row's timestamp moves with every
+    change to a page (deletions, facet counts, related tutorials), so
+    no Last-Modified is sent. Pages carrying a flashed message are
+    always rendered and never get validators, so a stale message can't
+    be revalidated later.
+    """
+    if "_flashes" in session:
+        return make_response(render())
+    if is_resource_modified(request.environ, etag=etag):
+        response = make_response(render())
+    else:
+        response = make_response("", 304)
+    response.set_etag(etag)
+    response.vary.add("Cookie")
+    return response
+
+
+# Rendered text collected before a chunk of a streamed page is sent
+STREAM_BUFFER_SIZE = 8192
+
+
+def stream_template(template_name, **context):
+    """Render a template into the response as it's sent, chunk by chunk.
+
+    The page is never held whole in memory, and the browser gets its
+    head while the rows are still rendering. Pages carrying a flashed
+    message are rendered whole: the session that pops the message is
+    saved before a streamed body is sent. ``STREAM_TEMPLATES`` turns
+    streaming off.
+    """
+    if not current_app.config["STREAM_TEMPLATES"] or "_flashes" in session:
+        return render_template(template_name, **context)
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_or_select_template(template_name)
+    app.update_template_context(context)
+
+    def generate():
+        before_render_template.send(app, template=template, context=context)
+        buffered, size = [], 0
+        for text in template.generate(context):
+            buffered.append(text)
+            size += len(text)
+            if size >= STREAM_BUFFER_SIZE:
+                yield "".join(buffered)
+                buffered, size = [], 0
+        yield "".join(buffered)
+        template_rendered.send(app, template=template, context=context)
+
+    return Response(stream_with_context(generate()), mimetype="text/html")